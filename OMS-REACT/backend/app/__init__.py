@@ -1,14 +1,23 @@
-from flask import Flask, send_from_directory
+from flask import Flask, jsonify
 from flask_cors import CORS
 from pymongo import MongoClient
+from datetime import datetime, timezone
 import os
 from dotenv import load_dotenv
+from .log import configure_logging, get_logger
 
 load_dotenv()
 
+logger = get_logger(__name__)
+
 def create_app():
+    configure_logging()
     app = Flask(__name__)
     
+    # orjson-backed jsonify that encodes ObjectId/datetime/Decimal itself
+    from .serialization import FastJSONProvider
+    app.json = FastJSONProvider(app)
+    
     # Configure file upload settings
     app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
     app.config['UPLOAD_FOLDER'] = os.path.join(app.root_path, 'static', 'uploads')
@@ -18,7 +27,8 @@ def create_app():
     CORS(app, 
          origins=["http://localhost:5173", "http://localhost:3000"],
          methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-         allow_headers=["Content-Type", "Authorization", "Accept"],
+         allow_headers=["Content-Type", "Authorization", "Accept", "Idempotency-Key"],
+         expose_headers=["Idempotent-Replayed", "Retry-After"],
          supports_credentials=True)
     
     # MongoDB Atlas Connection
@@ -26,31 +36,49 @@ def create_app():
     
     if not MONGODB_URI:
         raise Exception("❌ MONGODB_URI not found in .env file")
+    app.config['MONGODB_URI'] = MONGODB_URI
+    
+    # Per-request wall time / Mongo calls, Server-Timing headers and histograms
+    from .instrumentation import RequestInstrumentation
+    RequestInstrumentation(app)
+    
+    # Prometheus metrics at /metrics (merged across workers, see app/metrics.py)
+    from .metrics import init_metrics
+    init_metrics(app)
+    
+    # Slow Mongo commands with filter shape and route (optional explain, see app/slowlog.py)
+    from .slowlog import SlowQueryLog
+    SlowQueryLog(app)
     
     try:
-        client = MongoClient(MONGODB_URI)
-        app.db = client.get_database()
+        client = connect_db(app)
         client.admin.command('ping')
-        print("✅ Connected to MongoDB Atlas!")
-        print(f"📊 Database: {app.db.name}")
+        logger.info("Connected to MongoDB Atlas!")
+        logger.info("Database: %s", app.db.name)
     except Exception as e:
-        print(f"❌ MongoDB connection failed: {e}")
+        logger.error("MongoDB connection failed: %s", e)
         raise e
     
     # Create upload directory if it doesn't exist
     upload_folder = app.config['UPLOAD_FOLDER']
     os.makedirs(upload_folder, exist_ok=True)
-    print(f"📁 Upload directory ready: {upload_folder}")
+    logger.info("Upload directory ready: %s", upload_folder)
+    
+    # Content-addressed blob storage for uploads, served at /blobs/ (STORAGE_BACKEND)
+    from .storage import init_storage
+    init_storage(app)
+    
+    # Serve static files (ETag/304/Range, optional proxy handoff - see app/serving.py)
+    from .serving import init_serving, send_static
+    init_serving(app)
     
-    # Serve static files
     @app.route('/static/uploads/<path:filename>')
     def serve_uploaded_files(filename):
-        upload_folder = app.config['UPLOAD_FOLDER']
-        return send_from_directory(upload_folder, filename)
+        return send_static(app.config['UPLOAD_FOLDER'], filename, 'uploads')
     
     # Import and register routes
     try:
-        from .routes import auth, users, products, customers, orders, admin
+        from .routes import auth, users, products, customers, orders, admin, exports
         
         app.register_blueprint(auth.bp)
         app.register_blueprint(users.bp)
@@ -58,19 +86,20 @@ def create_app():
         app.register_blueprint(customers.bp)
         app.register_blueprint(orders.bp)
         app.register_blueprint(admin.bp)
-        print("✅ All routes registered successfully!")
+        app.register_blueprint(exports.bp)
+        logger.info("All routes registered successfully!")
     except ImportError as e:
-        print(f"❌ Route import error: {e}")
+        logger.error("Route import error: %s", e)
         raise e
     
     # Import cart routes separately
     try:
         from .routes.cart import bp as cart_bp
         app.register_blueprint(cart_bp)
-        print("✅ Cart routes registered!")
+        logger.info("Cart routes registered!")
     except ImportError as e:
-        print(f"❌ Cart routes import error: {e}")
-        from flask import Blueprint, jsonify
+        logger.error("Cart routes import error: %s", e)
+        from flask import Blueprint
         cart_bp = Blueprint('cart', __name__, url_prefix='/api/cart')
         
         @cart_bp.route('/<user_id>', methods=['GET'])
@@ -82,7 +111,40 @@ def create_app():
             return jsonify({'success': True, 'message': 'Cart functionality not implemented'})
             
         app.register_blueprint(cart_bp)
-        print("⚠️ Using fallback cart routes")
+        logger.warning("Using fallback cart routes")
+    
+    # Per-worker product catalog cache (change stream invalidation, TTL fallback)
+    from .catalog import CatalogCache
+    app.catalog = CatalogCache(
+        app,
+        products.serialize_doc,
+        ttl=int(os.getenv('CATALOG_CACHE_TTL', 30)),
+        use_change_stream=os.getenv('CATALOG_CHANGE_STREAM', 'true').lower() == 'true'
+    )
+    
+    # In-process product search index, kept current by catalog invalidations
+    from .search import SearchIndex
+    app.search = SearchIndex(app.catalog)
+    
+    # Resized/WebP product image variants, built on a background pool
+    from .images import ImageVariants
+    ImageVariants(app)
+    
+    # Mongo-backed job queue for work that shouldn't hold up a request (payment proofs)
+    from .jobs import init_jobs
+    init_jobs(app)
+    
+    # Declared indexes (app/indexes.py), handled per MONGO_INDEX_MODE
+    from .indexes import bootstrap_indexes
+    bootstrap_indexes(app.db)
+    
+    # Count existing orders into the dashboard rollups before any incremental update
+    from .stats import ensure_rollups
+    try:
+        ensure_rollups(app.db)
+    except Exception as e:
+        # The lease expires and the next start (or `flask rebuild-stats`) builds them
+        logger.error("Could not build dashboard rollups: %s", e)
     
     # ✅ FIXED: Add global OPTIONS handler for all routes
     @app.before_request
@@ -93,21 +155,26 @@ def create_app():
             headers = {
                 'Access-Control-Allow-Origin': 'http://localhost:5173',
                 'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, Authorization, Accept',
+                'Access-Control-Allow-Headers': 'Content-Type, Authorization, Accept, Idempotency-Key',
                 'Access-Control-Allow-Credentials': 'true'
             }
             for key, value in headers.items():
                 response.headers[key] = value
             return response
     
+    # Maintenance CLI commands (flask --app run <command>)
+    from .cli import register_commands
+    register_commands(app)
+    
     # Add health check endpoint
     @app.route('/api/health', methods=['GET'])
     def health_check():
+        health = app.health.snapshot()
         return jsonify({
-            'status': 'healthy', 
+            **health,
             'message': 'Server is running',
-            'timestamp': '2024-01-01T00:00:00Z'
-        })
+            'timestamp': datetime.now(timezone.utc).isoformat()
+        }), 503 if health['status'] == 'unhealthy' else 200
     
     @app.route('/')
     def home():
@@ -127,20 +194,39 @@ def create_app():
     
     return app
 
+def connect_db(app):
+    """Open this process's MongoClient and attach it to the app.
+
+    MongoClient isn't fork-safe, so a preloading server calls this again
+    in every worker after the fork (see serve.py).
+    """
+    # Connection health is tracked from the driver's heartbeats, not per-request pings
+    from .health import ConnectionHealth
+    app.health = ConnectionHealth()
+    
+    client = MongoClient(
+        app.config['MONGODB_URI'],
+        event_listeners=[app.health, *app.extensions.get('mongo_listeners', [])],
+        maxPoolSize=int(os.getenv('MONGO_MAX_POOL_SIZE', 100)),
+        minPoolSize=int(os.getenv('MONGO_MIN_POOL_SIZE', 0))
+    )
+    app.mongo_client = client
+    app.db = client.get_database()
+    return client
+
 def get_db():
-    """Helper function to get database instance"""
+    """Helper function to get database instance (None while MongoDB is unreachable)"""
     try:
         from flask import current_app
         db = current_app.db
         if db is None:
             return None
-        try:
-            db.command('ping')
-        except:
+        # Cached state from background heartbeats - no round trip here
+        if not current_app.health.is_available():
             return None
         return db
     except RuntimeError:
         return None
     except Exception as e:
-        print(f"❌ Database connection error in get_db: {e}")
-        return None
\ No newline at end of file
+        logger.error("Database connection error in get_db: %s", e)
+        return None
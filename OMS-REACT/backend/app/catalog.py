@@ -0,0 +1,199 @@
+import os
+import threading
+import time
+from bson import ObjectId
+from pymongo.errors import ConfigurationError, OperationFailure
+from .log import get_logger
+
+logger = get_logger(__name__)
+
+# Change streams need a replica set: standalone servers reply with 40573
+# (change stream only on replica sets) or 115 (CommandNotSupported)
+CHANGE_STREAM_UNSUPPORTED = {40573, 115}
+
+class CatalogCache:
+    """Per-worker cache of serialized product documents keyed by _id.
+
+    Entries are invalidated by a change stream on `products` when the
+    deployment supports one, otherwise they expire after `ttl` seconds.
+    Writes made by this worker should call `invalidate` for read-your-writes.
+    """
+
+    def __init__(self, app, serializer, ttl=30, use_change_stream=True):
+        self._app = app
+        self._serialize = serializer
+        self.ttl = ttl
+        self.use_change_stream = use_change_stream
+        self.mode = 'ttl'  # Switches to 'change_stream' once the watcher is live
+
+        self._lock = threading.RLock()
+        self._docs = {}              # _id -> (serialized doc, loaded_at)
+        self._listing_loaded_at = None
+        self._dirty = set()          # _ids to refetch before the next listing
+        self._listeners = []
+        self._watcher_pid = None
+        self._epoch = 0              # Bumped on every invalidation
+
+    @property
+    def collection(self):
+        return self._app.db.products
+
+    # ---------------- Invalidation ----------------
+    def subscribe(self, callback):
+        """Call `callback(product_id)` on every invalidation (None = everything)"""
+        self._listeners.append(callback)
+
+    def invalidate(self, product_id=None):
+        """Drop one product (or the whole cache when product_id is None)"""
+        with self._lock:
+            self._epoch += 1
+            if product_id is None:
+                self._docs.clear()
+                self._dirty.clear()
+                self._listing_loaded_at = None
+            else:
+                product_id = str(product_id)
+                self._docs.pop(product_id, None)
+                if self._listing_loaded_at is not None:
+                    self._dirty.add(product_id)
+
+        for callback in self._listeners:
+            try:
+                callback(product_id)
+            except Exception as e:
+                logger.warning("Catalog listener error: %s", e)
+
+    def invalidate_many(self, product_ids):
+        for product_id in product_ids:
+            self.invalidate(product_id)
+
+    # ---------------- Reads ----------------
+    def get(self, product_id):
+        """Serialized product by _id, or None if it doesn't exist"""
+        return self.get_many([product_id]).get(str(product_id))
+
+    def get_many(self, product_ids):
+        """{_id: serialized product} for all ids that exist, one query for misses"""
+        self._ensure_watcher()
+        found = {}
+        missing = []
+
+        with self._lock:
+            epoch = self._epoch
+            for product_id in {str(pid) for pid in product_ids}:
+                entry = self._docs.get(product_id)
+                if entry and self._is_fresh(entry[1]):
+                    found[product_id] = dict(entry[0])
+                elif ObjectId.is_valid(product_id):
+                    missing.append(ObjectId(product_id))
+
+        if missing:
+            for doc in self.collection.find({'_id': {'$in': missing}}):
+                product = self._store(doc, epoch)
+                found[product['_id']] = dict(product)
+
+        return found
+
+    def all_active(self):
+        """All active products, refreshing only what changed since the last load"""
+        self._ensure_watcher()
+
+        with self._lock:
+            listing_fresh = (
+                self._listing_loaded_at is not None
+                and self._is_fresh(self._listing_loaded_at)
+            )
+            dirty = list(self._dirty)
+            epoch = self._epoch
+
+        if not listing_fresh:
+            docs = [self._serialize(doc) for doc in self.collection.find({'is_active': True})]
+            with self._lock:
+                if self._epoch != epoch:
+                    # Invalidated mid-load - serve this result but don't keep it
+                    return [dict(doc) for doc in docs]
+                now = time.monotonic()
+                self._docs = {doc['_id']: (doc, now) for doc in docs}
+                self._dirty.clear()
+                self._listing_loaded_at = now
+        elif dirty:
+            object_ids = [ObjectId(pid) for pid in dirty if ObjectId.is_valid(pid)]
+            for doc in self.collection.find({'_id': {'$in': object_ids}}):
+                self._store(doc, epoch)
+            with self._lock:
+                if self._epoch == epoch:
+                    self._dirty.difference_update(dirty)
+
+        with self._lock:
+            products = [
+                dict(doc) for product_id, (doc, _) in sorted(self._docs.items())
+                if doc.get('is_active', True)
+            ]
+        return products
+
+    def _store(self, doc, epoch):
+        """Serialize and cache a document unless the cache changed since `epoch`"""
+        product = self._serialize(doc)
+        with self._lock:
+            if self._epoch == epoch:
+                self._docs[product['_id']] = (product, time.monotonic())
+                self._dirty.discard(product['_id'])
+        return product
+
+    def _is_fresh(self, loaded_at):
+        if self.mode == 'change_stream':
+            return True
+        return time.monotonic() - loaded_at < self.ttl
+
+    # ---------------- Change stream ----------------
+    def _ensure_watcher(self):
+        """Start the watcher once per process (threads don't survive a fork)"""
+        if not self.use_change_stream or self._watcher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._watcher_pid == os.getpid():
+                return
+            self._watcher_pid = os.getpid()
+            self.mode = 'ttl'
+        threading.Thread(target=self._watch, name='catalog-watcher', daemon=True).start()
+
+    def _watch(self):
+        resume_token = None
+        backoff = 1
+        while True:
+            try:
+                with self.collection.watch(resume_after=resume_token) as stream:
+                    if resume_token is None:
+                        # Anything loaded before the stream opened may be stale
+                        self.invalidate()
+                    self.mode = 'change_stream'
+                    backoff = 1
+                    logger.info("Catalog cache following product change stream")
+
+                    for change in stream:
+                        resume_token = stream.resume_token
+                        if change['operationType'] in ('insert', 'update', 'replace', 'delete'):
+                            self.invalidate(change['documentKey']['_id'])
+                        else:
+                            # drop / rename / invalidate - start over
+                            resume_token = None
+                            self.invalidate()
+                            break
+            except ConfigurationError as e:
+                # The driver refuses change streams for this deployment/server version
+                self.mode = 'ttl'
+                logger.info("Change streams unavailable (%s), catalog cache using %ss TTL", e, self.ttl)
+                return
+            except OperationFailure as e:
+                self.mode = 'ttl'
+                if e.code in CHANGE_STREAM_UNSUPPORTED:
+                    logger.info("Change streams unavailable, catalog cache using %ss TTL", self.ttl)
+                    return
+                logger.warning("Catalog change stream error: %s", e)
+                resume_token = None
+            except Exception as e:
+                self.mode = 'ttl'
+                logger.warning("Catalog change stream error: %s", e)
+
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 60)
@@ -0,0 +1,125 @@
+import click
+from flask import current_app
+
+def register_commands(app):
+    """Attach maintenance commands to `flask --app run <command>`"""
+
+    @app.cli.command('rebuild-stats')
+    def rebuild_stats():
+        """Recompute dashboard rollups from the orders collection."""
+        from .stats import RebuildInProgress, rebuild_rollups
+        try:
+            count = rebuild_rollups(current_app.db)
+        except RebuildInProgress as e:
+            click.echo(str(e))
+            raise SystemExit(1)
+        click.echo(f"Rebuilt {count} rollup documents")
+
+    @app.cli.command('ensure-indexes')
+    def ensure_indexes_command():
+        """Create any declared index that is missing."""
+        from .indexes import ensure_indexes
+        report = ensure_indexes(current_app.db)
+        for label in report['created']:
+            click.echo(f"created   {label}")
+        for label, error in report['failed'].items():
+            click.echo(f"failed    {label}: {error}")
+        click.echo(f"{len(report['existing'])} already present")
+        if report['failed']:
+            raise SystemExit(1)
+
+    @app.cli.command('check-indexes')
+    @click.option('--strict', is_flag=True, help='Exit non-zero if anything is missing or unused.')
+    def check_indexes_command(strict):
+        """Report missing, mismatched, undeclared and unused indexes."""
+        from .indexes import verify_indexes
+        report = verify_indexes(current_app.db)
+        for key in ('missing', 'mismatched', 'undeclared', 'unused'):
+            for label in report[key]:
+                click.echo(f"{key:<11}{label}")
+        for collection in report['usage_unavailable']:
+            click.echo(f"no $indexStats for {collection}")
+        problems = report['missing'] + report['mismatched']
+        if strict:
+            problems += report['unused']
+        if problems:
+            raise SystemExit(1)
+        click.echo("Indexes OK")
+
+    @app.cli.command('import-products')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--images', type=click.Path(exists=True, dir_okay=False), help='Zip of images named in the image column.')
+    @click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), help='Defaults to the file extension.')
+    @click.option('--chunk-size', type=int, default=None, help='Products per insert_many.')
+    @click.option('--dry-run', is_flag=True, help='Validate only; write nothing.')
+    def import_products_command(path, images, fmt, chunk_size, dry_run):
+        """Bulk-create products from a CSV or NDJSON file."""
+        from .importer import IMPORT_CHUNK_SIZE, ImageArchive, detect_format, import_products, iter_rows
+        archive = ImageArchive(images, current_app.storage) if images else None
+        try:
+            with open(path, 'rb') as stream:
+                report = import_products(
+                    current_app.db,
+                    iter_rows(stream, detect_format(path, fmt)),
+                    images=archive,
+                    variants=current_app.images,
+                    chunk_size=chunk_size or IMPORT_CHUNK_SIZE,
+                    dry_run=dry_run
+                )
+        finally:
+            if archive is not None:
+                archive.close()
+        current_app.images.drain()
+        for entry in report.errors:
+            click.echo(f"row {entry['row']}: {'; '.join(entry['errors'])}")
+        if report.failed > len(report.errors):
+            click.echo(f"... {report.failed - len(report.errors)} more rows with errors")
+        click.echo(f"{report.rows} rows, {report.inserted} inserted, {report.failed} failed"
+                   + (f" ({report.first_product_id} .. {report.last_product_id})" if report.inserted else ''))
+        if report.failed:
+            raise SystemExit(1)
+
+    @app.cli.command('build-image-variants')
+    @click.option('--all', 'rebuild_all', is_flag=True, help='Rebuild products that already have variants.')
+    def build_image_variants_command(rebuild_all):
+        """Generate resized/WebP images for existing products."""
+        from .images import UPLOAD_URL_PREFIX
+        from .storage import BLOB_URL_PREFIX
+        images = current_app.images
+        if not images.enabled:
+            click.echo("Pillow is not installed")
+            raise SystemExit(1)
+        query = {'image': {'$regex': f'^({BLOB_URL_PREFIX}|{UPLOAD_URL_PREFIX})'}}
+        if not rebuild_all:
+            query['image_variants'] = None
+        futures = [
+            images.submit(product['_id'], product['image'])
+            for product in current_app.db.products.find(query, {'image': 1})
+        ]
+        images.drain()
+        built = sum(1 for future in futures if future and future.result())
+        click.echo(f"Built variants for {built} of {len(futures)} products")
+
+    @app.cli.command('gc-blobs')
+    @click.option('--grace-hours', type=int, default=None, help='Keep blobs released more recently than this.')
+    def gc_blobs_command(grace_hours):
+        """Delete released blobs (e.g. replaced payment proofs) that nothing references."""
+        from .storage import BLOB_GC_GRACE_HOURS, sweep_orphaned_blobs
+        report = sweep_orphaned_blobs(current_app.db, current_app.storage,
+                                      BLOB_GC_GRACE_HOURS if grace_hours is None else grace_hours)
+        click.echo(f"Deleted {report['deleted']} orphaned blob(s), kept {report['kept']} still in use")
+
+    @app.cli.command('run-jobs')
+    @click.option('--once', is_flag=True, help='Run what is due now, then exit.')
+    def run_jobs_command(once):
+        """Work the job queue in this process (use with JOB_WORKERS=0 on the web servers)."""
+        jobs = current_app.jobs
+        jobs.workers = 0          # This thread does the work; don't start the pool as well
+        if once:
+            click.echo(f"Ran {jobs.run_pending()} job(s)")
+            return
+        click.echo(f"Working jobs: {', '.join(sorted(jobs.handlers))} (Ctrl+C to stop)")
+        try:
+            jobs.work()
+        except KeyboardInterrupt:
+            jobs.stop()
@@ -0,0 +1,74 @@
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+import pymongo
+from .log import get_logger
+
+logger = get_logger(__name__)
+
+# Threads shared by every request that fans out queries; each one borrows a
+# socket from the same MongoClient pool, so keep this well under maxPoolSize
+FANOUT_WORKERS = int(os.getenv('QUERY_FANOUT_WORKERS', 8))
+
+# Seconds a single section may take before it's reported as timed out
+DEFAULT_SECTION_TIMEOUT = float(os.getenv('QUERY_SECTION_TIMEOUT', 5))
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+def _get_executor():
+    """One pool per process (threads don't survive a fork)"""
+    global _executor, _executor_pid
+    if _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor_pid != os.getpid():
+                _executor = ThreadPoolExecutor(
+                    max_workers=FANOUT_WORKERS,
+                    thread_name_prefix='query-fanout'
+                )
+                _executor_pid = os.getpid()
+    return _executor
+
+def _run_section(func, timeout):
+    # pymongo.timeout bounds every operation in the section server-side too,
+    # so an abandoned section doesn't keep its thread and socket busy
+    with pymongo.timeout(timeout):
+        return func()
+
+def run_parallel(sections, timeout=DEFAULT_SECTION_TIMEOUT):
+    """Run independent query sections concurrently and gather what finished.
+
+    `sections` maps a name to a callable, or to (callable, timeout) to
+    override the default. Each callable runs in a copy of the caller's
+    context, so `current_app` works inside it. Returns (results, errors):
+    results holds the value of every section that succeeded in time, errors
+    maps the rest to a short message.
+    """
+    executor = _get_executor()
+    started = time.monotonic()
+
+    pending = []
+    for name, section in sections.items():
+        func, section_timeout = section if isinstance(section, tuple) else (section, timeout)
+        context = contextvars.copy_context()
+        future = executor.submit(context.run, _run_section, func, section_timeout)
+        pending.append((started + section_timeout, name, future))
+
+    results = {}
+    errors = {}
+    for deadline, name, future in sorted(pending, key=lambda entry: entry[0]):
+        try:
+            results[name] = future.result(timeout=max(0, deadline - time.monotonic()))
+        except FutureTimeout:
+            future.cancel()
+            errors[name] = f'timed out after {deadline - started:g}s'
+            logger.warning("Section '%s' timed out", name)
+        except Exception as e:
+            errors[name] = str(e)
+            logger.warning("Section '%s' failed: %s", name, e)
+
+    return results, errors
@@ -0,0 +1,96 @@
+import os
+import threading
+from pymongo import ReturnDocument
+
+# IDs each worker reserves per round trip; >1 trades gaps on restart for fewer writes
+DEFAULT_BLOCK_SIZE = int(os.getenv('ID_BLOCK_SIZE', 1))
+
+class SequenceAllocator:
+    """Sequential numbers backed by an atomic $inc on the `counters` collection.
+
+    With block_size > 1 each worker reserves a block of numbers at once and
+    hands them out locally, so registration spikes and bulk imports skip the
+    round trip. Unused numbers in a block are lost when the worker exits.
+    """
+
+    def __init__(self, name, seed=None, block_size=DEFAULT_BLOCK_SIZE):
+        self.name = name
+        self.block_size = max(1, block_size)
+        self._seed = seed            # callable(db) -> highest number already in use
+        self._lock = threading.Lock()
+        self._pid = None
+        self._seeded = False
+        self._next = 0
+        self._end = 0                # Exclusive end of the local block
+
+    def _ensure_process(self):
+        # A forked worker must not reuse the parent's block
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._next = self._end = 0
+
+    def _ensure_seeded(self, db):
+        """Start the counter above any IDs issued before counters existed"""
+        if self._seeded:
+            return
+        if self._seed and db.counters.find_one({'_id': self.name}) is None:
+            db.counters.update_one(
+                {'_id': self.name},
+                {'$max': {'seq': int(self._seed(db) or 0)}},
+                upsert=True
+            )
+        self._seeded = True
+
+    def _allocate(self, db, count):
+        """Atomically claim `count` numbers; returns the first one"""
+        self._ensure_seeded(db)
+        counter = db.counters.find_one_and_update(
+            {'_id': self.name},
+            {'$inc': {'seq': count}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return counter['seq'] - count + 1
+
+    def next(self, db):
+        """Next number in the sequence"""
+        with self._lock:
+            self._ensure_process()
+            if self._next >= self._end:
+                self._next = self._allocate(db, self.block_size)
+                self._end = self._next + self.block_size
+            value = self._next
+            self._next += 1
+            return value
+
+    def reserve(self, db, count):
+        """Reserve `count` consecutive numbers in one round trip (bulk imports)"""
+        if count <= 0:
+            return range(0)
+        with self._lock:
+            self._ensure_process()
+            start = self._allocate(db, count)
+        return range(start, start + count)
+
+def highest_suffix(collection, field, prefix):
+    """Largest number among `prefix`-NNNNNN values, compared numerically.
+
+    Sorting the strings would rank PREFIX-999999 above PREFIX-1000000, and
+    IDs of another width (the old admin-created USR0001) would sort apart,
+    so every matching ID is read (only the field, through its index) and
+    the highest number wins. Runs once, when the counter is first seeded.
+    """
+    highest = 0
+    for doc in collection.find({field: {'$regex': f'^{prefix}-?\\d+$'}}, {field: 1, '_id': 0}):
+        highest = max(highest, int(doc[field][len(prefix):].lstrip('-')))
+    return highest
+
+PRODUCT_IDS = SequenceAllocator(
+    'product_id',
+    seed=lambda db: highest_suffix(db.products, 'product_id', 'PROD')
+)
+
+USER_IDS = SequenceAllocator(
+    'user_id',
+    seed=lambda db: highest_suffix(db.users, 'user_id', 'USR')
+)
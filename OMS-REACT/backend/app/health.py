@@ -0,0 +1,111 @@
+import threading
+import time
+from datetime import datetime, timezone
+from pymongo import monitoring
+
+class ConnectionHealth(monitoring.ServerHeartbeatListener, monitoring.TopologyListener):
+    """Cached MongoDB health, fed by the driver's own background monitoring.
+
+    Register it with `MongoClient(event_listeners=[health])`. The driver's
+    monitor threads report every heartbeat and topology change here, so
+    request handlers can check liveness without a round trip of their own.
+
+    Status comes from the last heartbeat of each server. Until a heartbeat
+    has finished there is nothing to judge by, so a new client (e.g. one
+    just reconnected after a fork) reports 'unknown' and stays available.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._servers = {}          # "host:port" -> last heartbeat details
+        self._closed = False
+        self._changed_at = None
+
+    # ---------------- Heartbeats ----------------
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        with self._lock:
+            self._servers[self._address(event)] = {
+                'ok': True,
+                'writable': event.reply.is_writable,
+                'readable': event.reply.is_readable,
+                'rttMs': round(event.duration * 1000, 2),
+                'at': time.time()
+            }
+
+    def failed(self, event):
+        with self._lock:
+            self._servers[self._address(event)] = {
+                'ok': False,
+                'writable': False,
+                'readable': False,
+                'error': str(event.reply),
+                'at': time.time()
+            }
+
+    # ---------------- Topology ----------------
+    def opened(self, event):
+        pass
+
+    def description_changed(self, event):
+        # Only used to forget servers that left the topology; their last heartbeat no longer counts
+        members = {self._format(address) for address in event.new_description.server_descriptions()}
+        with self._lock:
+            for address in list(self._servers):
+                if address not in members:
+                    del self._servers[address]
+            self._changed_at = time.time()
+
+    def closed(self, event):
+        with self._lock:
+            self._closed = True
+            self._changed_at = time.time()
+
+    @staticmethod
+    def _format(address):
+        host, port = address
+        return f"{host}:{port}"
+
+    @classmethod
+    def _address(cls, event):
+        return cls._format(event.connection_id)
+
+    # ---------------- State ----------------
+    @property
+    def status(self):
+        """healthy / degraded (read-only) / unhealthy / unknown (no heartbeat finished yet)"""
+        with self._lock:
+            if self._closed:
+                return 'unhealthy'
+            servers = list(self._servers.values())
+        if not servers:
+            return 'unknown'
+        if any(server['writable'] for server in servers):
+            return 'healthy'
+        if any(server['readable'] for server in servers):
+            return 'degraded'
+        return 'unhealthy'
+
+    def is_available(self):
+        """False only once a finished heartbeat has found no reachable server"""
+        return self.status != 'unhealthy'
+
+    def snapshot(self):
+        """JSON-ready view of the cached state for /api/health"""
+        with self._lock:
+            servers = {address: dict(details) for address, details in self._servers.items()}
+            changed_at = self._changed_at
+        now = time.time()
+        for details in servers.values():
+            details['secondsAgo'] = round(now - details.pop('at'), 1)
+
+        return {
+            'status': self.status,
+            'database': servers,
+            'changedAt': (
+                datetime.fromtimestamp(changed_at, timezone.utc).isoformat()
+                if changed_at else None
+            )
+        }
@@ -0,0 +1,143 @@
+import functools
+import hashlib
+import os
+from datetime import datetime, timedelta
+from bson import ObjectId
+from flask import current_app, jsonify, make_response, request
+from pymongo.errors import DuplicateKeyError, PyMongoError
+from .log import get_logger
+from .metrics import METRICS
+
+logger = get_logger(__name__)
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+
+# How long a key (and the response stored for it) is remembered; the TTL index drops it after this
+IDEMPOTENCY_TTL_HOURS = int(os.getenv('IDEMPOTENCY_TTL_HOURS', 24))
+
+# A key still 'processing' after this long belongs to a request that died, and may be taken over
+IDEMPOTENCY_LOCK_SECONDS = int(os.getenv('IDEMPOTENCY_LOCK_SECONDS', 60))
+
+MAX_KEY_LENGTH = 255
+
+# Methods the header applies to; GET and friends are already safe to repeat
+UNSAFE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+IDEMPOTENT_REQUESTS = METRICS.counter(
+    'idempotent_requests_total', 'Requests that carried an Idempotency-Key, by outcome', ('endpoint', 'outcome'))
+
+def request_fingerprint():
+    """SHA-256 of what the request asks for, so a reused key with a different body is caught"""
+    digest = hashlib.sha256(f"{request.method} {request.path}\n".encode())
+    if request.mimetype in ('multipart/form-data', 'application/x-www-form-urlencoded'):
+        for name, value in sorted(request.form.items(multi=True)):
+            digest.update(f"{name}={value}\n".encode())
+        for name, upload in sorted(request.files.items(multi=True), key=lambda item: item[0]):
+            digest.update(f"{name}:{upload.filename}\n".encode())
+            for chunk in iter(lambda: upload.stream.read(64 * 1024), b''):
+                digest.update(chunk)
+            upload.stream.seek(0)
+    else:
+        # Cached, so the view can still call get_json()
+        digest.update(request.get_data(cache=True))
+    return digest.hexdigest()
+
+def _error(message, status):
+    return jsonify({'success': False, 'error': message}), status
+
+def _replay(record):
+    response = current_app.response_class(
+        record['body'], status=record['responseStatus'], content_type=record['contentType'])
+    response.headers[REPLAYED_HEADER] = 'true'
+    return response
+
+def idempotent(view):
+    """Make a POST safe to retry with an `Idempotency-Key` header.
+
+    The first request with a key runs normally and its response is stored
+    in `idempotency_keys`. A retry with the same key and body gets that
+    response again without the view running, marked `Idempotent-Replayed`.
+    If the first request is still running, the retry gets 409. If the same
+    key comes with a different body, it gets 422. 5xx responses aren't
+    stored, so a retry after a server error runs again. Requests without
+    the header are unaffected.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if key is None or request.method not in UNSAFE_METHODS:
+            return view(*args, **kwargs)
+        key = key.strip()
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return _error(f'{IDEMPOTENCY_HEADER} must be 1-{MAX_KEY_LENGTH} characters', 400)
+
+        endpoint = request.endpoint
+        collection = current_app.db.idempotency_keys
+        record_id = f"{request.method} {request.path} {key}"
+        fingerprint = request_fingerprint()
+        lock = ObjectId()
+        now = datetime.utcnow()
+
+        try:
+            collection.insert_one({
+                '_id': record_id,
+                'fingerprint': fingerprint,
+                'status': 'processing',
+                'lock': lock,
+                'lockedAt': now,
+                'createdAt': now,
+                'expiresAt': now + timedelta(hours=IDEMPOTENCY_TTL_HOURS)
+            })
+        except DuplicateKeyError:
+            record = collection.find_one({'_id': record_id})
+            if record is None:
+                # Expired between the insert and the read; the client can simply retry
+                return _error('Idempotency key expired while checking it, please retry', 409)
+            if record['fingerprint'] != fingerprint:
+                IDEMPOTENT_REQUESTS.inc(endpoint=endpoint, outcome='mismatch')
+                return _error(f'{IDEMPOTENCY_HEADER} was already used for a different request', 422)
+            if record['status'] == 'done':
+                IDEMPOTENT_REQUESTS.inc(endpoint=endpoint, outcome='replayed')
+                logger.info("Replayed %s response for idempotency key %s", endpoint, key)
+                return _replay(record)
+
+            # Still processing; take it over only if the request holding it has died
+            taken = collection.update_one(
+                {'_id': record_id, 'status': 'processing',
+                 'lockedAt': {'$lt': now - timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS)}},
+                {'$set': {'lock': lock, 'lockedAt': now}}
+            )
+            if not taken.modified_count:
+                IDEMPOTENT_REQUESTS.inc(endpoint=endpoint, outcome='conflict')
+                response = make_response(_error('A request with this Idempotency-Key is still in progress', 409))
+                response.headers['Retry-After'] = '1'
+                return response
+            logger.warning("Took over stale idempotency key %s for %s", key, endpoint)
+        except PyMongoError as e:
+            logger.error("Idempotency check failed for %s: %s", endpoint, e)
+            return _error('Database connection failed', 500)
+
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            collection.delete_one({'_id': record_id, 'lock': lock})
+            raise
+
+        if response.status_code >= 500 or response.is_streamed:
+            # Let the retry run again rather than replaying a failure
+            collection.delete_one({'_id': record_id, 'lock': lock})
+            return response
+
+        collection.update_one({'_id': record_id, 'lock': lock}, {'$set': {
+            'status': 'done',
+            'responseStatus': response.status_code,
+            'body': response.get_data(),
+            'contentType': response.content_type,
+            'completedAt': datetime.utcnow(),
+            'expiresAt': datetime.utcnow() + timedelta(hours=IDEMPOTENCY_TTL_HOURS)
+        }, '$unset': {'lock': '', 'lockedAt': ''}})
+        IDEMPOTENT_REQUESTS.inc(endpoint=endpoint, outcome='stored')
+        return response
+
+    return wrapper
@@ -0,0 +1,178 @@
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from bson import ObjectId
+from werkzeug.security import safe_join
+from .log import get_logger
+from .storage import BLOB_URL_PREFIX
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Variants are skipped and the original is served as before
+    Image = None
+
+logger = get_logger(__name__)
+
+# Widths (px) generated for each upload; widths at or above the original are skipped
+VARIANT_WIDTHS = tuple(
+    int(width) for width in os.getenv('IMAGE_VARIANT_WIDTHS', '160,320,640,1024').split(',') if width.strip()
+)
+
+# Background threads per process; Pillow releases the GIL while resizing/encoding
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+
+WEBP_QUALITY = 80
+JPEG_QUALITY = 82
+
+# Images written before blob storage existed still live here
+UPLOAD_URL_PREFIX = '/static/uploads/'
+
+class ImageVariants:
+    """Resized JPEG/PNG + WebP copies of product images, built off the request path.
+
+    `submit(product_id, image_url)` queues the work and returns at once. When
+    the variants are written, the product gets an `image_variants` field:
+
+        {'width': 2400, 'height': 1600,
+         'webp': [{'w': 160, 'url': ...}, ...],
+         'fallback': [{'w': 160, 'url': ..., 'type': 'image/jpeg'}, ...]}
+
+    and its catalog entry is invalidated. The document is only updated if
+    it still points at the same image, so a newer upload always wins.
+    """
+
+    def __init__(self, app=None, widths=VARIANT_WIDTHS, workers=IMAGE_WORKERS):
+        self.widths = tuple(sorted(set(widths)))
+        self.workers = workers
+        self._app = None
+        self._lock = threading.Lock()
+        self._executor = None
+        self._executor_pid = None
+        self._pending = set()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self._app = app
+        app.images = self
+
+    @property
+    def enabled(self):
+        return Image is not None and bool(self.widths)
+
+    # ---------------- Scheduling ----------------
+    def _get_executor(self):
+        # One pool per process (threads don't survive a fork)
+        if self._executor_pid != os.getpid():
+            with self._lock:
+                if self._executor_pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='image-variants')
+                    self._executor_pid = os.getpid()
+                    self._pending = set()
+        return self._executor
+
+    def submit(self, product_id, image_url):
+        """Queue variant generation for an uploaded image (no-op for external URLs)"""
+        if not self.enabled or not image_url or not image_url.startswith((BLOB_URL_PREFIX, UPLOAD_URL_PREFIX)):
+            return None
+        future = self._get_executor().submit(self._process, ObjectId(str(product_id)), image_url)
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        with self._lock:
+            self._pending.discard(future)
+
+    def drain(self, timeout=None):
+        """Wait for queued work (CLI commands exit as soon as they return)"""
+        with self._lock:
+            pending = list(self._pending)
+        wait(pending, timeout=timeout)
+
+    # ---------------- Processing ----------------
+    def _process(self, product_id, image_url):
+        try:
+            variants = self.build(image_url)
+        except Exception as e:
+            logger.warning("Could not build variants for %s: %s", image_url, e)
+            return None
+        if variants is None:
+            return None
+
+        result = self._app.db.products.update_one(
+            {'_id': product_id, 'image': image_url},
+            {'$set': {'image_variants': variants}}
+        )
+        if result.modified_count:
+            self._app.catalog.invalidate(product_id)
+        logger.debug("Built %d image variants for %s", len(variants['webp']) + len(variants['fallback']) - 1, product_id)
+        return variants
+
+    def _open_source(self, image_url):
+        """The original's bytes, or None if the URL points outside the upload folder"""
+        if image_url.startswith(BLOB_URL_PREFIX):
+            return io.BytesIO(self._app.storage.open_url(image_url).read())
+        # Imported rows can carry any /static/uploads/... value, so keep it inside the folder
+        path = safe_join(self._app.config['UPLOAD_FOLDER'], image_url[len(UPLOAD_URL_PREFIX):])
+        return open(path, 'rb') if path else None
+
+    def _store(self, image, fmt, **options):
+        buffer = io.BytesIO()
+        image.save(buffer, fmt, **options)
+        extension = {'WEBP': '.webp', 'PNG': '.png', 'JPEG': '.jpg'}[fmt]
+        return self._app.storage.save_bytes(buffer.getvalue(), extension).url
+
+    def build(self, image_url):
+        """Store the variants for one uploaded image and describe them"""
+        source = self._open_source(image_url)
+        if source is None:
+            logger.warning("Skipping image variants for %s: not inside the upload folder", image_url)
+            return None
+        with source, Image.open(source) as original:
+            if getattr(original, 'is_animated', False):
+                return None       # Resizing would keep only the first frame
+            image = ImageOps.exif_transpose(original)
+            has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+            image = image.convert('RGBA' if has_alpha else 'RGB')
+
+            # PNG keeps transparency; everything else falls back to JPEG
+            fallback_type = 'image/png' if has_alpha else 'image/jpeg'
+            width, height = image.size
+            variants = {'width': width, 'height': height, 'webp': [], 'fallback': []}
+
+            for target in self.widths:
+                if target >= width:
+                    break
+                resized = image.resize((target, max(1, round(height * target / width))), Image.LANCZOS)
+
+                webp_url = self._store(resized, 'WEBP', quality=WEBP_QUALITY, method=4)
+                variants['webp'].append({'w': target, 'url': webp_url})
+
+                if has_alpha:
+                    fallback_url = self._store(resized, 'PNG', optimize=True)
+                else:
+                    fallback_url = self._store(resized, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+                variants['fallback'].append({'w': target, 'url': fallback_url, 'type': fallback_type})
+
+            # Full-size WebP too (usually far smaller than the upload); the
+            # original itself is the largest fallback
+            webp_url = self._store(image, 'WEBP', quality=WEBP_QUALITY, method=4)
+            variants['webp'].append({'w': width, 'url': webp_url})
+            variants['fallback'].append({'w': width, 'url': image_url, 'type': Image.MIME.get(original.format)})
+
+        return variants
+
+def srcset(variants, full_url):
+    """`srcset` strings for an `image_variants` field, with full URLs"""
+    if not variants:
+        return None
+    return {
+        'webp': ', '.join(f"{full_url(v['url'])} {v['w']}w" for v in variants['webp']),
+        'fallback': ', '.join(f"{full_url(v['url'])} {v['w']}w" for v in variants['fallback']),
+        'fallbackType': variants['fallback'][0]['type'],
+        'width': variants['width'],
+        'height': variants['height']
+    }
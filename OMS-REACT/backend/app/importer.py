@@ -0,0 +1,295 @@
+import csv
+import io
+import json
+import math
+import os
+import zipfile
+from datetime import datetime
+from pymongo.errors import BulkWriteError
+from .counters import PRODUCT_IDS
+from .log import get_logger
+from .metrics import record_upload
+
+logger = get_logger(__name__)
+
+# Documents per insert_many; each chunk reserves its product IDs in one $inc
+IMPORT_CHUNK_SIZE = int(os.getenv('IMPORT_CHUNK_SIZE', 500))
+
+# Request size cap for the import endpoint (file + images zip), in place of the 16MB default
+IMPORT_MAX_BYTES = int(os.getenv('IMPORT_MAX_BYTES', 512 * 1024 * 1024))
+
+# Row errors returned in the report; the counts still cover every row
+ERROR_LIMIT = 1000
+
+# Largest single image taken from an archive
+MAX_IMAGE_BYTES = 16 * 1024 * 1024
+
+DEFAULT_IMAGE = '/static/uploads/default-product.jpg'
+IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
+
+class ImportFormatError(ValueError):
+    """The upload isn't a CSV/NDJSON product file we can read"""
+
+# ---------------- Reading ----------------
+def detect_format(filename, explicit=None):
+    """'csv' or 'ndjson' from ?format= or the file extension"""
+    fmt = (explicit or os.path.splitext(filename or '')[1].lstrip('.')).lower()
+    if fmt == 'csv':
+        return 'csv'
+    if fmt in ('ndjson', 'jsonl', 'json'):
+        return 'ndjson'
+    raise ImportFormatError('File must be .csv or .ndjson (or pass format=csv|ndjson)')
+
+def iter_rows(stream, fmt):
+    """Yield (row_number, dict) from a binary stream without reading it all"""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        if not reader.fieldnames:
+            raise ImportFormatError('CSV file has no header row')
+        for row in reader:
+            # Row numbers match a spreadsheet: the header is row 1
+            yield reader.line_num, row
+        return
+
+    for number, line in enumerate(text, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield number, e
+            continue
+        yield number, row if isinstance(row, dict) else ValueError('Line is not a JSON object')
+
+# ---------------- Validation ----------------
+def _text(row, field, default=''):
+    value = row.get(field)
+    if value is None:
+        return default
+    return str(value).strip()
+
+def _number(row, field, cast, errors):
+    raw = row.get(field)
+    if raw is None or str(raw).strip() == '':
+        errors.append(f'{field} is required')
+        return None
+    try:
+        value = cast(str(raw).strip()) if isinstance(raw, str) else cast(raw)
+        # float() takes 'nan'/'inf' and NDJSON allows NaN/Infinity; neither is a price or a stock level
+        finite = math.isfinite(value)
+    except (TypeError, ValueError, OverflowError):
+        finite = False
+    if not finite:
+        errors.append(f'{field} must be a number, got {raw!r}')
+        return None
+    if value < 0:
+        errors.append(f'{field} cannot be negative')
+        return None
+    return value
+
+def _flag(value, default=True):
+    if value is None or value == '':
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'y')
+
+def validate_row(row):
+    """(product fields, errors) for one input row; product_id is added at insert"""
+    errors = []
+    name = _text(row, 'name')
+    category = _text(row, 'category')
+    if not name:
+        errors.append('name is required')
+    if not category:
+        errors.append('category is required')
+    price = _number(row, 'price', float, errors)
+    stock = _number(row, 'stock', int, errors)
+
+    product = {
+        'name': name,
+        'category': category,
+        'price': price,
+        'stock': stock,
+        'condition': _text(row, 'condition') or 'Good',
+        'description': _text(row, 'description'),
+        'size': _text(row, 'size'),
+        'material': _text(row, 'material'),
+        'image': _text(row, 'image'),
+        'is_active': _flag(row.get('is_active'))
+    }
+    return product, errors
+
+# ---------------- Images ----------------
+class ImageArchive:
+    """Zip of product images, looked up by file name (case-insensitive)"""
+
+    def __init__(self, file, storage):
+        try:
+            self._zip = zipfile.ZipFile(file)
+        except zipfile.BadZipFile as e:
+            raise ImportFormatError(f'Images archive is not a valid zip: {e}')
+        self.storage = storage
+        self._entries = {}
+        for info in self._zip.infolist():
+            if not info.is_dir():
+                self._entries.setdefault(os.path.basename(info.filename).lower(), info)
+        self._saved = {}          # archive name -> stored URL, for images shared by rows
+
+    def __len__(self):
+        return len(self._entries)
+
+    def find(self, filename):
+        """Archive entry for `filename`; LookupError if it's missing or unusable"""
+        key = os.path.basename(filename).lower()
+        info = self._entries.get(key)
+        if info is None:
+            raise LookupError(f'image {filename!r} is not in the images archive')
+        extension = key.rsplit('.', 1)[-1] if '.' in key else ''
+        if extension not in IMAGE_EXTENSIONS:
+            raise LookupError(f'image {filename!r} is not a png, jpg, jpeg, gif or webp file')
+        if info.file_size > MAX_IMAGE_BYTES:
+            raise LookupError(f'image {filename!r} is larger than {MAX_IMAGE_BYTES // (1024 * 1024)}MB')
+        return info
+
+    def store(self, filename):
+        """Copy `filename` into blob storage and return its URL"""
+        key = os.path.basename(filename).lower()
+        if key in self._saved:
+            return self._saved[key]
+        info = self.find(filename)
+
+        # Content-addressed, so the same photo under two names is stored once
+        with self._zip.open(info) as source:
+            stored = self.storage.save(source, os.path.splitext(key)[1])
+        record_upload('product_image', stored.size)
+
+        self._saved[key] = stored.url
+        return stored.url
+
+    def close(self):
+        self._zip.close()
+
+def _resolve_image(value, images, dry_run):
+    if not value:
+        return DEFAULT_IMAGE
+    if value.startswith(('http://', 'https://', '/static/')):
+        return value
+    if images is None:
+        raise LookupError(f'image {value!r} given but no images archive was uploaded')
+    if dry_run:
+        images.find(value)
+        return value
+    return images.store(value)
+
+# ---------------- Import ----------------
+class ImportReport:
+    """Counts and per-row errors for one import run"""
+
+    def __init__(self, dry_run=False):
+        self.dry_run = dry_run
+        self.rows = 0
+        self.inserted = 0
+        self.failed = 0
+        self.errors = []
+        self.first_product_id = None
+        self.last_product_id = None
+
+    def error(self, row_number, messages):
+        self.failed += 1
+        if len(self.errors) < ERROR_LIMIT:
+            self.errors.append({'row': row_number, 'errors': messages})
+
+    def to_dict(self):
+        return {
+            'dryRun': self.dry_run,
+            'rows': self.rows,
+            'inserted': self.inserted,
+            'failed': self.failed,
+            'firstProductId': self.first_product_id,
+            'lastProductId': self.last_product_id,
+            'errors': self.errors,
+            'errorsTruncated': self.failed > len(self.errors)
+        }
+
+def _insert_chunk(db, chunk, report, variants=None):
+    """Number and insert one chunk of (row_number, product) pairs"""
+    now = datetime.utcnow()
+    ids = PRODUCT_IDS.reserve(db, len(chunk))
+    documents = []
+    for number, (_, product) in zip(ids, chunk):
+        documents.append({
+            'product_id': f"PROD-{number:06d}",
+            **product,
+            'created_at': now,
+            'updated_at': now
+        })
+
+    failed = set()
+    try:
+        result = db.products.insert_many(documents, ordered=False)
+        inserted = len(result.inserted_ids)
+    except BulkWriteError as e:
+        # ordered=False: everything except the listed documents went in
+        details = e.details
+        inserted = details.get('nInserted', 0)
+        for write_error in details.get('writeErrors', []):
+            failed.add(write_error['index'])
+            row_number = chunk[write_error['index']][0]
+            report.error(row_number, [write_error.get('errmsg', 'insert failed')])
+
+    report.inserted += inserted
+    if variants is not None:
+        # insert_many assigns every _id up front, so skip the ones that were rejected
+        for index, document in enumerate(documents):
+            if index not in failed and document['image'] != DEFAULT_IMAGE:
+                variants.submit(document['_id'], document['image'])
+    report.first_product_id = report.first_product_id or documents[0]['product_id']
+    report.last_product_id = documents[-1]['product_id']
+    logger.debug("Inserted %d/%d imported products", inserted, len(documents))
+
+def import_products(db, rows, images=None, variants=None, chunk_size=IMPORT_CHUNK_SIZE, dry_run=False):
+    """Validate `rows` and insert the valid ones in unordered chunks.
+
+    `rows` yields (row_number, dict) pairs (see iter_rows), so a large file
+    is never held in memory: at most one chunk of documents is. Invalid
+    rows are reported and skipped, they don't stop the import. With
+    dry_run nothing is written and no IDs or images are used up.
+    `variants` (an ImageVariants) gets the images of inserted products.
+    """
+    report = ImportReport(dry_run)
+    chunk = []
+
+    for row_number, row in rows:
+        report.rows += 1
+        if isinstance(row, Exception):
+            report.error(row_number, [f'unreadable row: {row}'])
+            continue
+
+        product, errors = validate_row(row)
+        if not errors:
+            try:
+                product['image'] = _resolve_image(product['image'], images, dry_run)
+            except LookupError as e:
+                errors.append(str(e))
+
+        if errors:
+            report.error(row_number, errors)
+            continue
+
+        chunk.append((row_number, product))
+        if len(chunk) >= chunk_size:
+            if not dry_run:
+                _insert_chunk(db, chunk, report, variants)
+            chunk = []
+
+    if chunk and not dry_run:
+        _insert_chunk(db, chunk, report, variants)
+
+    logger.info(
+        "Product import%s: %d rows, %d inserted, %d failed",
+        ' (dry run)' if dry_run else '', report.rows, report.inserted, report.failed
+    )
+    return report
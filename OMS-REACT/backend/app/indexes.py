@@ -0,0 +1,222 @@
+import os
+from pymongo import ASCENDING, DESCENDING, TEXT
+from pymongo.errors import OperationFailure
+from .models.product import TEXT_INDEX_WEIGHTS
+from .log import get_logger
+from .jobs import JOB_RETENTION_SECONDS
+
+logger = get_logger(__name__)
+
+# off    - don't touch indexes at startup
+# create - create anything missing, log failures (default)
+# verify - only report missing indexes, never build them
+# strict - create, then refuse to start if anything is still missing
+INDEX_MODES = ('off', 'create', 'verify', 'strict')
+
+class IndexCheckFailed(Exception):
+    """Raised in strict mode when declared indexes are missing or conflict"""
+
+    def __init__(self, report):
+        self.report = report
+        problems = [*report.get('missing', []), *report.get('mismatched', []), *report.get('failed', {})]
+        super().__init__(f"Missing or conflicting indexes: {', '.join(problems)}")
+
+def index(collection, keys, name, **options):
+    """One registry entry; options go straight to create_index"""
+    return {'collection': collection, 'keys': keys, 'name': name, 'options': options}
+
+# Every index the app's hot queries rely on. Names are fixed so startup
+# checks can tell a missing index from one declared with different keys or options.
+INDEXES = [
+    # Cart reads and upserts by owner
+    index('carts', [('user_id', ASCENDING)], 'carts_user_id'),
+
+    # Order history per user, listings (ORDER_SORT) and status filters
+    index('orders', [('userId', ASCENDING), ('createdAt', DESCENDING)], 'orders_user_created'),
+    index('orders', [('createdAt', DESCENDING), ('_id', DESCENDING)], 'orders_created'),
+    index('orders', [('status', ASCENDING), ('createdAt', DESCENDING), ('_id', DESCENDING)], 'orders_status_created'),
+
+    # Login / registration lookups, admin customer listing and dashboards
+    index('users', [('username', ASCENDING)], 'users_username'),
+    index('users', [('email', ASCENDING)], 'users_email'),
+    index('users', [('user_id', ASCENDING)], 'users_user_id'),
+    index('users', [('isAdmin', DESCENDING), ('user_id', ASCENDING), ('_id', ASCENDING)], 'users_role_user_id'),
+    index('users', [('isAdmin', ASCENDING), ('created_at', DESCENDING)], 'users_role_created'),
+
+    # Active catalog listing (PRODUCT_SORT), category pages, stock alerts, search
+    index('products', [('is_active', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)], 'products_active_created'),
+    index('products', [('is_active', ASCENDING), ('category', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)], 'products_active_category'),
+    index('products', [('is_active', ASCENDING), ('stock', ASCENDING)], 'products_active_stock'),
+    index('products', [('product_id', ASCENDING)], 'products_product_id'),
+    index('products', [(field, TEXT) for field in TEXT_INDEX_WEIGHTS], 'products_text_search',
+          weights=TEXT_INDEX_WEIGHTS),
+
+    # Customer records
+    index('customers', [('email', ASCENDING)], 'customers_email'),
+    index('customers', [('created_at', DESCENDING), ('_id', DESCENDING)], 'customers_created'),
+
+    # Dashboard rollups (app/stats.py)
+    index('stats_rollups', [('kind', ASCENDING), ('period', ASCENDING)], 'rollups_period'),
+    index('stats_rollups', [('kind', ASCENDING), ('totalSpent', DESCENDING)], 'rollups_total_spent'),
+    index('stats_rollups', [('kind', ASCENDING), ('totalSold', DESCENDING)], 'rollups_total_sold'),
+
+    # Job queue claims (app/jobs.py), the admin job list, and cleanup of finished jobs
+    index('jobs', [('status', ASCENDING), ('runAt', ASCENDING)], 'jobs_status_run_at'),
+    index('jobs', [('status', ASCENDING), ('createdAt', DESCENDING), ('_id', DESCENDING)], 'jobs_status_created'),
+    index('jobs', [('finishedAt', ASCENDING)], 'jobs_finished_ttl', expireAfterSeconds=JOB_RETENTION_SECONDS,
+          partialFilterExpression={'status': 'done'}),
+
+    # Idempotency-Key records (app/idempotency.py) expire at expiresAt
+    index('idempotency_keys', [('expiresAt', ASCENDING)], 'idempotency_keys_ttl', expireAfterSeconds=0),
+
+    # Released blobs waiting for `flask gc-blobs` (app/storage.py)
+    index('orphaned_blobs', [('releasedAt', ASCENDING)], 'orphaned_blobs_released'),
+
+    # Unread admin notifications, newest first
+    index('admin_notifications', [('read', ASCENDING), ('createdAt', DESCENDING), ('_id', DESCENDING)],
+          'admin_notifications_unread'),
+]
+
+def _by_collection(specs):
+    grouped = {}
+    for spec in specs:
+        grouped.setdefault(spec['collection'], []).append(spec)
+    return grouped
+
+# Options that change what an index does; any other create_index option is ignored when comparing
+COMPARED_OPTIONS = {'unique': False, 'sparse': False, 'expireAfterSeconds': None, 'partialFilterExpression': None}
+
+def _same_definition(spec, info):
+    """Compare a declared index (keys and options) with index_information() output"""
+    for option, default in COMPARED_OPTIONS.items():
+        if _plain(info.get(option, default)) != _plain(spec['options'].get(option, default)):
+            return False
+
+    text_fields = [field for field, direction in spec['keys'] if direction == TEXT]
+    if text_fields:
+        # Text indexes are stored as _fts/_ftsx; the fields and their weights live in `weights`
+        declared = {field: 1 for field in text_fields}
+        declared.update(spec['options'].get('weights', {}))
+        return _plain(info.get('weights', {})) == declared
+
+    return [(field, direction) for field, direction in info.get('key', [])] == [
+        (field, direction) for field, direction in spec['keys']
+    ]
+
+def _plain(value):
+    # index_information() hands back SON and whole-number floats; compare plain values
+    if isinstance(value, dict):
+        return {key: _plain(item) for key, item in value.items()}
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+# ---------------- Create ----------------
+def ensure_indexes(db, specs=INDEXES):
+    """Create every declared index that doesn't exist yet (safe to run repeatedly)"""
+    report = {'created': [], 'existing': [], 'failed': {}}
+
+    for collection_name, collection_specs in _by_collection(specs).items():
+        collection = db[collection_name]
+        existing = collection.index_information()
+        for spec in collection_specs:
+            label = f"{collection_name}.{spec['name']}"
+            if spec['name'] in existing:
+                report['existing'].append(label)
+                continue
+            try:
+                collection.create_index(spec['keys'], name=spec['name'], **spec['options'])
+                report['created'].append(label)
+            except OperationFailure as e:
+                # Usually the same keys already indexed under another name
+                report['failed'][label] = str(e)
+
+    return report
+
+# ---------------- Verify ----------------
+def _index_usage(collection):
+    """{index name: ops since server start} from $indexStats, or None if unsupported"""
+    try:
+        return {
+            stat['name']: stat.get('accesses', {}).get('ops', 0)
+            for stat in collection.aggregate([{'$indexStats': {}}])
+        }
+    except Exception:
+        return None
+
+def verify_indexes(db, specs=INDEXES, usage=True):
+    """Report declared indexes that are missing or differ, and indexes nobody uses"""
+    report = {'missing': [], 'mismatched': [], 'unused': [], 'undeclared': [], 'usage_unavailable': []}
+
+    for collection_name, collection_specs in _by_collection(specs).items():
+        collection = db[collection_name]
+        existing = collection.index_information()
+        declared = {spec['name'] for spec in collection_specs}
+
+        for spec in collection_specs:
+            label = f"{collection_name}.{spec['name']}"
+            info = existing.get(spec['name'])
+            if info is None:
+                report['missing'].append(label)
+            elif not _same_definition(spec, info):
+                report['mismatched'].append(label)
+
+        for name in existing:
+            if name != '_id_' and name not in declared:
+                report['undeclared'].append(f"{collection_name}.{name}")
+
+        if usage:
+            ops = _index_usage(collection)
+            if ops is None:
+                report['usage_unavailable'].append(collection_name)
+                continue
+            for name, count in ops.items():
+                if name != '_id_' and not count:
+                    report['unused'].append(f"{collection_name}.{name}")
+
+    return report
+
+# ---------------- Startup ----------------
+def bootstrap_indexes(db, mode=None):
+    """Apply MONGO_INDEX_MODE at startup; returns the verification report"""
+    mode = (mode or os.getenv('MONGO_INDEX_MODE', 'create')).lower()
+    if mode not in INDEX_MODES:
+        raise ValueError(f"MONGO_INDEX_MODE must be one of {', '.join(INDEX_MODES)}")
+    if mode == 'off':
+        return None
+
+    try:
+        report = _bootstrap(db, mode)
+    except IndexCheckFailed:
+        raise
+    except Exception as e:
+        if mode == 'strict':
+            raise
+        logger.warning("Index bootstrap failed: %s", e)
+        return None
+
+    if mode == 'strict' and (report['missing'] or report['mismatched'] or report['failed']):
+        raise IndexCheckFailed(report)
+    return report
+
+def _bootstrap(db, mode):
+    failed = {}
+    if mode in ('create', 'strict'):
+        created = ensure_indexes(db)
+        failed = created['failed']
+        if created['created']:
+            logger.info("Created indexes: %s", ', '.join(created['created']))
+        for label, error in failed.items():
+            logger.warning("Could not create index %s: %s", label, error)
+
+    # Usage counters reset on restart, so startup only checks presence
+    report = verify_indexes(db, usage=False)
+    report['failed'] = failed
+    for label in report['missing']:
+        logger.warning("Missing index %s - queries on it will scan the collection", label)
+    for label in report['mismatched']:
+        logger.warning("Index %s exists with different keys or options than declared", label)
+
+    if not (report['missing'] or report['mismatched'] or failed):
+        logger.info("All %s declared indexes present", len(INDEXES))
+    return report
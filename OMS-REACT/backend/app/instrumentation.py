@@ -0,0 +1,207 @@
+import bisect
+import contextvars
+import os
+import threading
+import time
+from flask import g, request
+from pymongo import monitoring
+from .log import get_logger
+
+logger = get_logger(__name__)
+
+# Histogram upper bounds; the last bucket catches everything above
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+DB_CALL_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+SIZE_BUCKETS_BYTES = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# A request making more Mongo calls than this is logged - usually an N+1 loop
+DB_CALLS_WARN = int(os.getenv('REQUEST_DB_CALLS_WARN', 25))
+
+# Stats for the request running in this context (copied into fan-out threads)
+_current = contextvars.ContextVar('request_db_stats', default=None)
+
+class RequestDbStats:
+    """Mongo commands issued while serving one request"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.failed = 0
+        self.duration = 0.0     # Seconds spent waiting on Mongo
+        self.commands = {}      # command name -> count
+
+    def record(self, command_name, duration, ok=True):
+        with self._lock:
+            self.calls += 1
+            self.duration += duration
+            self.commands[command_name] = self.commands.get(command_name, 0) + 1
+            if not ok:
+                self.failed += 1
+
+class CommandTimer(monitoring.CommandListener):
+    """Attributes every Mongo command to the request that issued it"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        stats = _current.get()
+        if stats is not None:
+            stats.record(event.command_name, event.duration_micros / 1e6)
+
+    def failed(self, event):
+        stats = _current.get()
+        if stats is not None:
+            stats.record(event.command_name, event.duration_micros / 1e6, ok=False)
+
+class Histogram:
+    """Fixed-bucket histogram with count, sum and max"""
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def observe(self, value):
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th observation"""
+        if not self.count:
+            return 0
+        rank = q * self.count
+        seen = 0
+        for index, bucket in enumerate(self.buckets):
+            seen += bucket
+            if seen >= rank:
+                return self.bounds[index] if index < len(self.bounds) else self.max
+        return self.max
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'sum': round(self.total, 3),
+            'avg': round(self.total / self.count, 3) if self.count else 0,
+            'max': round(self.max, 3),
+            'p50': self.quantile(0.50),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            'buckets': {
+                **{str(bound): count for bound, count in zip(self.bounds, self.buckets)},
+                '+Inf': self.buckets[-1]
+            }
+        }
+
+class EndpointStats:
+    """Aggregates for one METHOD + route"""
+
+    def __init__(self):
+        self.wall_ms = Histogram(LATENCY_BUCKETS_MS)
+        self.db_ms = Histogram(LATENCY_BUCKETS_MS)
+        self.db_calls = Histogram(DB_CALL_BUCKETS)
+        self.response_bytes = Histogram(SIZE_BUCKETS_BYTES)
+        self.statuses = {}
+
+    def snapshot(self):
+        return {
+            'wallMs': self.wall_ms.snapshot(),
+            'dbMs': self.db_ms.snapshot(),
+            'dbCalls': self.db_calls.snapshot(),
+            'responseBytes': self.response_bytes.snapshot(),
+            'statuses': dict(self.statuses)
+        }
+
+class RequestInstrumentation:
+    """Per-request wall time, Mongo calls/time and response size.
+
+    Each response gets a Server-Timing header (visible in the browser's
+    network panel); totals are kept per endpoint as histograms for
+    `snapshot()`. connect_db registers `listener` with the MongoClient.
+    """
+
+    def __init__(self, app=None):
+        self.listener = CommandTimer()
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self._observers = []
+        self.started_at = time.time()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.before_request(self._before)
+        app.after_request(self._after)
+        app.teardown_request(self._teardown)
+        app.extensions.setdefault('mongo_listeners', []).append(self.listener)
+        app.instrumentation = self
+
+    def subscribe(self, callback):
+        """Call `callback(key, wall_seconds, stats, status, size)` after every request"""
+        self._observers.append(callback)
+
+    # ---------------- Request hooks ----------------
+    def _before(self):
+        g._request_started = time.perf_counter()
+        g._request_db_token = _current.set(RequestDbStats())
+
+    def _after(self, response):
+        started = g.get('_request_started')
+        stats = _current.get()
+        if started is None or stats is None:
+            return response
+
+        wall = time.perf_counter() - started
+        size = response.content_length or 0
+        key = f"{request.method} {request.url_rule.rule if request.url_rule else '<unmatched>'}"
+
+        response.headers.add(
+            'Server-Timing',
+            f'app;dur={wall * 1000:.1f}, db;dur={stats.duration * 1000:.1f};desc="{stats.calls} calls"'
+        )
+
+        with self._lock:
+            endpoint = self._endpoints.get(key)
+            if endpoint is None:
+                endpoint = self._endpoints[key] = EndpointStats()
+            endpoint.wall_ms.observe(wall * 1000)
+            endpoint.db_ms.observe(stats.duration * 1000)
+            endpoint.db_calls.observe(stats.calls)
+            endpoint.response_bytes.observe(size)
+            endpoint.statuses[response.status_code] = endpoint.statuses.get(response.status_code, 0) + 1
+
+        if stats.calls > DB_CALLS_WARN:
+            logger.warning("%s made %d Mongo calls (%s)", key, stats.calls, stats.commands)
+
+        for callback in self._observers:
+            try:
+                callback(key, wall, stats, response.status_code, size)
+            except Exception as e:
+                logger.warning("Request observer error: %s", e)
+        return response
+
+    def _teardown(self, exc):
+        token = g.pop('_request_db_token', None)
+        if token is not None:
+            _current.reset(token)
+
+    # ---------------- Reporting ----------------
+    def snapshot(self):
+        """{'METHOD /route': histograms} for this worker process"""
+        with self._lock:
+            endpoints = {key: stats.snapshot() for key, stats in self._endpoints.items()}
+        return {
+            'pid': os.getpid(),
+            'since': self.started_at,
+            'endpoints': dict(sorted(endpoints.items()))
+        }
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+            self.started_at = time.time()
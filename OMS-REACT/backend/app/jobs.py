@@ -0,0 +1,276 @@
+import os
+import socket
+import threading
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import ASCENDING, ReturnDocument
+from .log import get_logger
+from .metrics import METRICS
+
+logger = get_logger(__name__)
+
+# Worker threads per process; 0 leaves the jobs to `flask --app run run-jobs`
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 2))
+
+# Seconds an idle worker sleeps before looking for due jobs (enqueue wakes it sooner)
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', 2))
+
+# Seconds a claimed job may run before another worker may take it over
+JOB_LEASE_SECONDS = int(os.getenv('JOB_LEASE_SECONDS', 300))
+
+# Attempts before a job is marked failed, and the first retry delay (doubled each time)
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 5))
+JOB_RETRY_DELAY = int(os.getenv('JOB_RETRY_DELAY', 10))
+JOB_RETRY_DELAY_MAX = 3600
+
+# Finished jobs are dropped by a TTL index this long after they complete (failed ones are kept)
+JOB_RETENTION_SECONDS = int(os.getenv('JOB_RETENTION_DAYS', 7)) * 86400
+
+# queued -> running -> done, or back to queued for a retry, or failed once attempts run out
+JOB_STATES = ('queued', 'running', 'done', 'failed')
+
+JOBS_RUN = METRICS.counter(
+    'jobs_total', 'Background jobs finished', ('type', 'outcome'))
+JOB_DURATION = METRICS.histogram(
+    'job_duration_seconds', 'Time spent running a background job', ('type',))
+
+class PermanentJobError(Exception):
+    """Raised by a handler when retrying can't help; the job fails at once"""
+
+def _retry_delay(attempts):
+    return min(JOB_RETRY_DELAY * 2 ** (attempts - 1), JOB_RETRY_DELAY_MAX)
+
+class JobQueue:
+    """Jobs stored in the `jobs` collection and run by worker threads.
+
+    Needs nothing but Mongo: `enqueue()` inserts a document, and a worker
+    claims it with one find_one_and_update, so any number of processes can
+    share the queue and each job runs once at a time. A job whose worker
+    died is taken over when its lease (`lockedUntil`) runs out. Handlers
+    that raise are retried with exponential backoff up to `maxAttempts`;
+    every document keeps its status, attempts and last error for
+    /api/admin/jobs.
+    """
+
+    def __init__(self, app=None, workers=JOB_WORKERS):
+        self.workers = workers
+        self.handlers = {}
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._app = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._workers_pid = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self._app = app
+        app.jobs = self
+
+        # Threads don't survive a fork, so each worker process starts its own on first use
+        if self.workers:
+            app.before_request(self._ensure_workers)
+
+    @property
+    def collection(self):
+        return self._app.db.jobs
+
+    def register(self, name):
+        """Decorator naming a handler; it's called with the job's payload"""
+        def decorator(func):
+            self.handlers[name] = func
+            return func
+        return decorator
+
+    # ---------------- Producing ----------------
+    def enqueue(self, name, payload=None, delay=0, max_attempts=JOB_MAX_ATTEMPTS):
+        """Queue a job to run after `delay` seconds; returns its id"""
+        if name not in self.handlers:
+            raise KeyError(f"No job handler registered for {name!r}")
+        now = datetime.utcnow()
+        job_id = self.collection.insert_one({
+            'type': name,
+            'payload': payload or {},
+            'status': 'queued',
+            'attempts': 0,
+            'maxAttempts': max_attempts,
+            'runAt': now + timedelta(seconds=delay),
+            'lockedBy': None,
+            'lockedUntil': None,
+            'lastError': None,
+            'result': None,
+            'createdAt': now,
+            'updatedAt': now
+        }).inserted_id
+        logger.debug("Queued %s job %s", name, job_id)
+        if self.workers:
+            self._ensure_workers()
+            self._wake.set()
+        return job_id
+
+    def retry(self, job_id):
+        """Queue a failed job again with a fresh set of attempts"""
+        now = datetime.utcnow()
+        job = self.collection.find_one_and_update(
+            {'_id': ObjectId(str(job_id)), 'status': 'failed'},
+            {'$set': {'status': 'queued', 'attempts': 0, 'runAt': now, 'updatedAt': now}},
+            return_document=ReturnDocument.AFTER
+        )
+        if job and self.workers:
+            self._wake.set()
+        return job
+
+    # ---------------- Consuming ----------------
+    def claim(self):
+        """Take the next due job (or one whose lease expired); None if there isn't one"""
+        now = datetime.utcnow()
+        return self.collection.find_one_and_update(
+            {'$or': [
+                {'status': 'queued', 'runAt': {'$lte': now}},
+                # A lease runs out when the worker died or hung; that counts as a failed attempt
+                {'status': 'running', 'lockedUntil': {'$lt': now},
+                 '$expr': {'$lt': ['$attempts', '$maxAttempts']}}
+            ], 'type': {'$in': list(self.handlers)}},
+            {
+                '$set': {
+                    'status': 'running',
+                    'lockedBy': self.worker_id,
+                    'lockedUntil': now + timedelta(seconds=JOB_LEASE_SECONDS),
+                    'startedAt': now,
+                    'updatedAt': now
+                },
+                '$inc': {'attempts': 1}
+            },
+            sort=[('runAt', ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    def run(self, job):
+        """Run one claimed job and record the outcome"""
+        name = job['type']
+        started = datetime.utcnow()
+        try:
+            with self._app.app_context():
+                result = self.handlers[name](job['payload'])
+        except Exception as e:
+            self._failed(job, e)
+            return False
+        finally:
+            JOB_DURATION.observe((datetime.utcnow() - started).total_seconds(), type=name)
+
+        now = datetime.utcnow()
+        self.collection.update_one(
+            {'_id': job['_id'], 'lockedBy': self.worker_id},
+            {'$set': {'status': 'done', 'result': result, 'lockedUntil': None,
+                      'finishedAt': now, 'updatedAt': now}}
+        )
+        JOBS_RUN.inc(type=name, outcome='done')
+        logger.debug("Job %s (%s) done after %d attempt(s)", job['_id'], name, job['attempts'])
+        return True
+
+    def _failed(self, job, error):
+        name = job['type']
+        now = datetime.utcnow()
+        final = isinstance(error, PermanentJobError) or job['attempts'] >= job['maxAttempts']
+        update = {
+            'lastError': f"{type(error).__name__}: {error}",
+            'lockedUntil': None,
+            'updatedAt': now
+        }
+        if final:
+            update.update(status='failed', finishedAt=now)
+            logger.error("Job %s (%s) failed after %d attempt(s): %s", job['_id'], name,
+                         job['attempts'], error, exc_info=error)
+        else:
+            delay = _retry_delay(job['attempts'])
+            update.update(status='queued', runAt=now + timedelta(seconds=delay))
+            logger.warning("Job %s (%s) attempt %d failed, retrying in %ds: %s",
+                           job['_id'], name, job['attempts'], delay, error)
+        self.collection.update_one({'_id': job['_id'], 'lockedBy': self.worker_id}, {'$set': update})
+        JOBS_RUN.inc(type=name, outcome='failed' if final else 'retry')
+
+    def fail_abandoned(self):
+        """Fail jobs whose lease ran out on their last attempt (the handler kept killing its worker)"""
+        now = datetime.utcnow()
+        abandoned = {'status': 'running', 'lockedUntil': {'$lt': now},
+                     '$expr': {'$gte': ['$attempts', '$maxAttempts']}}
+        count = 0
+        for job in self.collection.find(abandoned, {'type': 1, 'attempts': 1}):
+            result = self.collection.update_one({'_id': job['_id'], **abandoned}, {'$set': {
+                'status': 'failed',
+                'lastError': f"Lease expired after {JOB_LEASE_SECONDS}s on attempt {job['attempts']}",
+                'lockedUntil': None,
+                'finishedAt': now,
+                'updatedAt': now
+            }})
+            if result.modified_count:
+                logger.error("Job %s (%s) failed: its worker died or hung on every attempt", job['_id'], job['type'])
+                JOBS_RUN.inc(type=job['type'], outcome='failed')
+                count += 1
+        return count
+
+    def run_pending(self, limit=None):
+        """Run due jobs on this thread until none are left; returns how many ran"""
+        self.fail_abandoned()
+        count = 0
+        while limit is None or count < limit:
+            job = self.claim()
+            if job is None:
+                break
+            self.run(job)
+            count += 1
+        return count
+
+    # ---------------- Workers ----------------
+    def _ensure_workers(self):
+        if self._workers_pid == os.getpid():
+            return
+        with self._lock:
+            if self._workers_pid == os.getpid():
+                return
+            self._workers_pid = os.getpid()
+            self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+            self._stop.clear()
+            self._threads = [
+                threading.Thread(target=self.work, name=f'job-worker-{n}', daemon=True)
+                for n in range(self.workers)
+            ]
+        for thread in self._threads:
+            thread.start()
+        logger.info("Started %d job worker(s) in process %s", self.workers, os.getpid())
+
+    def work(self):
+        """Worker loop: run due jobs, sleep JOB_POLL_INTERVAL when there are none"""
+        while not self._stop.is_set():
+            try:
+                ran = self.run_pending(limit=10)
+            except Exception as e:
+                # Mongo unreachable and the like; back off and try again
+                logger.warning("Job worker could not claim jobs: %s", e)
+                ran = 0
+            if not ran:
+                self._wake.wait(JOB_POLL_INTERVAL)
+                self._wake.clear()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    # ---------------- Visibility ----------------
+    def counts(self):
+        """{type: {status: n}} over the whole queue"""
+        counts = {}
+        for row in self.collection.aggregate([
+            {'$group': {'_id': {'type': '$type', 'status': '$status'}, 'count': {'$sum': 1}}}
+        ]):
+            counts.setdefault(row['_id']['type'], {})[row['_id']['status']] = row['count']
+        return counts
+
+def init_jobs(app):
+    """Attach app.jobs and register the app's job handlers"""
+    queue = JobQueue(app)
+    from .proofs import register_proof_jobs
+    register_proof_jobs(queue)
+    return queue
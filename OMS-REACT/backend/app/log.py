@@ -0,0 +1,138 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler
+
+# Levels: DEBUG, INFO, WARNING, ERROR (LOG_LEVEL). Request-path detail such
+# as payload dumps is logged at DEBUG, so production pays one level check.
+ROOT_LOGGER = 'oms'
+DEFAULT_LEVEL = 'INFO'
+
+# Records waiting for the writer thread; beyond this they're dropped rather
+# than making a request wait on stdout
+QUEUE_SIZE = 10000
+
+# Attributes every LogRecord has; anything else came in through `extra=`
+_RECORD_FIELDS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'taskName'}
+
+def get_logger(name):
+    """Logger under the app's root, e.g. get_logger(__name__)"""
+    if name.startswith('app.'):
+        name = name[len('app.'):]
+    return logging.getLogger(f'{ROOT_LOGGER}.{name}')
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg, any extras, exc"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage()
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+class AsyncQueueHandler(QueueHandler):
+    """Hands records to a writer thread so logging never blocks on I/O.
+
+    The writer is started per process on first use, so it also works
+    after a preloading server forks its workers.
+    """
+
+    def __init__(self, target):
+        super().__init__(queue.Queue(QUEUE_SIZE))
+        self.target = target
+        self.dropped = 0
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def prepare(self, record):
+        # Resolve everything that depends on the calling thread now; the
+        # JSON encoding happens later on the writer thread
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        _add_request_fields(record)
+        return record
+
+    def enqueue(self, record):
+        self._ensure_writer()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _ensure_writer(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # A forked child inherits the queue but not the thread
+            self.queue = queue.Queue(QUEUE_SIZE)
+            self._pid = os.getpid()
+            threading.Thread(target=self._write, name='log-writer', daemon=True).start()
+
+    def _write(self):
+        records = self.queue
+        while True:
+            record = records.get()
+            if isinstance(record, threading.Event):
+                # flush() marker - everything before it has been written
+                self.target.flush()
+                record.set()
+                continue
+            try:
+                self.target.handle(record)
+            except Exception:
+                self.target.handleError(record)
+
+    def flush(self):
+        """Wait (briefly) until everything queued so far has been written"""
+        if self._pid != os.getpid():
+            return
+        done = threading.Event()
+        try:
+            self.queue.put(done, timeout=1)
+        except queue.Full:
+            return
+        done.wait(timeout=2)
+
+def _add_request_fields(record):
+    # Imported lazily so this module stays usable outside Flask
+    from flask import has_request_context, request
+    if has_request_context() and not hasattr(record, 'path'):
+        record.method = request.method
+        record.path = request.path
+
+_handler = None
+
+def configure_logging(level=None, stream=None):
+    """Route the app's loggers through one JSON-lines queue handler (idempotent)"""
+    global _handler
+    root = logging.getLogger(ROOT_LOGGER)
+    root.setLevel((level or os.getenv('LOG_LEVEL', DEFAULT_LEVEL)).upper())
+    if _handler is not None:
+        return root
+
+    target = logging.StreamHandler(stream or sys.stdout)
+    target.setFormatter(JsonFormatter())
+    _handler = AsyncQueueHandler(target)
+
+    root.addHandler(_handler)
+    root.propagate = False
+    atexit.register(_handler.flush)
+    return root
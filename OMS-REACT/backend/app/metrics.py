@@ -0,0 +1,407 @@
+import atexit
+import bisect
+import glob
+import json
+import math
+import os
+import threading
+import time
+from pymongo import monitoring
+from .log import get_logger
+
+logger = get_logger(__name__)
+
+# With several worker processes, each one writes its samples here and any
+# worker answering /metrics merges them. Unset = single-process mode.
+MULTIPROC_DIR_ENV = 'METRICS_MULTIPROC_DIR'
+FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 5))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (1024, 16384, 131072, 524288, 1048576, 4194304, 16777216)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+class _Metric:
+    kind = None
+
+    def __init__(self, registry, name, help, labels=()):
+        self._registry = registry
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+
+    def _key(self, labels):
+        return (self.name, tuple(str(labels.get(label, '')) for label in self.labels))
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        values = self._registry._shard().values
+        key = self._key(labels)
+        values[key] = values.get(key, 0) + amount
+
+class Gauge(_Metric):
+    """inc/dec from any thread; summed over live processes when merged"""
+    kind = 'gauge'
+
+    def __init__(self, registry, name, help, labels=()):
+        super().__init__(registry, name, help, labels)
+        self._functions = {}
+
+    def inc(self, amount=1, **labels):
+        values = self._registry._shard().values
+        key = self._key(labels)
+        values[key] = values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function, **labels):
+        """Read the value from `function()` at collection time"""
+        self._functions[self._key(labels)] = function
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, registry, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(registry, name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        histograms = self._registry._shard().histograms
+        key = self._key(labels)
+        counts = histograms.get(key)
+        if counts is None:
+            # One slot per bucket plus +Inf, then sum
+            counts = histograms[key] = [0] * (len(self.buckets) + 2)
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+class _Shard:
+    """Samples written by one thread; only that thread mutates it"""
+
+    def __init__(self, owner=None):
+        self.owner = owner
+        self.values = {}
+        self.histograms = {}
+
+    def add_to(self, values, histograms):
+        """Add this shard's samples into the given dicts"""
+        for key, value in dict(self.values).items():
+            values[key] = values.get(key, 0) + value
+        for key, counts in dict(self.histograms).items():
+            merged = histograms.get(key)
+            if merged is None:
+                histograms[key] = list(counts)
+            else:
+                for index, count in enumerate(counts):
+                    merged[index] += count
+
+class MetricsRegistry:
+    """Counters, gauges and histograms without a lock on the hot path.
+
+    Every thread records into its own shard; shards are only merged when
+    metrics are collected. A shard whose thread has exited is folded into
+    `_base`, so a thread-per-request server keeps one shard per live thread. In multiprocess mode each process also flushes
+    its merged samples to `<dir>/<pid>.json` so any worker can serve the
+    totals for all of them.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._local = threading.local()
+        self._shards = []
+        self._base = _Shard()       # Samples from threads that have exited
+        self._lock = threading.Lock()
+        self._flusher_pid = None
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    # ---------------- Definitions ----------------
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, help, labels=()):
+        return self._register(Counter(self, name, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self._register(Gauge(self, name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(self, name, help, labels, buckets))
+
+    # ---------------- Shards ----------------
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = _Shard(threading.current_thread())
+            with self._lock:
+                self._fold_dead()
+                self._shards.append(shard)
+            self._ensure_flusher()
+        return shard
+
+    def _fold_dead(self):
+        """Move shards of exited threads into _base (caller holds the lock)"""
+        live = []
+        for shard in self._shards:
+            if shard.owner.is_alive():
+                live.append(shard)
+            else:
+                # Its thread is gone, so nothing writes to it any more
+                shard.add_to(self._base.values, self._base.histograms)
+        self._shards = live
+
+    def _after_fork(self):
+        # The child starts from zero; the parent's samples stay the parent's
+        self._local = threading.local()
+        self._shards = []
+        self._base = _Shard()
+        self._lock = threading.Lock()
+        self._flusher_pid = None
+
+    def _merge_local(self):
+        values = {}
+        histograms = {}
+        with self._lock:
+            self._fold_dead()
+            self._base.add_to(values, histograms)
+            shards = list(self._shards)
+        for shard in shards:
+            shard.add_to(values, histograms)
+
+        for metric in list(self._metrics.values()):
+            if isinstance(metric, Gauge):
+                for key, function in metric._functions.items():
+                    try:
+                        values[key] = values.get(key, 0) + function()
+                    except Exception:
+                        pass
+        return values, histograms
+
+    # ---------------- Multiprocess ----------------
+    @property
+    def multiproc_dir(self):
+        return os.getenv(MULTIPROC_DIR_ENV)
+
+    def _ensure_flusher(self):
+        if not self.multiproc_dir or self._flusher_pid == os.getpid():
+            return
+        self._flusher_pid = os.getpid()
+        threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True).start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            self.flush()
+
+    def flush(self):
+        """Write this process's samples for the other workers to read"""
+        directory = self.multiproc_dir
+        if not directory:
+            return
+        values, histograms = self._merge_local()
+        payload = {
+            'pid': os.getpid(),
+            'values': [[name, list(labels), value] for (name, labels), value in values.items()],
+            'histograms': [[name, list(labels), counts] for (name, labels), counts in histograms.items()]
+        }
+        path = os.path.join(directory, f'{os.getpid()}.json')
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with open(f'{path}.tmp', 'w') as f:
+                json.dump(payload, f)
+            os.replace(f'{path}.tmp', path)
+        except OSError as e:
+            logger.warning("Could not write metrics to %s: %s", path, e)
+
+    def _collect(self):
+        values, histograms = self._merge_local()
+        directory = self.multiproc_dir
+        if not directory:
+            return values, histograms
+
+        # Counters and histograms keep what exited workers counted (so totals
+        # never go backwards); gauges only count processes still alive
+        for path in glob.glob(os.path.join(directory, '*.json')):
+            try:
+                with open(path) as f:
+                    payload = json.load(f)
+            except (OSError, ValueError):
+                continue
+            pid = payload.get('pid')
+            if pid == os.getpid():
+                continue
+            alive = _pid_alive(pid)
+            for name, labels, value in payload.get('values', []):
+                metric = self._metrics.get(name)
+                if metric is None or (isinstance(metric, Gauge) and not alive):
+                    continue
+                key = (name, tuple(labels))
+                values[key] = values.get(key, 0) + value
+            for name, labels, counts in payload.get('histograms', []):
+                key = (name, tuple(labels))
+                merged = histograms.get(key)
+                if merged is None:
+                    histograms[key] = list(counts)
+                elif len(merged) == len(counts):
+                    for index, count in enumerate(counts):
+                        merged[index] += count
+        return values, histograms
+
+    # ---------------- Exposition ----------------
+    def render(self):
+        """Prometheus text exposition format (0.0.4)"""
+        values, histograms = self._collect()
+        lines = []
+        for name, metric in sorted(self._metrics.items()):
+            lines.append(f'# HELP {name} {metric.help}')
+            lines.append(f'# TYPE {name} {metric.kind}')
+            if isinstance(metric, Histogram):
+                for (sample_name, labels), counts in sorted(histograms.items()):
+                    if sample_name != name:
+                        continue
+                    label_pairs = list(zip(metric.labels, labels))
+                    cumulative = 0
+                    for bound, count in zip((*metric.buckets, math.inf), counts):
+                        cumulative += count
+                        le = '+Inf' if bound == math.inf else _format_value(bound)
+                        lines.append(f'{name}_bucket{_format_labels([*label_pairs, ("le", le)])} {cumulative}')
+                    lines.append(f'{name}_sum{_format_labels(label_pairs)} {_format_value(counts[-1])}')
+                    lines.append(f'{name}_count{_format_labels(label_pairs)} {cumulative}')
+            else:
+                for (sample_name, labels), value in sorted(values.items()):
+                    if sample_name == name:
+                        lines.append(f'{name}{_format_labels(zip(metric.labels, labels))} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except (OSError, TypeError):
+        return False
+    return True
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(pairs):
+    pairs = [f'{key}="{_escape(value)}"' for key, value in pairs]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+def clear_multiproc_dir():
+    """Remove samples left by a previous run (call once before workers start)"""
+    directory = os.getenv(MULTIPROC_DIR_ENV)
+    if directory:
+        for path in glob.glob(os.path.join(directory, '*.json*')):
+            os.remove(path)
+
+# ---------------- App metrics ----------------
+METRICS = MetricsRegistry()
+
+HTTP_REQUESTS = METRICS.counter(
+    'http_requests_total', 'HTTP requests handled', ('blueprint', 'method', 'status'))
+HTTP_ERRORS = METRICS.counter(
+    'http_request_errors_total', 'HTTP responses with a 4xx/5xx status', ('blueprint', 'class'))
+HTTP_LATENCY = METRICS.histogram(
+    'http_request_duration_seconds', 'Wall time per request', ('blueprint',))
+HTTP_RESPONSE_BYTES = METRICS.histogram(
+    'http_response_size_bytes', 'Response body size', ('blueprint',), buckets=SIZE_BUCKETS)
+MONGO_CALLS = METRICS.counter(
+    'mongo_commands_total', 'Mongo commands issued while serving requests', ('blueprint',))
+MONGO_TIME = METRICS.counter(
+    'mongo_command_seconds_total', 'Time spent waiting on Mongo while serving requests', ('blueprint',))
+
+POOL_OPEN = METRICS.gauge(
+    'mongo_pool_connections', 'Open Mongo connections')
+POOL_IN_USE = METRICS.gauge(
+    'mongo_pool_connections_in_use', 'Mongo connections checked out by a thread')
+POOL_MAX = METRICS.gauge(
+    'mongo_pool_max_size', 'Configured maxPoolSize summed over workers')
+POOL_CHECKOUT_WAIT = METRICS.histogram(
+    'mongo_pool_checkout_wait_seconds', 'Time a thread waited for a pooled connection')
+POOL_CHECKOUT_FAILURES = METRICS.counter(
+    'mongo_pool_checkout_failures_total', 'Connection checkouts that failed', ('reason',))
+
+UPLOAD_BYTES = METRICS.counter(
+    'upload_bytes_total', 'Bytes received in file uploads', ('kind',))
+UPLOADS = METRICS.counter(
+    'uploads_total', 'File uploads received', ('kind',))
+
+def record_upload(kind, size):
+    """Count one stored upload of `size` bytes"""
+    UPLOADS.inc(kind=kind)
+    UPLOAD_BYTES.inc(size, kind=kind)
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """Feeds the mongo_pool_* metrics from the driver's pool events"""
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        POOL_OPEN.inc()
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        POOL_OPEN.dec()
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        POOL_CHECKOUT_FAILURES.inc(reason=event.reason)
+
+    def connection_checked_out(self, event):
+        POOL_IN_USE.inc()
+        duration = getattr(event, 'duration', None)  # pymongo >= 4.7
+        if duration is not None:
+            POOL_CHECKOUT_WAIT.observe(duration)
+
+    def connection_checked_in(self, event):
+        POOL_IN_USE.dec()
+
+def init_metrics(app):
+    """Record request metrics for `app` and serve them at /metrics"""
+    from flask import Response, request
+
+    def observe(key, wall, stats, status, size):
+        blueprint = request.blueprint or 'app'
+        HTTP_REQUESTS.inc(blueprint=blueprint, method=request.method, status=status)
+        if status >= 400:
+            HTTP_ERRORS.inc(blueprint=blueprint, **{'class': f'{status // 100}xx'})
+        HTTP_LATENCY.observe(wall, blueprint=blueprint)
+        HTTP_RESPONSE_BYTES.observe(size, blueprint=blueprint)
+        MONGO_CALLS.inc(stats.calls, blueprint=blueprint)
+        MONGO_TIME.inc(stats.duration, blueprint=blueprint)
+
+    app.instrumentation.subscribe(observe)
+    app.extensions.setdefault('mongo_listeners', []).append(PoolMetrics())
+    POOL_MAX.set_function(lambda: app.mongo_client.options.pool_options.max_pool_size)
+    atexit.register(METRICS.flush)
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        return Response(METRICS.render(), content_type=CONTENT_TYPE)
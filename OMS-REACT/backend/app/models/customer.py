@@ -1,5 +1,9 @@
 from datetime import datetime
 from bson import ObjectId
+from ..pagination import paginate
+
+# Newest first; _id breaks ties so every page boundary is unique
+CUSTOMER_SORT = [('created_at', -1), ('_id', -1)]
 
 class Customer:
     def __init__(self, db):
@@ -13,9 +17,13 @@ class Customer:
         result = self.collection.insert_one(customer_data)
         return self.get_customer_by_id(result.inserted_id)
     
-    def get_all_customers(self):
+    def get_all_customers(self, query=None):
         """Get all customers"""
-        return list(self.collection.find().sort('created_at', -1))
+        return list(self.collection.find(query or {}).sort(CUSTOMER_SORT))
+    
+    def get_customers_page(self, query, args):
+        """Get one keyset page of customers and the cursor for the next one"""
+        return paginate(self.collection, query, CUSTOMER_SORT, args)
     
     def get_customer_by_id(self, customer_id):
         """Get customer by ID"""
@@ -2,6 +2,9 @@
 from bson import ObjectId
 from datetime import datetime
 
+# Field weights for the products text index (declared in app/indexes.py, used by app/search.py)
+TEXT_INDEX_WEIGHTS = {'name': 10, 'category': 5, 'description': 1}
+
 class Product:
     def __init__(self, db):
         self.collection = db.products
@@ -19,20 +22,6 @@ class Product:
         """Get a single product by product_id field"""
         return self.collection.find_one({'product_id': product_id})
     
-    def search_products(self, query):
-        """Search products by name or category"""
-        search_filter = {
-            '$and': [
-                {'is_active': True},
-                {'$or': [
-                    {'name': {'$regex': query, '$options': 'i'}},
-                    {'category': {'$regex': query, '$options': 'i'}},
-                    {'description': {'$regex': query, '$options': 'i'}}
-                ]}
-            ]
-        }
-        return list(self.collection.find(search_filter))
-    
     def create_product(self, product_data):
         """Create a new product"""
         product = {
@@ -0,0 +1,123 @@
+import base64
+from datetime import datetime
+from bson import json_util
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor can't be decoded"""
+
+def wants_pagination(args):
+    """Paginate only when the client asks for it, so existing callers keep full lists"""
+    return 'limit' in args or 'cursor' in args
+
+def parse_limit(args):
+    """Page size from ?limit=, clamped to 1..MAX_PAGE_SIZE"""
+    try:
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    except (TypeError, ValueError):
+        limit = DEFAULT_PAGE_SIZE
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+def encode_cursor(values):
+    """Opaque token holding the sort values of the last document on a page"""
+    raw = json_util.dumps(values).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(token):
+    """Inverse of encode_cursor"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json_util.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except Exception:
+        raise InvalidCursor('Invalid pagination cursor')
+    if not isinstance(values, list):
+        raise InvalidCursor('Invalid pagination cursor')
+    return values
+
+def _get_path(doc, path):
+    for part in path.split('.'):
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(part)
+    return doc
+
+def _after(field, direction, value):
+    """Condition for `field` sorting strictly after `value`, or None if nothing can.
+
+    Missing and null sort before every other value, but $gt/$lt only
+    compare values of the same type, so those documents need their own
+    branch or they'd be skipped.
+    """
+    if direction < 0:
+        if value is None:
+            return None
+        return {'$or': [{field: {'$lt': value}}, {field: None}]}
+    if value is None:
+        return {field: {'$ne': None}}
+    return {field: {'$gt': value}}
+
+def keyset_filter(sort, values):
+    """Match documents strictly after `values` in the given sort order.
+
+    For sort [(a, -1), (_id, -1)] this builds
+    {'$or': [{a: {'$lt': va}}, {a: va, _id: {'$lt': vid}}]}
+    (the `a` branch also matches a missing/null `a`, which sorts last).
+    """
+    if len(values) != len(sort):
+        raise InvalidCursor('Invalid pagination cursor')
+
+    clauses = []
+    for i, (field, direction) in enumerate(sort):
+        after = _after(field, direction, values[i])
+        if after is None:
+            continue
+        # Equal on every earlier key; {field: None} also matches a missing field
+        clause = {sort[j][0]: values[j] for j in range(i)}
+        clause.update(after)
+        clauses.append(clause)
+    if not clauses:
+        return {'_id': {'$exists': False}}
+    return {'$or': clauses}
+
+def paginate(collection, query, sort, args, projection=None):
+    """Fetch one page using keyset pagination.
+
+    `sort` must end with an `_id` key so every position is unique.
+    Returns (documents, next_cursor); next_cursor is None on the last page.
+    """
+    limit = parse_limit(args)
+    cursor_token = args.get('cursor')
+
+    if cursor_token:
+        after = keyset_filter(sort, decode_cursor(cursor_token))
+        query = {'$and': [query, after]} if query else after
+
+    # Fetch one extra document to learn whether another page exists
+    docs = list(collection.find(query, projection).sort(sort).limit(limit + 1))
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+
+    next_cursor = None
+    if has_more and docs:
+        next_cursor = encode_cursor([_get_path(docs[-1], field) for field, _ in sort])
+
+    return docs, next_cursor
+
+def _parse_date(value):
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        return None
+
+def date_range_filter(field, args):
+    """Build a range filter on `field` from ?from= and ?to= ISO dates"""
+    date_range = {}
+    start = _parse_date(args.get('from'))
+    end = _parse_date(args.get('to'))
+    if start:
+        date_range['$gte'] = start
+    if end:
+        date_range['$lte'] = end
+    return {field: date_range} if date_range else {}
@@ -0,0 +1,142 @@
+import io
+import os
+from datetime import datetime
+from bson import ObjectId
+from flask import current_app
+from .jobs import PermanentJobError
+from .log import get_logger
+from .storage import mark_orphaned
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Proofs are kept as uploaded and only the admin notification is sent
+    Image = None
+
+logger = get_logger(__name__)
+
+# Width (px) of the thumbnail shown in the admin order list
+PROOF_THUMBNAIL_WIDTH = int(os.getenv('PROOF_THUMBNAIL_WIDTH', 320))
+
+JPEG_QUALITY = 90
+WEBP_QUALITY = 80
+
+# paymentProofStatus on the order: set to 'processing' by the upload, then one of these
+PROOF_STATES = ('processing', 'verified', 'rejected', 'unchecked')
+
+def register_proof_jobs(queue):
+    queue.register('payment_proof.process')(process_payment_proof)
+    queue.register('admin.notify')(notify_admins)
+
+# ---------------- Image work ----------------
+def _encode(image, fmt, **options):
+    buffer = io.BytesIO()
+    image.save(buffer, fmt, **options)
+    return buffer.getvalue()
+
+def clean_image(data):
+    """(clean bytes, extension, thumbnail bytes, (width, height)) for an uploaded proof.
+
+    Raises OSError/SyntaxError/DecompressionBombError when the bytes aren't a
+    readable image. The copy is re-encoded from pixels only, so EXIF (GPS,
+    camera serials), XMP and comments are dropped; the EXIF orientation is
+    applied first so the photo still shows the right way up.
+    """
+    with Image.open(io.BytesIO(data)) as probe:
+        probe.verify()        # Structure/CRC check; the image can't be used after this
+
+    with Image.open(io.BytesIO(data)) as original:
+        image = ImageOps.exif_transpose(original)
+        has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+        image.info = {}
+
+        if has_alpha:
+            clean, extension = _encode(image, 'PNG', optimize=True), '.png'
+        else:
+            clean, extension = _encode(image, 'JPEG', quality=JPEG_QUALITY, optimize=True), '.jpg'
+
+        width, height = image.size
+        if width > PROOF_THUMBNAIL_WIDTH:
+            image = image.resize((PROOF_THUMBNAIL_WIDTH, max(1, round(height * PROOF_THUMBNAIL_WIDTH / width))),
+                                 Image.LANCZOS)
+        thumbnail = _encode(image, 'WEBP', quality=WEBP_QUALITY, method=4)
+
+    return clean, extension, thumbnail, (width, height)
+
+# ---------------- Handlers ----------------
+def process_payment_proof(payload):
+    """Verify, strip and thumbnail one uploaded payment proof, then tell the admins"""
+    db = current_app.db
+    storage = current_app.storage
+    order_id = ObjectId(payload['orderId'])
+    url = payload['url']
+
+    order = db.orders.find_one({'_id': order_id}, {'paymentProof': 1, 'orderNumber': 1})
+    if order is None or order.get('paymentProof') != url:
+        # Replaced by a newer upload (which has its own job) or already processed
+        return {'skipped': True}
+
+    if Image is None:
+        db.orders.update_one({'_id': order_id, 'paymentProof': url},
+                             {'$set': {'paymentProofStatus': 'unchecked', 'paymentProofProcessedAt': datetime.now()}})
+        current_app.jobs.enqueue('admin.notify', _notification(order, 'payment_proof', url))
+        return {'status': 'unchecked'}
+
+    source = storage.open_url(url)
+    if source is None:
+        raise PermanentJobError(f"{url} is not a stored blob")
+    try:
+        data = source.read()
+    finally:
+        source.close()
+
+    try:
+        clean, extension, thumbnail, (width, height) = clean_image(data)
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as e:
+        # A bad file won't get better on retry; flag it for the admin instead
+        logger.warning("Payment proof %s for order %s is not a usable image: %s", url, order_id, e)
+        db.orders.update_one({'_id': order_id, 'paymentProof': url}, {'$set': {
+            'paymentProofStatus': 'rejected',
+            'paymentProofError': str(e),
+            'paymentProofProcessedAt': datetime.now()
+        }})
+        current_app.jobs.enqueue('admin.notify', _notification(order, 'payment_proof_rejected', url, str(e)))
+        return {'status': 'rejected', 'error': str(e)}
+
+    clean_url = storage.save_bytes(clean, extension).url
+    thumbnail_url = storage.save_bytes(thumbnail, '.webp').url
+
+    result = db.orders.update_one({'_id': order_id, 'paymentProof': url}, {'$set': {
+        'paymentProof': clean_url,
+        'paymentProofThumbnail': thumbnail_url,
+        'paymentProofStatus': 'verified',
+        'paymentProofSize': {'width': width, 'height': height},
+        'paymentProofProcessedAt': datetime.now()
+    }})
+    if not result.modified_count:
+        return {'skipped': True}
+
+    if clean_url != url:
+        # The original (with its EXIF) is deleted by `flask gc-blobs` once nothing else uses it
+        mark_orphaned(db, url)
+    current_app.jobs.enqueue('admin.notify', _notification(order, 'payment_proof', clean_url))
+    logger.info("Payment proof for order %s verified (%dx%d)", order_id, width, height)
+    return {'status': 'verified', 'url': clean_url, 'thumbnail': thumbnail_url}
+
+def _notification(order, kind, url, detail=None):
+    number = order.get('orderNumber') or str(order['_id'])
+    if kind == 'payment_proof_rejected':
+        message = f"Payment proof for order {number} could not be read: {detail}"
+    else:
+        message = f"Payment proof uploaded for order {number}"
+    return {'kind': kind, 'orderId': str(order['_id']), 'message': message, 'url': url}
+
+def notify_admins(payload):
+    """Record an admin notification (listed at /api/admin/notifications)"""
+    notification_id = current_app.db.admin_notifications.insert_one({
+        **payload,
+        'read': False,
+        'createdAt': datetime.now()
+    }).inserted_id
+    logger.info("Admin notification: %s", payload['message'])
+    return {'notificationId': str(notification_id)}
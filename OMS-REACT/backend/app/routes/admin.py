@@ -1,8 +1,57 @@
 from flask import Blueprint, jsonify, current_app, request
 from datetime import datetime
 from bson import ObjectId
+from pymongo import ReturnDocument
+from ..concurrency import run_parallel
+from ..counters import USER_IDS
+from ..pagination import paginate, wants_pagination, date_range_filter, InvalidCursor
+from ..log import get_logger
+from ..stats import (
+    record_order_change, get_order_rollup, status_breakdown,
+    monthly_revenue, top_customers, top_products
+)
 
 bp = Blueprint('admin', __name__, url_prefix='/api/admin')
+logger = get_logger(__name__)
+
+# Keyset sort orders for paginated listings; _id keeps page boundaries unique
+ORDER_SORT = [('createdAt', -1), ('_id', -1)]
+PRODUCT_SORT = [('created_at', -1), ('_id', -1)]
+CUSTOMER_SORT = [('isAdmin', -1), ('user_id', 1), ('_id', 1)]  # Admins on top
+DISCOUNT_SORT = [('_id', -1)]
+JOB_SORT = [('createdAt', -1), ('_id', -1)]
+NOTIFICATION_SORT = [('createdAt', -1), ('_id', -1)]
+
+# ---------------- Helpers ----------------
+def fetch_page(collection, query, sort, projection=None):
+    """Return (documents, next_cursor) honouring ?limit=&cursor= when present"""
+    if wants_pagination(request.args):
+        return paginate(collection, query, sort, request.args, projection)
+    return list(collection.find(query, projection).sort(sort)), None
+
+def fetch_users_by_username(db, usernames):
+    """Load all users for the given usernames with one $in query"""
+    usernames = {name for name in usernames if name}
+    if not usernames:
+        return {}
+    
+    users = db.users.find(
+        {'username': {'$in': list(usernames)}},
+        {'username': 1, 'firstName': 1, 'lastName': 1, 'email': 1, 'phone': 1}
+    )
+    return {user['username']: user for user in users}
+
+def get_customer_name(user, default="Customer"):
+    """Full name from first and last name, falling back to the username"""
+    if not user:
+        return default
+    
+    first_name = user.get('firstName', '')
+    last_name = user.get('lastName', '')
+    customer_name = f"{first_name} {last_name}".strip()
+    if not customer_name:
+        customer_name = user.get('username', default)
+    return customer_name
 
 @bp.route('/stats', methods=['GET'])
 def get_admin_stats():
@@ -10,26 +59,18 @@ def get_admin_stats():
     try:
         db = current_app.db
 
-        # Count all products (including inactive)
-        product_count = db.products.count_documents({})
+        # Count all products (including inactive) from collection metadata
+        product_count = db.products.estimated_document_count()
         
-        # Count all orders
-        order_count = db.orders.count_documents({})
+        # Order count and completed revenue come from the maintained rollup
+        order_rollup = get_order_rollup(db)
+        order_count = order_rollup.get('orderCount', 0)
+        total_revenue = order_rollup.get('revenue', 0)
         
         # Count customers (non-admin users)
         customer_count = db.users.count_documents({"isAdmin": False})
 
-        # ✅ FIXED: Compute total revenue for completed orders with correct field name
-        revenue_pipeline = [
-            {"$match": {"status": "completed"}},
-            {"$group": {"_id": None, "totalRevenue": {"$sum": "$total"}}}
-        ]
-        revenue_result = list(db.orders.aggregate(revenue_pipeline))
-        
-        # ✅ FIXED: Use the correct field name 'totalRevenue'
-        total_revenue = revenue_result[0]['totalRevenue'] if revenue_result else 0
-
-        print(f"📊 Stats - Products: {product_count}, Orders: {order_count}, Customers: {customer_count}, Revenue: {total_revenue}")
+        logger.debug("Stats - Products: %s, Orders: %s, Customers: %s, Revenue: %s", product_count, order_count, customer_count, total_revenue)
 
         return jsonify({
             "productCount": product_count,
@@ -39,7 +80,7 @@ def get_admin_stats():
         }), 200
 
     except Exception as e:
-        print(f"❌ Error fetching admin stats: {e}")
+        logger.error("Error fetching admin stats: %s", e)
         return jsonify({
             "productCount": 0,
             "orderCount": 0,
@@ -53,8 +94,12 @@ def get_customers():
     try:
         db = current_app.db  # ✅ use live DB
 
-        users_cursor = db.users.find({}, {'password': 0})  # Exclude passwords
-        users = list(users_cursor)
+        query = {}
+        role = request.args.get('role')
+        if role in ('admin', 'customer'):
+            query['isAdmin'] = True if role == 'admin' else {'$ne': True}
+
+        users, next_cursor = fetch_page(db.users, query, CUSTOMER_SORT, {'password': 0})  # Exclude passwords
 
         # ✅ Admin should appear on top
         admins = []
@@ -85,16 +130,20 @@ def get_customers():
 
         all_users = admins + customers  # Admin on top
 
-        print(f"📊 Found {len(all_users)} users in database")
+        logger.debug("Found %s users in database", len(all_users))
 
         return jsonify({
             "success": True,
             "customers": all_users,
-            "count": len(all_users)
+            "count": len(all_users),
+            "nextCursor": next_cursor,
+            "hasMore": next_cursor is not None
         }), 200
 
+    except InvalidCursor as e:
+        return jsonify({"success": False, "error": str(e), "customers": []}), 400
     except Exception as e:
-        print(f"❌ Error fetching customers: {str(e)}")
+        logger.error("Error fetching customers: %s", e)
         return jsonify({
             "success": False,
             "error": f"Failed to fetch customers: {str(e)}",
@@ -108,25 +157,21 @@ def get_orders():
     try:
         db = current_app.db  # ✅ use live DB
 
-        orders_cursor = db.orders.find({}).sort('createdAt', -1)
-        orders = list(orders_cursor)
+        query = {}
+        if request.args.get('status'):
+            query['status'] = request.args['status']
+        query.update(date_range_filter('createdAt', request.args))
+
+        orders, next_cursor = fetch_page(db.orders, query, ORDER_SORT)
+
+        # Get user information for all orders in one query
+        users = fetch_users_by_username(db, (order.get('userId') for order in orders))
 
         formatted_orders = []
         for order in orders:
-            # Get user information for this order
-            user = db.users.find_one({'username': order.get('userId')})
-            customer_name = "Customer"
-            username = "Customer"
-            
-            if user:
-                # Get customer name from first and last name
-                first_name = user.get('firstName', '')
-                last_name = user.get('lastName', '')
-                customer_name = f"{first_name} {last_name}".strip()
-                if not customer_name:
-                    customer_name = user.get('username', 'Customer')
-                
-                username = user.get('username', 'Customer')
+            user = users.get(order.get('userId'))
+            customer_name = get_customer_name(user)
+            username = user.get('username', 'Customer') if user else "Customer"
             
             # Format order date
             order_date = order.get('orderDate')
@@ -153,16 +198,20 @@ def get_orders():
                 "userId": order.get("userId", "")
             })
 
-        print(f"📦 Found {len(formatted_orders)} orders in database")
+        logger.debug("Found %s orders in database", len(formatted_orders))
 
         return jsonify({
             "success": True,
             "orders": formatted_orders,
-            "count": len(formatted_orders)
+            "count": len(formatted_orders),
+            "nextCursor": next_cursor,
+            "hasMore": next_cursor is not None
         }), 200
 
+    except InvalidCursor as e:
+        return jsonify({"success": False, "error": str(e), "orders": []}), 400
     except Exception as e:
-        print(f"❌ Error fetching orders: {str(e)}")
+        logger.error("Error fetching orders: %s", e)
         return jsonify({
             "success": False,
             "error": f"Failed to fetch orders: {str(e)}",
@@ -180,16 +229,13 @@ def get_order_details(order_id):
             return '', 200
             
         if request.method == 'GET':
-            print(f"🔍 Fetching order details for: {order_id}")
+            logger.debug("Fetching order details for: %s", order_id)
             
             # Find the order
             order = db.orders.find_one({'_id': ObjectId(order_id)})
             if not order:
                 return jsonify({'success': False, 'error': 'Order not found'}), 404
             
-            # Convert ObjectId to string
-            order['_id'] = str(order['_id'])
-            
             # Find user information
             user = db.users.find_one({'username': order.get('userId')})
             user_info = {}
@@ -222,7 +268,7 @@ def get_order_details(order_id):
                 **user_info
             }
             
-            print(f"✅ Found order: {order_details.get('orderNumber')}")
+            logger.debug("Found order: %s", order_details.get('orderNumber'))
             
             return jsonify({
                 'success': True,
@@ -230,7 +276,7 @@ def get_order_details(order_id):
             }), 200
             
         elif request.method == 'PUT':
-            print(f"🔄 Updating order status for: {order_id}")
+            logger.debug("Updating order status for: %s", order_id)
             data = request.get_json()
             new_status = data.get('status')
             
@@ -243,16 +289,19 @@ def get_order_details(order_id):
                 return jsonify({'success': False, 'error': f'Invalid status. Admin can only set: {", ".join(valid_statuses)}'}), 400
             
             # Update the order status
-            result = db.orders.update_one(
+            update_fields = {
+                'status': new_status.lower(),
+                'updatedAt': datetime.now()
+            }
+            before = db.orders.find_one_and_update(
                 {'_id': ObjectId(order_id)},
-                {'$set': {
-                    'status': new_status.lower(),
-                    'updatedAt': datetime.now()
-                }}
+                {'$set': update_fields},
+                return_document=ReturnDocument.BEFORE
             )
             
-            if result.modified_count:
-                print(f"✅ Order {order_id} status updated to: {new_status}")
+            if before:
+                record_order_change(db, before, {**before, **update_fields})
+                logger.info("Order %s status updated to: %s", order_id, new_status)
                 return jsonify({
                     'success': True,
                     'message': f'Order status updated to {new_status} successfully'
@@ -261,7 +310,7 @@ def get_order_details(order_id):
                 return jsonify({'success': False, 'error': 'Order not found or no changes made'}), 404
                 
     except Exception as e:
-        print(f"❌ Error in order details endpoint: {str(e)}")
+        logger.error("Error in order details endpoint: %s", e)
         return jsonify({
             'success': False,
             'error': str(e)
@@ -274,8 +323,11 @@ def get_products():
     try:
         db = current_app.db  # ✅ use live DB
 
-        products_cursor = db.products.find({})
-        products = list(products_cursor)
+        query = {}
+        if request.args.get('category'):
+            query['category'] = request.args['category']
+
+        products, next_cursor = fetch_page(db.products, query, PRODUCT_SORT)
 
         formatted_products = []
         for product in products:
@@ -293,11 +345,15 @@ def get_products():
         return jsonify({
             "success": True,
             "products": formatted_products,
-            "count": len(formatted_products)
+            "count": len(formatted_products),
+            "nextCursor": next_cursor,
+            "hasMore": next_cursor is not None
         }), 200
 
+    except InvalidCursor as e:
+        return jsonify({"success": False, "error": str(e), "products": []}), 400
     except Exception as e:
-        print(f"❌ Error fetching products: {str(e)}")
+        logger.error("Error fetching products: %s", e)
         return jsonify({
             "success": False,
             "error": f"Failed to fetch products: {str(e)}",
@@ -311,8 +367,11 @@ def get_discounts():
     try:
         db = current_app.db  # ✅ use live DB
 
-        discounts_cursor = db.discounts.find({})
-        discounts = list(discounts_cursor)
+        query = {}
+        if 'isActive' in request.args:
+            query['isActive'] = request.args['isActive'].lower() == 'true'
+
+        discounts, next_cursor = fetch_page(db.discounts, query, DISCOUNT_SORT)
 
         formatted_discounts = []
         for discount in discounts:
@@ -333,11 +392,15 @@ def get_discounts():
         return jsonify({
             "success": True,
             "discounts": formatted_discounts,
-            "count": len(formatted_discounts)
+            "count": len(formatted_discounts),
+            "nextCursor": next_cursor,
+            "hasMore": next_cursor is not None
         }), 200
 
+    except InvalidCursor as e:
+        return jsonify({"success": False, "error": str(e), "discounts": []}), 400
     except Exception as e:
-        print(f"❌ Error fetching discounts: {str(e)}")
+        logger.error("Error fetching discounts: %s", e)
         return jsonify({
             "success": False,
             "error": f"Failed to fetch discounts: {str(e)}",
@@ -351,36 +414,15 @@ def get_revenue_stats():
     try:
         db = current_app.db
 
-        # Total revenue from completed orders
-        revenue_pipeline = [
-            {"$match": {"status": "completed"}},
-            {"$group": {"_id": None, "totalRevenue": {"$sum": "$total"}}}
-        ]
-        revenue_result = list(db.orders.aggregate(revenue_pipeline))
-        total_revenue = revenue_result[0]['totalRevenue'] if revenue_result else 0
-
-        # Monthly revenue breakdown
-        monthly_pipeline = [
-            {"$match": {"status": "completed"}},
-            {"$group": {
-                "_id": {"$dateToString": {"format": "%Y-%m", "date": "$orderDate"}},
-                "revenue": {"$sum": "$total"},
-                "orders": {"$sum": 1}
-            }},
-            {"$sort": {"_id": -1}},
-            {"$limit": 6}
-        ]
-        monthly_result = list(db.orders.aggregate(monthly_pipeline))
+        # Everything below is read from the maintained rollups
+        order_rollup = get_order_rollup(db)
+        total_revenue = order_rollup.get('revenue', 0)
+
+        # Monthly revenue breakdown (latest 6 months)
+        monthly_result = monthly_revenue(db, limit=6, newest_first=True)
 
         # Order status breakdown
-        status_pipeline = [
-            {"$group": {
-                "_id": "$status",
-                "count": {"$sum": 1},
-                "totalValue": {"$sum": "$total"}
-            }}
-        ]
-        status_result = list(db.orders.aggregate(status_pipeline))
+        status_result = status_breakdown(order_rollup)
 
         return jsonify({
             "success": True,
@@ -390,7 +432,7 @@ def get_revenue_stats():
         }), 200
 
     except Exception as e:
-        print(f"❌ Error fetching revenue stats: {str(e)}")
+        logger.error("Error fetching revenue stats: %s", e)
         return jsonify({
             "success": False,
             "error": f"Failed to fetch revenue stats: {str(e)}",
@@ -410,17 +452,12 @@ def get_recent_orders():
         recent_orders_cursor = db.orders.find({}).sort('createdAt', -1).limit(5)
         recent_orders = list(recent_orders_cursor)
 
+        # Get user information for all orders in one query
+        users = fetch_users_by_username(db, (order.get('userId') for order in recent_orders))
+
         formatted_orders = []
         for order in recent_orders:
-            # Get user information
-            user = db.users.find_one({'username': order.get('userId')})
-            customer_name = "Customer"
-            if user:
-                first_name = user.get('firstName', '')
-                last_name = user.get('lastName', '')
-                customer_name = f"{first_name} {last_name}".strip()
-                if not customer_name:
-                    customer_name = user.get('username', 'Customer')
+            customer_name = get_customer_name(users.get(order.get('userId')))
 
             formatted_orders.append({
                 "_id": str(order["_id"]),
@@ -437,7 +474,7 @@ def get_recent_orders():
         }), 200
 
     except Exception as e:
-        print(f"❌ Error fetching recent orders: {str(e)}")
+        logger.error("Error fetching recent orders: %s", e)
         return jsonify({
             "success": False,
             "error": f"Failed to fetch recent orders: {str(e)}",
@@ -505,9 +542,8 @@ def create_user():
         if hashed_password:
             user_data['password'] = hashed_password
 
-        # Generate user_id
-        user_count = db.users.count_documents({})
-        user_data['user_id'] = f"USR{user_count + 1:04d}"
+        # Generate user_id from the shared atomic counter
+        user_data['user_id'] = f"USR-{USER_IDS.next(db):06d}"
 
         result = db.users.insert_one(user_data)
 
@@ -518,7 +554,7 @@ def create_user():
         }), 201
 
     except Exception as e:
-        print(f"❌ Error creating user: {str(e)}")
+        logger.error("Error creating user: %s", e)
         return jsonify({'success': False, 'error': f'Failed to create user: {str(e)}'}), 500
 
 
@@ -589,7 +625,7 @@ def update_user(user_id):
             return jsonify({'success': False, 'error': 'No changes made'}), 400
 
     except Exception as e:
-        print(f"❌ Error updating user: {str(e)}")
+        logger.error("Error updating user: %s", e)
         return jsonify({'success': False, 'error': f'Failed to update user: {str(e)}'}), 500
 
 
@@ -624,7 +660,7 @@ def delete_user(user_id):
             return jsonify({'success': False, 'error': 'Failed to delete user'}), 400
 
     except Exception as e:
-        print(f"❌ Error deleting user: {str(e)}")
+        logger.error("Error deleting user: %s", e)
         return jsonify({'success': False, 'error': f'Failed to delete user: {str(e)}'}), 500
 
 @bp.route('/dashboard-data', methods=['GET'])
@@ -633,18 +669,37 @@ def get_dashboard_data():
     try:
         db = current_app.db
 
+        # The sections are independent, so run them side by side; the
+        # response takes as long as the slowest one instead of the sum
+        results, section_errors = run_parallel({
+            'recentOrders': lambda: list(db.orders.find().sort('createdAt', -1).limit(5)),
+            'lowStockProducts': lambda: list(db.products.find(
+                {'stock': {'$lt': 10}, 'is_active': True}
+            ).limit(5)),
+            'topCustomers': lambda: top_customers(db, limit=5),
+            'orderStatusDistribution': lambda: status_breakdown(get_order_rollup(db)),
+            'recentCustomers': lambda: list(db.users.find({
+                'isAdmin': False
+            }).sort('created_at', -1).limit(5)),
+            'topSellingProducts': lambda: top_products(db, limit=5)
+        })
+
+        if not results:
+            raise Exception('; '.join(f"{name}: {error}" for name, error in section_errors.items()))
+
+        recent_orders = results.get('recentOrders', [])
+        top_customers_result = results.get('topCustomers', [])
+
+        # Resolve customers for recent orders and top customers with one query
+        users = fetch_users_by_username(db, [
+            *(order.get('userId') for order in recent_orders),
+            *(customer_data['_id'] for customer_data in top_customers_result)
+        ])
+
         # 1. Recent Orders with Customer Details
-        recent_orders = list(db.orders.find().sort('createdAt', -1).limit(5))
         formatted_recent_orders = []
         for order in recent_orders:
-            user = db.users.find_one({'username': order.get('userId')})
-            customer_name = "Customer"
-            if user:
-                first_name = user.get('firstName', '')
-                last_name = user.get('lastName', '')
-                customer_name = f"{first_name} {last_name}".strip()
-                if not customer_name:
-                    customer_name = user.get('username', 'Customer')
+            customer_name = get_customer_name(users.get(order.get('userId')))
             
             formatted_recent_orders.append({
                 "_id": str(order["_id"]),
@@ -657,13 +712,8 @@ def get_dashboard_data():
             })
 
         # 2. Low Stock Products (stock < 10)
-        low_stock_products = list(db.products.find({
-            'stock': {'$lt': 10},
-            'is_active': True
-        }).limit(5))
-        
         formatted_low_stock = []
-        for product in low_stock_products:
+        for product in results.get('lowStockProducts', []):
             formatted_low_stock.append({
                 "_id": str(product["_id"]),
                 "name": product.get("name", "Unnamed Product"),
@@ -673,27 +723,11 @@ def get_dashboard_data():
             })
 
         # 3. Top Customers by Order Value
-        top_customers_pipeline = [
-            {"$match": {"status": "completed"}},
-            {"$group": {
-                "_id": "$userId",
-                "totalSpent": {"$sum": "$total"},
-                "orderCount": {"$sum": 1}
-            }},
-            {"$sort": {"totalSpent": -1}},
-            {"$limit": 5}
-        ]
-        top_customers_result = list(db.orders.aggregate(top_customers_pipeline))
-        
         formatted_top_customers = []
         for customer_data in top_customers_result:
-            user = db.users.find_one({'username': customer_data['_id']})
+            user = users.get(customer_data['_id'])
             if user:
-                first_name = user.get('firstName', '')
-                last_name = user.get('lastName', '')
-                customer_name = f"{first_name} {last_name}".strip()
-                if not customer_name:
-                    customer_name = user.get('username', 'Customer')
+                customer_name = get_customer_name(user)
                 
                 formatted_top_customers.append({
                     "username": customer_data['_id'],
@@ -703,22 +737,11 @@ def get_dashboard_data():
                 })
 
         # 4. Order Status Distribution
-        status_pipeline = [
-            {"$group": {
-                "_id": "$status",
-                "count": {"$sum": 1},
-                "totalValue": {"$sum": "$total"}
-            }}
-        ]
-        status_distribution = list(db.orders.aggregate(status_pipeline))
+        status_distribution = results.get('orderStatusDistribution', [])
 
         # 5. Recent Customer Registrations
-        recent_customers = list(db.users.find({
-            'isAdmin': False
-        }).sort('created_at', -1).limit(5))
-        
         formatted_recent_customers = []
-        for user in recent_customers:
+        for user in results.get('recentCustomers', []):
             formatted_recent_customers.append({
                 "_id": str(user["_id"]),
                 "username": user.get("username", ""),
@@ -729,17 +752,7 @@ def get_dashboard_data():
             })
 
         # 6. Top Selling Products
-        top_products_pipeline = [
-            {"$unwind": "$items"},
-            {"$group": {
-                "_id": "$items.name",
-                "totalSold": {"$sum": "$items.qty"},
-                "totalRevenue": {"$sum": {"$multiply": ["$items.qty", "$items.price"]}}
-            }},
-            {"$sort": {"totalSold": -1}},
-            {"$limit": 5}
-        ]
-        top_products_result = list(db.orders.aggregate(top_products_pipeline))
+        top_products_result = results.get('topSellingProducts', [])
 
         return jsonify({
             "success": True,
@@ -748,11 +761,14 @@ def get_dashboard_data():
             "topCustomers": formatted_top_customers,
             "orderStatusDistribution": status_distribution,
             "recentCustomers": formatted_recent_customers,
-            "topSellingProducts": top_products_result
+            "topSellingProducts": top_products_result,
+            # Sections that failed or timed out are returned empty and listed here
+            "partial": bool(section_errors),
+            "sectionErrors": section_errors
         }), 200
 
     except Exception as e:
-        print(f"❌ Error fetching dashboard data: {str(e)}")
+        logger.error("Error fetching dashboard data: %s", e)
         return jsonify({
             "success": False,
             "error": f"Failed to fetch dashboard data: {str(e)}",
@@ -765,23 +781,129 @@ def get_dashboard_data():
         }), 500
 
 
+@bp.route('/request-stats', methods=['GET', 'DELETE'])
+def request_stats():
+    """Per-endpoint latency, Mongo call and response size histograms (this worker)"""
+    instrumentation = current_app.instrumentation
+    if request.method == 'DELETE':
+        instrumentation.reset()
+    return jsonify({"success": True, **instrumentation.snapshot()}), 200
+
+
+@bp.route('/slow-queries', methods=['GET', 'DELETE'])
+def slow_queries():
+    """Mongo commands over SLOW_QUERY_MS, grouped by filter shape (this worker)"""
+    slow_log = current_app.slow_queries
+    if request.method == 'DELETE':
+        slow_log.reset()
+    return jsonify({"success": True, **slow_log.snapshot()}), 200
+
+
+@bp.route('/jobs', methods=['GET'])
+def list_jobs():
+    """Background jobs, newest first (?status=queued|running|done|failed, ?type=), with queue counts"""
+    try:
+        jobs = current_app.jobs
+        query = {}
+        if request.args.get('status'):
+            query['status'] = request.args['status']
+        if request.args.get('type'):
+            query['type'] = request.args['type']
+
+        # Always paged; the queue can hold far more than one response should
+        page, next_cursor = paginate(jobs.collection, query, JOB_SORT, request.args)
+        return jsonify({
+            "success": True,
+            "jobs": page,
+            "counts": jobs.counts(),
+            "nextCursor": next_cursor,
+            "hasMore": next_cursor is not None
+        }), 200
+
+    except InvalidCursor as e:
+        return jsonify({"success": False, "error": str(e), "jobs": []}), 400
+    except Exception as e:
+        logger.error("Error fetching jobs: %s", e)
+        return jsonify({"success": False, "error": str(e), "jobs": []}), 500
+
+
+@bp.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """One job with its payload, attempts, last error and result"""
+    try:
+        job = current_app.jobs.collection.find_one({'_id': ObjectId(job_id)})
+        if not job:
+            return jsonify({"success": False, "error": "Job not found"}), 404
+        return jsonify({"success": True, "job": job}), 200
+
+    except Exception as e:
+        logger.error("Error fetching job %s: %s", job_id, e)
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+@bp.route('/jobs/<job_id>/retry', methods=['POST'])
+def retry_job(job_id):
+    """Queue a failed job again"""
+    try:
+        job = current_app.jobs.retry(job_id)
+        if not job:
+            return jsonify({"success": False, "error": "No failed job with that id"}), 404
+        logger.info("Job %s re-queued by admin", job_id)
+        return jsonify({"success": True, "job": job}), 200
+
+    except Exception as e:
+        logger.error("Error retrying job %s: %s", job_id, e)
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+@bp.route('/notifications', methods=['GET'])
+def list_notifications():
+    """Admin notifications, newest first (?unread=true for unread only)"""
+    try:
+        query = {}
+        if request.args.get('unread', '').lower() == 'true':
+            query['read'] = False
+
+        notifications, next_cursor = paginate(current_app.db.admin_notifications, query, NOTIFICATION_SORT, request.args)
+        return jsonify({
+            "success": True,
+            "notifications": notifications,
+            "unread": current_app.db.admin_notifications.count_documents({'read': False}),
+            "nextCursor": next_cursor,
+            "hasMore": next_cursor is not None
+        }), 200
+
+    except InvalidCursor as e:
+        return jsonify({"success": False, "error": str(e), "notifications": []}), 400
+    except Exception as e:
+        logger.error("Error fetching notifications: %s", e)
+        return jsonify({"success": False, "error": str(e), "notifications": []}), 500
+
+
+@bp.route('/notifications/<notification_id>/read', methods=['PUT'])
+def mark_notification_read(notification_id):
+    """Mark one admin notification as read"""
+    try:
+        result = current_app.db.admin_notifications.update_one(
+            {'_id': ObjectId(notification_id)},
+            {'$set': {'read': True, 'readAt': datetime.now()}}
+        )
+        if not result.matched_count:
+            return jsonify({"success": False, "error": "Notification not found"}), 404
+        return jsonify({"success": True}), 200
+
+    except Exception as e:
+        logger.error("Error updating notification %s: %s", notification_id, e)
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
 @bp.route('/monthly-revenue', methods=['GET'])
 def get_monthly_revenue():
     """Get monthly revenue data for charts"""
     try:
         db = current_app.db
 
-        monthly_pipeline = [
-            {"$match": {"status": "completed"}},
-            {"$group": {
-                "_id": {"$dateToString": {"format": "%Y-%m", "date": "$orderDate"}},
-                "revenue": {"$sum": "$total"},
-                "orders": {"$sum": 1}
-            }},
-            {"$sort": {"_id": 1}},
-            {"$limit": 6}
-        ]
-        monthly_result = list(db.orders.aggregate(monthly_pipeline))
+        monthly_result = monthly_revenue(db, limit=6, newest_first=False)
 
         return jsonify({
             "success": True,
@@ -789,7 +911,7 @@ def get_monthly_revenue():
         }), 200
 
     except Exception as e:
-        print(f"❌ Error fetching monthly revenue: {str(e)}")
+        logger.error("Error fetching monthly revenue: %s", e)
         return jsonify({
             "success": False,
             "error": f"Failed to fetch monthly revenue: {str(e)}",
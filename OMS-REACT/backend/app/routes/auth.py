@@ -3,8 +3,11 @@ from datetime import datetime
 import random
 import string
 import requests
+from ..counters import USER_IDS
+from ..log import get_logger
 
 bp = Blueprint('auth', __name__, url_prefix='/api/auth')
+logger = get_logger(__name__)
 
 # In-memory storage for verification codes (use Redis in production)
 verification_codes = {}
@@ -13,20 +16,8 @@ verification_codes = {}
 # 🧩 Utility: Generate clean, professional User ID
 # -----------------------------------------------------
 def generate_user_id(db):
-    """Generate a sequential, 6-digit user ID (USR-000001)"""
-    last_user = db.users.find_one(
-        {"user_id": {"$regex": "^USR-"}},
-        sort=[("created_at", -1)]
-    )
-
-    next_id = 1
-    if last_user and "user_id" in last_user:
-        try:
-            next_id = int(last_user["user_id"].split("-")[1]) + 1
-        except Exception as e:
-            print(f"⚠️ User ID parse error: {e}")
-
-    return f"USR-{next_id:06d}"
+    """Generate a sequential, 6-digit user ID (USR-000001) from an atomic counter"""
+    return f"USR-{USER_IDS.next(db):06d}"
 
 # -----------------------------------------------------
 # 🧩 Function to create admin account if not exists
@@ -45,9 +36,9 @@ def create_admin_account():
                 "created_at": datetime.utcnow()
             }
             current_app.db.users.insert_one(admin_data)
-            print("✅ Admin account created: admin / admin12345")
+            logger.info("Admin account created: admin")
     except Exception as e:
-        print(f"❌ Error creating admin account: {e}")
+        logger.error("Error creating admin account: %s", e)
 
 # -----------------------------------------------------
 # 🧩 CORS Preflight Handler for Auth Routes
@@ -75,7 +66,7 @@ def check_email():
         data = request.get_json()
         email = data.get('email', '').strip().lower()
         
-        print(f"🔍 Checking email availability: {email}")
+        logger.debug("Checking email availability: %s", email)
 
         if not email:
             return jsonify({"error": "Email is required"}), 400
@@ -94,7 +85,7 @@ def check_email():
         })
         
     except Exception as e:
-        print(f"❌ Email check error: {e}")
+        logger.error("Email check error: %s", e)
         return jsonify({"error": "Server error during email check"}), 500
 
 # -----------------------------------------------------
@@ -109,7 +100,7 @@ def check_username():
         data = request.get_json()
         username = data.get('username')
 
-        print(f"🔍 Checking username: {username}")
+        logger.debug("Checking username: %s", username)
 
         existing_user = current_app.db.users.find_one({"username": username})
         return jsonify({
@@ -117,7 +108,7 @@ def check_username():
             "available": existing_user is None
         })
     except Exception as e:
-        print(f"❌ Username check error: {e}")
+        logger.error("Username check error: %s", e)
         return jsonify({"error": "Server error"}), 500
 
 # -----------------------------------------------------
@@ -135,27 +126,26 @@ def login():
         username = data.get('username')
         password = data.get('password')
 
-        print(f"🔐 Login attempt for username: {username}")
+        logger.debug("Login attempt for username: %s", username)
 
         user = current_app.db.users.find_one({"username": username})
         if user and user.get('password') == password:
             # Prepare user data for response
-            user['_id'] = str(user['_id'])
             user_data = {k: v for k, v in user.items() if k != 'password'}
 
-            print(f"✅ Login successful for username: {username}")
-            print(f"👑 Admin status: {user_data.get('isAdmin', False)}")
+            logger.info("Login successful for username: %s", username)
+            logger.debug("Admin status: %s", user_data.get('isAdmin', False))
             
             return jsonify({
                 "message": "Login successful!",
                 "user": user_data
             })
 
-        print(f"❌ Login failed for username: {username}")
+        logger.warning("Login failed for username: %s", username)
         return jsonify({"error": "Invalid username or password"}), 401
 
     except Exception as e:
-        print(f"❌ Login error: {e}")
+        logger.error("Login error: %s", e)
         return jsonify({"error": "Server error"}), 500
 
 # -----------------------------------------------------
@@ -172,7 +162,7 @@ def register():
         password = data.get('password')
         username = data.get('username')
 
-        print(f"📝 Registration attempt - Username: {username}, Email: {email}")
+        logger.debug("Registration attempt - Username: %s, Email: %s", username, email)
 
         if current_app.db.users.find_one({"email": email}):
             return jsonify({"error": "Email already registered. Please use a different email or login."}), 400
@@ -194,7 +184,7 @@ def register():
 
         result = current_app.db.users.insert_one(user_data)
 
-        print(f"✅ User registered: {username} with email: {email} and ID: {user_id}")
+        logger.info("User registered: %s with email: %s and ID: %s", username, email, user_id)
         return jsonify({
             "message": "User registered successfully!",
             "user_id": str(result.inserted_id),
@@ -202,7 +192,7 @@ def register():
         })
 
     except Exception as e:
-        print(f"❌ Registration error: {e}")
+        logger.error("Registration error: %s", e)
         return jsonify({"error": "Server error"}), 500
 
 # -----------------------------------------------------
@@ -219,7 +209,7 @@ def forgot_password():
         email = data.get('email')
         new_password = data.get('new_password')
 
-        print(f"🔑 Password reset attempt - Username: {username}, Email: {email}")
+        logger.debug("Password reset attempt - Username: %s, Email: %s", username, email)
 
         # Validate required fields
         if not username or not email or not new_password:
@@ -232,7 +222,7 @@ def forgot_password():
         })
         
         if not user:
-            print(f"❌ User not found with username '{username}' and email '{email}'")
+            logger.warning("User not found with username '%s' and email '%s'", username, email)
             return jsonify({"error": "No user found with this username and email combination"}), 404
 
         # Update password
@@ -248,14 +238,14 @@ def forgot_password():
         )
 
         if result.modified_count > 0:
-            print(f"✅ Password updated successfully for user: {username}")
+            logger.info("Password updated successfully for user: %s", username)
             return jsonify({
                 "message": "Password reset successfully! You can now login with your new password."
             })
         else:
-            print(f"❌ Failed to update password for user: {username}")
+            logger.error("Failed to update password for user: %s", username)
             return jsonify({"error": "Failed to update password"}), 500
 
     except Exception as e:
-        print(f"❌ Forgot password error: {e}")
+        logger.error("Forgot password error: %s", e)
         return jsonify({"error": "Server error"}), 500
\ No newline at end of file
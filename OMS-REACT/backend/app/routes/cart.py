@@ -1,8 +1,10 @@
 from flask import Blueprint, request, jsonify, current_app
 from bson import ObjectId
 from datetime import datetime
+from ..log import get_logger
 
 bp = Blueprint('cart', __name__, url_prefix='/api/cart')
+logger = get_logger(__name__)
 
 # Add OPTIONS handler for all cart routes
 @bp.before_request
@@ -29,6 +31,67 @@ def get_full_image_url(image_path):
     
     return f'http://localhost:5000/static/uploads/{image_path}'
 
+def fetch_cart_products(catalog, items):
+    """Load every product referenced by the cart items through the catalog cache"""
+    product_ids = [
+        item['product_id']
+        for item in items
+        if ObjectId.is_valid(item.get('product_id'))
+    ]
+    
+    if not product_ids:
+        return {}
+    
+    # Cache misses are fetched together with a single $in query
+    return catalog.get_many(product_ids)
+
+def hydrate_cart_items(catalog, items):
+    """Merge stored cart items with current product data"""
+    products = fetch_cart_products(catalog, items)
+    
+    updated_items = []
+    for item in items:
+        try:
+            if not ObjectId.is_valid(item['product_id']):
+                raise ValueError(f"Invalid product id: {item['product_id']}")
+            
+            product = products.get(str(item['product_id']))
+            if product and product.get('is_active', True):
+                # FIXED: Ensure image has full URL
+                product_image = product.get('image', '/static/uploads/default-product.jpg')
+                if not product_image.startswith('http'):
+                    product_image = get_full_image_url(product_image)
+                
+                updated_items.append({
+                    'id': str(product['_id']),
+                    'product_id': item['product_id'],
+                    'name': product.get('name', 'Unknown Product'),
+                    'price': product.get('price', 0),
+                    'condition': product.get('condition', 'Good'),
+                    'image': product_image,  # Now with full URL
+                    'currentStock': product.get('stock', 0),
+                    'qty': min(item.get('qty', 1), product.get('stock', 0)),
+                    'selected': item.get('selected', False)  # Default to False instead of auto-selecting
+                })
+            else:
+                # Product not found or inactive
+                updated_items.append({
+                    'id': item.get('product_id', ''),
+                    'product_id': item.get('product_id', ''),
+                    'name': item.get('name', 'Product No Longer Available'),
+                    'price': item.get('price', 0),
+                    'condition': 'Unavailable',
+                    'image': get_full_image_url('/static/uploads/default-product.jpg'),  # Full URL
+                    'currentStock': 0,
+                    'qty': item.get('qty', 1),
+                    'selected': False  # Always false for unavailable products
+                })
+        except Exception as e:
+            logger.warning("Error processing cart item: %s", e)
+            continue
+    
+    return updated_items
+
 @bp.route('/<user_id>', methods=['GET', 'OPTIONS'])
 def get_user_cart(user_id):
     """Get user's cart from database"""
@@ -49,44 +112,8 @@ def get_user_cart(user_id):
             result = db.carts.insert_one(cart_data)
             cart = db.carts.find_one({'_id': result.inserted_id})
         
-        # Get current product information for cart items
-        updated_items = []
-        for item in cart.get('items', []):
-            try:
-                product = db.products.find_one({'_id': ObjectId(item['product_id'])})
-                if product and product.get('is_active', True):
-                    # FIXED: Ensure image has full URL
-                    product_image = product.get('image', '/static/uploads/default-product.jpg')
-                    if not product_image.startswith('http'):
-                        product_image = get_full_image_url(product_image)
-                    
-                    updated_items.append({
-                        'id': str(product['_id']),
-                        'product_id': item['product_id'],
-                        'name': product.get('name', 'Unknown Product'),
-                        'price': product.get('price', 0),
-                        'condition': product.get('condition', 'Good'),
-                        'image': product_image,  # Now with full URL
-                        'currentStock': product.get('stock', 0),
-                        'qty': min(item.get('qty', 1), product.get('stock', 0)),
-                        'selected': item.get('selected', False)  # Default to False instead of auto-selecting
-                    })
-                else:
-                    # Product not found or inactive
-                    updated_items.append({
-                        'id': item.get('product_id', ''),
-                        'product_id': item.get('product_id', ''),
-                        'name': item.get('name', 'Product No Longer Available'),
-                        'price': item.get('price', 0),
-                        'condition': 'Unavailable',
-                        'image': get_full_image_url('/static/uploads/default-product.jpg'),  # Full URL
-                        'currentStock': 0,
-                        'qty': item.get('qty', 1),
-                        'selected': False  # Always false for unavailable products
-                    })
-            except Exception as e:
-                print(f"Error processing cart item: {e}")
-                continue
+        # Get current product information for cart items (cached, one query for misses)
+        updated_items = hydrate_cart_items(current_app.catalog, cart.get('items', []))
         
         return jsonify({
             'success': True,
@@ -94,7 +121,7 @@ def get_user_cart(user_id):
         }), 200
         
     except Exception as e:
-        print(f"❌ Error getting user cart: {str(e)}")
+        logger.error("Error getting user cart: %s", e)
         return jsonify({
             'success': False,
             'error': str(e),
@@ -186,7 +213,7 @@ def add_to_cart(user_id):
         }), 200
         
     except Exception as e:
-        print(f"❌ Error adding to cart: {str(e)}")
+        logger.error("Error adding to cart: %s", e)
         return jsonify({
             'success': False,
             'error': str(e)
@@ -246,7 +273,7 @@ def update_cart_item(user_id):
         }), 200
         
     except Exception as e:
-        print(f"❌ Error updating cart: {str(e)}")
+        logger.error("Error updating cart: %s", e)
         return jsonify({
             'success': False,
             'error': str(e)
@@ -281,7 +308,7 @@ def remove_from_cart(user_id):
         }), 200
         
     except Exception as e:
-        print(f"❌ Error removing from cart: {str(e)}")
+        logger.error("Error removing from cart: %s", e)
         return jsonify({
             'success': False,
             'error': str(e)
@@ -309,7 +336,7 @@ def clear_cart(user_id):
         }), 200
         
     except Exception as e:
-        print(f"❌ Error clearing cart: {str(e)}")
+        logger.error("Error clearing cart: %s", e)
         return jsonify({
             'success': False,
             'error': str(e)
@@ -344,7 +371,7 @@ def clear_cart_with_body():
         }), 200
         
     except Exception as e:
-        print(f"❌ Error clearing cart: {str(e)}")
+        logger.error("Error clearing cart: %s", e)
         return jsonify({
             'success': False,
             'error': str(e)
@@ -398,7 +425,7 @@ def sync_cart():
         )
         
         if result.modified_count:
-            print(f"✅ Cart synced for user: {user_id}")
+            logger.debug("Cart synced for user: %s", user_id)
             return jsonify({
                 'success': True,
                 'message': 'Cart synced successfully'
@@ -410,7 +437,7 @@ def sync_cart():
             }), 500
         
     except Exception as e:
-        print(f"❌ Error syncing cart: {str(e)}")
+        logger.error("Error syncing cart: %s", e)
         return jsonify({
             'success': False,
             'error': str(e)
@@ -505,7 +532,7 @@ def add_to_cart_alt():
         }), 200
         
     except Exception as e:
-        print(f"❌ Error adding to cart: {str(e)}")
+        logger.error("Error adding to cart: %s", e)
         return jsonify({
             'success': False,
             'error': str(e)
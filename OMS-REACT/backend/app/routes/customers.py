@@ -2,12 +2,7 @@ from flask import Blueprint, request, jsonify
 from bson import ObjectId
 from bson.json_util import dumps
 import json
-
-# Helper function to convert ObjectId to string
-def serialize_doc(doc):
-    if doc and '_id' in doc:
-        doc['_id'] = str(doc['_id'])
-    return doc
+from ..pagination import wants_pagination, InvalidCursor
 
 bp = Blueprint('customers', __name__, url_prefix='/api/customers')
 
@@ -21,16 +16,29 @@ def get_customers():
     """Get all customers"""
     try:
         customer_model = get_customer_model()
-        customers = customer_model.get_all_customers()
         
-        # Convert ObjectId to string for JSON serialization
-        serialized_customers = [serialize_doc(customer) for customer in customers]
+        query = {}
+        if request.args.get('status'):
+            query['status'] = request.args['status']
+        
+        next_cursor = None
+        if wants_pagination(request.args):
+            customers, next_cursor = customer_model.get_customers_page(query, request.args)
+        else:
+            customers = customer_model.get_all_customers(query)
         
         return jsonify({
             'status': 'success',
-            'data': serialized_customers,
-            'count': len(serialized_customers)
+            'data': customers,
+            'count': len(customers),
+            'nextCursor': next_cursor,
+            'hasMore': next_cursor is not None
         })
+    except InvalidCursor as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'status': 'error',
@@ -52,7 +60,7 @@ def get_customer(customer_id):
         
         return jsonify({
             'status': 'success',
-            'data': serialize_doc(customer)
+            'data': customer
         })
     except Exception as e:
         return jsonify({
@@ -98,7 +106,7 @@ def create_customer():
         return jsonify({
             'status': 'success',
             'message': 'Customer created successfully',
-            'data': serialize_doc(new_customer)
+            'data': new_customer
         }), 201
         
     except Exception as e:
@@ -143,7 +151,7 @@ def update_customer(customer_id):
             return jsonify({
                 'status': 'success',
                 'message': 'Customer updated successfully',
-                'data': serialize_doc(updated_customer)
+                'data': updated_customer
             })
         else:
             return jsonify({
@@ -197,12 +205,10 @@ def search_customers(query):
         customer_model = get_customer_model()
         customers = customer_model.search_customers(query)
         
-        serialized_customers = [serialize_doc(customer) for customer in customers]
-        
         return jsonify({
             'status': 'success',
-            'data': serialized_customers,
-            'count': len(serialized_customers)
+            'data': customers,
+            'count': len(customers)
         })
     except Exception as e:
         return jsonify({
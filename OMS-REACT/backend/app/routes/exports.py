@@ -0,0 +1,146 @@
+import csv
+import io
+import os
+import zlib
+from datetime import datetime, timezone
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
+from ..log import get_logger
+from ..serialization import default
+from .orders import build_order_filters
+
+logger = get_logger(__name__)
+
+bp = Blueprint('exports', __name__, url_prefix='/api/admin/export')
+
+# Documents per getMore; memory stays at roughly one batch whatever the total
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', 1000))
+
+# Bytes gathered before a chunk is handed to the server
+CHUNK_SIZE = 64 * 1024
+
+# Columns written for ?format=csv; NDJSON always carries the whole document
+EXPORTS = {
+    'orders': {
+        'filters': build_order_filters,
+        'columns': ['_id', 'orderNumber', 'userId', 'status', 'subtotal', 'shippingFee', 'total',
+                    'paymentMethod', 'shippingRegion', 'itemCount', 'orderDate', 'createdAt', 'updatedAt'],
+        # Units, not lines: order items carry their quantity in `qty`
+        'row': lambda doc: {**doc, 'itemCount': sum(item.get('qty', 0) for item in doc.get('items', []))}
+    },
+    'products': {
+        'filters': lambda args: {'category': args['category']} if args.get('category') else {},
+        'columns': ['_id', 'product_id', 'name', 'category', 'price', 'stock', 'condition', 'size',
+                    'material', 'is_active', 'image', 'created_at', 'updated_at'],
+    },
+    # The same accounts as the admin customers listing (users, ?role=admin|customer)
+    'customers': {
+        'collection': 'users',
+        'projection': {'password': 0},
+        'filters': lambda args: _role_filter(args.get('role')),
+        'columns': ['_id', 'user_id', 'username', 'email', 'firstName', 'lastName', 'phone',
+                    'role', 'isActive', 'created_at'],
+        'row': lambda doc: {**doc, 'role': 'admin' if doc.get('isAdmin') else 'customer'}
+    },
+}
+
+def _role_filter(role):
+    if role == 'admin':
+        return {'isAdmin': True}
+    if role == 'customer':
+        return {'isAdmin': {'$ne': True}}
+    return {}
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, (str, int, float)):
+        return value
+    if isinstance(value, (dict, list)):
+        return current_app.json.dumps(value)
+    return default(value)
+
+def _ndjson_chunks(cursor):
+    dumpb = current_app.json.dumpb
+    buffer = bytearray()
+    for doc in cursor:
+        buffer += dumpb(doc)
+        buffer += b'\n'
+        if len(buffer) >= CHUNK_SIZE:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+def _csv_chunks(cursor, columns, to_row):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for doc in cursor:
+        row = to_row(doc) if to_row else doc
+        writer.writerow([_csv_value(row.get(column)) for column in columns])
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+def _gzipped(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)   # wbits 31 = gzip container
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+def _counted(chunks, kind, fmt):
+    sent = 0
+    try:
+        for chunk in chunks:
+            sent += len(chunk)
+            yield chunk
+    finally:
+        logger.info("Export of %s as %s ended after %d bytes", kind, fmt, sent)
+
+@bp.route('/<kind>', methods=['GET'])
+def export(kind):
+    """Stream a collection as NDJSON or CSV (?format=, ?gzip=true, plus filters)"""
+    spec = EXPORTS.get(kind)
+    if spec is None:
+        return jsonify({'success': False, 'error': f'Unknown export: {kind}'}), 404
+
+    fmt = request.args.get('format', 'ndjson').lower()
+    if fmt not in FORMATS:
+        return jsonify({'success': False, 'error': f"format must be one of {', '.join(FORMATS)}"}), 400
+    compress = request.args.get('gzip', 'false').lower() in ('1', 'true', 'yes')
+
+    query = spec['filters'](request.args)
+
+    # _id order walks the default index, so the server never sorts in memory
+    collection = current_app.db[spec.get('collection', kind)]
+    cursor = collection.find(query, spec.get('projection')).sort('_id', 1).batch_size(EXPORT_BATCH_SIZE)
+
+    if fmt == 'csv':
+        chunks = _csv_chunks(cursor, spec['columns'], spec.get('row'))
+    else:
+        chunks = _ndjson_chunks(cursor)
+
+    filename = f"{kind}-{datetime.now(timezone.utc):%Y%m%d-%H%M%S}.{fmt}"
+    mimetype = FORMATS[fmt]
+    if compress:
+        chunks = _gzipped(chunks)
+        filename += '.gz'
+        mimetype = 'application/gzip'
+
+    logger.info("Exporting %s as %s%s", kind, fmt, ' (gzip)' if compress else '')
+    response = Response(stream_with_context(_counted(chunks, kind, fmt)), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['Cache-Control'] = 'no-store'
+    # Tell nginx-style proxies to pass chunks through instead of buffering the whole file
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
@@ -1,11 +1,19 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from bson import ObjectId
-import json
+from pymongo import ReturnDocument
 from datetime import datetime
-import base64
 import os
+from werkzeug.datastructures import FileStorage
+from ..stock import check_stock, reserve_stock, InsufficientStock
+from ..pagination import paginate, wants_pagination, date_range_filter, InvalidCursor
+from ..stats import record_order_change
+from ..metrics import record_upload
+from ..uploads import UploadRejected, decode_data_url, save_image_upload
+from ..idempotency import idempotent
+from ..log import get_logger
 
 bp = Blueprint('orders', __name__, url_prefix='/api/orders')
+logger = get_logger(__name__)
 
 # Shipping fee configuration by region
 SHIPPING_FEES = {
@@ -50,12 +58,22 @@ SHIPPING_FEES = {
     }
 }
 
-# JSON encoder to handle ObjectId
-class JSONEncoder(json.JSONEncoder):
-    def default(self, o):
-        if isinstance(o, ObjectId):
-            return str(o)
-        return json.JSONEncoder.default(self, o)
+# Newest first; _id breaks ties so every page boundary is unique
+ORDER_SORT = [('createdAt', -1), ('_id', -1)]
+
+# Largest receipt photo accepted (decoded size), and the data URL types allowed
+RECEIPT_MAX_BYTES = int(os.getenv('RECEIPT_MAX_BYTES', 10 * 1024 * 1024))
+RECEIPT_IMAGE_TYPES = {'image/jpeg', 'image/jpg', 'image/png', 'image/gif', 'image/webp'}
+
+def build_order_filters(args):
+    """Translate ?status=&userId=&from=&to= into a Mongo query"""
+    query = {}
+    if args.get('status'):
+        query['status'] = args['status']
+    if args.get('userId'):
+        query['userId'] = args['userId']
+    query.update(date_range_filter('createdAt', args))
+    return query
 
 # Helper function to get full image URL
 def get_full_image_url(image_path):
@@ -102,59 +120,55 @@ def calculate_shipping():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @bp.route('/', methods=['GET', 'POST', 'OPTIONS'])
+@idempotent
 def orders():
     if request.method == 'OPTIONS':
         return '', 200
         
     if request.method == 'POST':
         try:
-            print("📦 Received order request")
+            logger.debug("Received order request")
             data = request.get_json()
-            print(f"📋 Order data received: {data}")
+            logger.debug("Order data received: %s", data)
             
             # Validate required fields
             required_fields = ['userId', 'items', 'total', 'paymentMethod', 'shippingAddress']
             for field in required_fields:
                 if field not in data:
-                    print(f"❌ Missing required field: {field}")
+                    logger.warning("Missing required field: %s", field)
                     return jsonify({'success': False, 'error': f'Missing required field: {field}'}), 400
             
-            print("✅ All required fields present")
+            logger.debug("All required fields present")
             
             # Get database
             from .. import get_db
             db = get_db()
             if db is None:
-                print("❌ Database connection failed")
+                logger.error("Database connection failed")
                 return jsonify({'success': False, 'error': 'Database connection failed'}), 500
             
-            print("✅ Database connected successfully")
+            logger.debug("Database connected successfully")
             
-            # Check stock availability (but don't deduct yet)
-            for item in data['items']:
-                product = db.products.find_one({'_id': ObjectId(item['id'])})
-                if not product:
-                    return jsonify({
-                        'success': False, 
-                        'error': f"Product not found: {item.get('name', 'Unknown')}"
-                    }), 404
-                
-                if product['stock'] < item['qty']:
-                    return jsonify({
-                        'success': False,
-                        'error': f"Insufficient stock for {product['name']}. Available: {product['stock']}, Requested: {item['qty']}"
-                    }), 400
+            # Check stock availability for every line in one query (but don't deduct yet)
+            stock_lines = check_stock(db, data['items'], catalog=current_app.catalog)
+            failed_line = next((line for line in stock_lines if not line['ok']), None)
+            if failed_line:
+                return jsonify({
+                    'success': False,
+                    'error': failed_line['message'],
+                    'lines': stock_lines
+                }), 404 if not failed_line['found'] else 400
             
             # Calculate shipping fee based on province
             shipping_address = data['shippingAddress']
             province = shipping_address.get('province', '')
             shipping_fee = calculate_shipping_fee(province)
             
-            print(f"📍 Shipping to {province}, fee: ₱{shipping_fee}")
+            logger.debug("Shipping to %s, fee: ₱%s", province, shipping_fee)
             
             # Generate order number and ID
             order_number = f"ORD-{datetime.now().strftime('%Y%m%d')}-{ObjectId()}"
-            print(f"📝 Generated order number: {order_number}")
+            logger.debug("Generated order number: %s", order_number)
             
             # Prepare order data with full image URLs
             order_data = {
@@ -194,11 +208,12 @@ def orders():
                     'category': item.get('category', 'General')
                 })
             
-            print(f"💾 Attempting to save order: {order_data}")
+            logger.debug("Attempting to save order: %s", order_data)
             
             # Insert into database
             result = db.orders.insert_one(order_data)
-            print(f"✅ Order saved successfully with ID: {result.inserted_id}")
+            logger.info("Order saved successfully with ID: %s", result.inserted_id)
+            record_order_change(db, None, order_data)
             
             return jsonify({
                 'success': True,
@@ -209,9 +224,7 @@ def orders():
             }), 201
             
         except Exception as e:
-            print(f"❌ Error creating order: {str(e)}")
-            import traceback
-            print(f"🔍 Stack trace: {traceback.format_exc()}")
+            logger.exception("Error creating order: %s", e)
             return jsonify({'success': False, 'error': str(e)}), 500
     
     elif request.method == 'GET':
@@ -222,21 +235,28 @@ def orders():
             if db is None:
                 return jsonify({'success': False, 'error': 'Database connection failed'}), 500
             
-            orders = list(db.orders.find().sort('createdAt', -1))
+            query = build_order_filters(request.args)
+            next_cursor = None
+            if wants_pagination(request.args):
+                orders, next_cursor = paginate(db.orders, query, ORDER_SORT, request.args)
+            else:
+                orders = list(db.orders.find(query).sort(ORDER_SORT))
             
-            # Convert ObjectId to string and ensure full image URLs
+            # Ensure all items have full image URLs (ObjectIds/dates are encoded by app.json)
             for order in orders:
-                order['_id'] = str(order['_id'])
-                # Ensure all items have full image URLs
                 for item in order.get('items', []):
                     if 'image' in item and not item['image'].startswith('http'):
                         item['image'] = get_full_image_url(item['image'])
             
             return jsonify({
                 'success': True,
-                'orders': orders
+                'orders': orders,
+                'nextCursor': next_cursor,
+                'hasMore': next_cursor is not None
             })
             
+        except InvalidCursor as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
         except Exception as e:
             return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -256,8 +276,6 @@ def order_detail(order_id):
             if not order:
                 return jsonify({'success': False, 'error': 'Order not found'}), 404
             
-            order['_id'] = str(order['_id'])
-            
             # FIXED: Ensure all items have full image URLs
             for item in order.get('items', []):
                 if 'image' in item and not item['image'].startswith('http'):
@@ -267,19 +285,23 @@ def order_detail(order_id):
             
         elif request.method == 'PUT':
             data = request.get_json()
-            result = db.orders.update_one(
+            update_fields = {**data, 'updatedAt': datetime.now()}
+            before = db.orders.find_one_and_update(
                 {'_id': ObjectId(order_id)},
-                {'$set': {**data, 'updatedAt': datetime.now()}}
+                {'$set': update_fields},
+                return_document=ReturnDocument.BEFORE
             )
             
-            if result.modified_count:
+            if before:
+                record_order_change(db, before, {**before, **update_fields})
                 return jsonify({'success': True, 'message': 'Order updated successfully'})
             else:
                 return jsonify({'success': False, 'error': 'Order not found or no changes made'}), 404
                 
         elif request.method == 'DELETE':
-            result = db.orders.delete_one({'_id': ObjectId(order_id)})
-            if result.deleted_count:
+            deleted = db.orders.find_one_and_delete({'_id': ObjectId(order_id)})
+            if deleted:
+                record_order_change(db, deleted, None)
                 return jsonify({'success': True, 'message': 'Order deleted successfully'})
             else:
                 return jsonify({'success': False, 'error': 'Order not found'}), 404
@@ -296,20 +318,18 @@ def get_user_orders(user_id):
         if db is None:
             return jsonify({'success': False, 'error': 'Database connection failed'}), 500
         
-        print(f"🔍 Fetching orders for user: {user_id}")
+        logger.debug("Fetching orders for user: %s", user_id)
         
         # Find orders by user ID
         user_orders = list(db.orders.find({'userId': user_id}).sort('createdAt', -1))
         
-        # Convert ObjectId to string and ensure full image URLs
+        # Ensure all items have full image URLs
         for order in user_orders:
-            order['_id'] = str(order['_id'])
-            # Ensure all items have full image URLs
             for item in order.get('items', []):
                 if 'image' in item and not item['image'].startswith('http'):
                     item['image'] = get_full_image_url(item['image'])
         
-        print(f"✅ Found {len(user_orders)} orders for user: {user_id}")
+        logger.debug("Found %s orders for user: %s", len(user_orders), user_id)
         
         return jsonify({
             'success': True,
@@ -317,21 +337,45 @@ def get_user_orders(user_id):
         })
         
     except Exception as e:
-        print(f"❌ Error fetching user orders: {e}")
+        logger.error("Error fetching user orders: %s", e)
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @bp.route('/<order_id>/confirm-receipt', methods=['PUT'])
 def confirm_order_receipt(order_id):
-    """Customer confirms they received the product with photo proof"""
+    """Customer confirms they received the product with photo proof.
+
+    The photo can be sent as multipart (`proofImage` file + `userId` field),
+    as the raw image body (`Content-Type: image/*`, `?userId=`), or as a
+    base64 data URL in JSON (`{"userId", "proofImage"}`).
+    """
     try:
         from .. import get_db
         db = get_db()
         if db is None:
             return jsonify({'success': False, 'error': 'Database connection failed'}), 500
         
-        data = request.get_json()
-        user_id = data.get('userId')
-        proof_image = data.get('proofImage')  # Base64 encoded image
+        # Refuse oversized bodies before reading any of it; base64 is 4/3 the size
+        body_limit = RECEIPT_MAX_BYTES * 4 // 3 + 4096 if request.is_json else RECEIPT_MAX_BYTES + 64 * 1024
+        if request.content_length is not None and request.content_length > body_limit:
+            return jsonify({
+                'success': False,
+                'error': f'Proof image too large. Maximum {RECEIPT_MAX_BYTES // (1024 * 1024)}MB allowed'
+            }), 413
+        request.max_content_length = body_limit
+        
+        if request.is_json:
+            data = request.get_json()
+            user_id = data.get('userId')
+            proof_image = data.get('proofImage')  # Base64 encoded image
+        elif request.mimetype == 'multipart/form-data':
+            user_id = request.form.get('userId')
+            proof_image = request.files.get('proofImage')
+        elif request.mimetype.startswith('image/'):
+            # Raw body: nothing is read until the order checks below pass
+            user_id = request.args.get('userId')
+            proof_image = request.stream if request.content_length != 0 else None
+        else:
+            return jsonify({'success': False, 'error': 'Send the proof as JSON, multipart/form-data or an image body'}), 415
         
         if not user_id:
             return jsonify({'success': False, 'error': 'User ID is required'}), 400
@@ -348,37 +392,36 @@ def confirm_order_receipt(order_id):
         if order.get('status') != 'shipped':
             return jsonify({'success': False, 'error': 'Order must be shipped before confirming receipt'}), 400
         
-        # Save proof image
-        proof_filename = f"receipt_proof_{order_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
-        proof_path = os.path.join('static/uploads/receipts', proof_filename)
-        
-        # Ensure directory exists
-        os.makedirs(os.path.dirname(proof_path), exist_ok=True)
-        
-        # Decode and save the image
+        # Stream the image into storage in chunks, checking its type first
         try:
-            # Remove data URL prefix if present
-            if ',' in proof_image:
-                proof_image = proof_image.split(',')[1]
-            
-            image_data = base64.b64decode(proof_image)
-            with open(proof_path, 'wb') as f:
-                f.write(image_data)
+            if isinstance(proof_image, str):
+                source = decode_data_url(proof_image, RECEIPT_IMAGE_TYPES)
+            elif isinstance(proof_image, FileStorage):
+                source = proof_image.stream
+            else:
+                source = proof_image
+            stored = save_image_upload(current_app.storage, source, RECEIPT_MAX_BYTES)
+            record_upload('receipt_proof', stored.size)
+        except UploadRejected as e:
+            return jsonify({'success': False, 'error': str(e)}), e.status
         except Exception as e:
             return jsonify({'success': False, 'error': f'Failed to save proof image: {str(e)}'}), 400
         
         # Update order status to 'completed' with proof
-        result = db.orders.update_one(
+        update_fields = {
+            'status': 'completed',
+            'receiptConfirmedAt': datetime.now(),
+            'receiptProof': stored.url,
+            'updatedAt': datetime.now()
+        }
+        before = db.orders.find_one_and_update(
             {'_id': ObjectId(order_id)},
-            {'$set': {
-                'status': 'completed',
-                'receiptConfirmedAt': datetime.now(),
-                'receiptProof': f'/static/uploads/receipts/{proof_filename}',
-                'updatedAt': datetime.now()
-            }}
+            {'$set': update_fields},
+            return_document=ReturnDocument.BEFORE
         )
         
-        if result.modified_count:
+        if before:
+            record_order_change(db, before, {**before, **update_fields})
             return jsonify({
                 'success': True, 
                 'message': 'Order receipt confirmed successfully with proof',
@@ -388,15 +431,16 @@ def confirm_order_receipt(order_id):
             return jsonify({'success': False, 'error': 'Failed to update order status'}), 400
             
     except Exception as e:
-        print(f"❌ Error confirming order receipt: {e}")
+        logger.error("Error confirming order receipt: %s", e)
         return jsonify({'success': False, 'error': str(e)}), 500
 
 # NEW: Payment Proof Upload Endpoint - FIXED: Don't change status to confirmed
 @bp.route('/upload-payment-proof', methods=['POST'])
+@idempotent
 def upload_payment_proof():
     """Handle payment proof image upload - FIXED: Keep status as pending"""
     try:
-        print("📸 Received payment proof upload request")
+        logger.debug("Received payment proof upload request")
         
         # Get form data
         order_id = request.form.get('orderId')
@@ -404,7 +448,7 @@ def upload_payment_proof():
         payment_method = request.form.get('paymentMethod')
         payment_proof = request.files.get('paymentProof')
         
-        print(f"📋 Payment proof data - Order: {order_id}, User: {user_id}")
+        logger.debug("Payment proof data - Order: %s, User: %s", order_id, user_id)
         
         # Validate required fields
         if not all([order_id, user_id, payment_proof]):
@@ -424,37 +468,6 @@ def upload_payment_proof():
         if not order:
             return jsonify({'success': False, 'error': 'Order not found or access denied'}), 404
         
-        # Check if stock has already been deducted for this order
-        if order.get('stock_deducted'):
-            print("⚠️ Stock already deducted for this order, skipping stock deduction")
-        else:
-            # NEW: Deduct stock from products after payment proof is uploaded
-            print("📦 Deducting stock from products after payment verification")
-            for item in order['items']:
-                product = db.products.find_one({'_id': ObjectId(item['id'])})
-                if product:
-                    # Check stock availability again before deducting
-                    if product['stock'] >= item['qty']:
-                        # Deduct the exact quantity ordered by the user
-                        new_stock = product['stock'] - item['qty']
-                        db.products.update_one(
-                            {'_id': ObjectId(item['id'])},
-                            {'$set': {'stock': new_stock}}
-                        )
-                        print(f"✅ Stock deducted for {product['name']}: {product['stock']} -> {new_stock} (-{item['qty']})")
-                    else:
-                        print(f"❌ Insufficient stock for {product['name']}. Available: {product['stock']}, Requested: {item['qty']}")
-                        return jsonify({
-                            'success': False,
-                            'error': f"Insufficient stock for {product['name']}. Available: {product['stock']}, Requested: {item['qty']}"
-                        }), 400
-                else:
-                    print(f"❌ Product not found: {item['id']}")
-                    return jsonify({
-                        'success': False,
-                        'error': f"Product not found: {item.get('name', 'Unknown')}"
-                    }), 404
-        
         # Validate file
         if not payment_proof.filename:
             return jsonify({'success': False, 'error': 'No file selected'}), 400
@@ -476,48 +489,95 @@ def upload_payment_proof():
         if file_size > 5 * 1024 * 1024:
             return jsonify({'success': False, 'error': 'File size too large. Maximum 5MB allowed'}), 400
         
-        # Create payment proofs directory if it doesn't exist
-        payment_proofs_dir = os.path.join('static', 'uploads', 'payment_proofs')
-        os.makedirs(payment_proofs_dir, exist_ok=True)
-        
-        # Generate unique filename
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"payment_proof_{order_id}_{timestamp}.{file_ext}"
-        filepath = os.path.join(payment_proofs_dir, filename)
+        # Claim the stock deduction atomically so concurrent uploads for the
+        # same order can't deduct twice
+        claim = db.orders.update_one(
+            {'_id': ObjectId(order_id), 'stock_deducted': {'$ne': True}},
+            {'$set': {'stock_deducted': True}}
+        )
         
-        # Save the file
-        payment_proof.save(filepath)
-        print(f"✅ Payment proof saved: {filepath}")
+        if not claim.modified_count:
+            logger.warning("Stock already deducted for this order, skipping stock deduction")
+        else:
+            # NEW: Deduct stock from products after payment proof is uploaded
+            logger.debug("Deducting stock from products after payment verification")
+            try:
+                stock_lines = reserve_stock(db, order['items'])
+                current_app.catalog.invalidate_many(line['id'] for line in stock_lines)
+                logger.info("Stock deducted for %s product(s)", len(stock_lines))
+            except InsufficientStock as e:
+                # Nothing was deducted - release the claim so the customer can retry
+                db.orders.update_one(
+                    {'_id': ObjectId(order_id)},
+                    {'$set': {'stock_deducted': False}}
+                )
+                failed_line = next((line for line in e.lines if not line['ok']), None)
+                logger.warning("Stock reservation failed: %s", e)
+                return jsonify({
+                    'success': False,
+                    'error': str(e),
+                    'lines': e.lines
+                }), 404 if failed_line and not failed_line['found'] else 400
+            except Exception:
+                db.orders.update_one(
+                    {'_id': ObjectId(order_id)},
+                    {'$set': {'stock_deducted': False}}
+                )
+                raise
+        
+        # Store the file by content hash (a retried upload reuses the same blob)
+        stored = current_app.storage.save(payment_proof.stream, file_ext)
+        record_upload('payment_proof', stored.size)
+        logger.info("Payment proof saved: %s", stored.url)
         
         # FIXED: Update order with payment proof but KEEP status as 'pending'
         # Only mark stock as deducted and add payment proof
         update_data = {
-            'paymentProof': f'/static/uploads/payment_proofs/{filename}',
+            'paymentProof': stored.url,
             'paymentProofUploadedAt': datetime.now(),
             'status': 'pending',  # FIXED: Keep status as 'pending' - don't change to 'confirmed'
             'updatedAt': datetime.now(),
-            'stock_deducted': True  # Mark that stock has been deducted
+            'stock_deducted': True,  # Mark that stock has been deducted
+            'paymentProofStatus': 'processing'  # Until the payment_proof.process job has checked the image
         }
         
-        result = db.orders.update_one(
+        before = db.orders.find_one_and_update(
             {'_id': ObjectId(order_id)},
-            {'$set': update_data}
+            {'$set': update_data, '$unset': {'paymentProofThumbnail': '', 'paymentProofError': ''}},
+            return_document=ReturnDocument.BEFORE
         )
         
-        if result.modified_count:
-            print(f"✅ Order {order_id} updated with payment proof and stock deducted - STATUS REMAINS PENDING")
+        if before:
+            record_order_change(db, before, {**before, **update_data})
+            logger.info("Order %s updated with payment proof and stock deducted - STATUS REMAINS PENDING", order_id)
+            
+            # Verification, EXIF stripping, thumbnail and admin notification run on the job queue
+            try:
+                current_app.jobs.enqueue('payment_proof.process', {'orderId': order_id, 'url': stored.url})
+            except Exception as e:
+                # The order is already updated; the proof is just left unchecked
+                logger.error("Could not queue payment proof processing for order %s: %s", order_id, e)
+                update_data['paymentProofStatus'] = 'unchecked'
+                try:
+                    # Nothing will ever pick it up, so don't leave it 'processing'
+                    db.orders.update_one(
+                        {'_id': ObjectId(order_id), 'paymentProof': stored.url, 'paymentProofStatus': 'processing'},
+                        {'$set': {'paymentProofStatus': 'unchecked'}}
+                    )
+                except Exception as e:
+                    logger.error("Could not mark payment proof for order %s unchecked: %s", order_id, e)
+            
             return jsonify({
                 'success': True,
                 'message': 'Payment proof uploaded successfully and stock deducted. Order remains pending for admin confirmation.',
-                'proofPath': f'/static/uploads/payment_proofs/{filename}'
+                'proofPath': stored.url,
+                'proofStatus': update_data['paymentProofStatus']
             })
         else:
             return jsonify({'success': False, 'error': 'Failed to update order with payment proof'}), 500
             
     except Exception as e:
-        print(f"❌ Error uploading payment proof: {str(e)}")
-        import traceback
-        print(f"🔍 Stack trace: {traceback.format_exc()}")
+        logger.exception("Error uploading payment proof: %s", e)
         return jsonify({'success': False, 'error': str(e)}), 500
 
 def get_shipping_region(province):
@@ -1,11 +1,19 @@
-from flask import Blueprint, request, jsonify, send_from_directory, current_app
+from flask import Blueprint, request, jsonify, current_app
 from bson import ObjectId
 from datetime import datetime
 import os
 from werkzeug.utils import secure_filename
 import json
+from ..pagination import paginate, wants_pagination, InvalidCursor
+from ..counters import PRODUCT_IDS
+from ..images import srcset
+from ..importer import IMPORT_MAX_BYTES, ImageArchive, ImportFormatError, detect_format, import_products, iter_rows
+from ..metrics import record_upload
+from ..serving import send_static
+from ..log import get_logger
 
 bp = Blueprint('products', __name__, url_prefix='/api/products')
+logger = get_logger(__name__)
 
 # Add OPTIONS handler for all product routes
 @bp.before_request
@@ -19,6 +27,13 @@ def handle_options():
         return response
 
 # ---------------- Helper ----------------
+def save_image(image):
+    """Store an uploaded product image by content hash; identical files share one blob"""
+    extension = os.path.splitext(secure_filename(image.filename))[1]
+    stored = current_app.storage.save(image.stream, extension)
+    record_upload('product_image', stored.size)
+    return stored
+
 def allowed_file(filename):
     if not filename:
         return False
@@ -50,8 +65,15 @@ def serialize_doc(doc):
     elif not doc['image'].startswith('http'):
         doc['image'] = get_full_image_url(doc['image'])
     
+    # Resized/WebP copies once the background job has built them (app/images.py)
+    if 'image_variants' in doc or 'imageSrcset' not in doc:
+        doc['imageSrcset'] = srcset(doc.pop('image_variants', None), get_full_image_url)
+    
     return doc
 
+# Newest first; _id breaks ties so every page boundary is unique
+PRODUCT_SORT = [('created_at', -1), ('_id', -1)]
+
 # ---------------- Product Model ----------------
 class ProductModel:
     def __init__(self, db):
@@ -86,51 +108,84 @@ def get_db():
 # ---------------- Routes ----------------
 @bp.route('/static/uploads/<path:filename>')
 def uploaded_file(filename):
-    """Serve uploaded files."""
-    upload_folder = current_app.config['UPLOAD_FOLDER']
-    return send_from_directory(upload_folder, filename)
+    """Serve uploaded files (same as /static/uploads/ on the app)."""
+    return send_static(current_app.config['UPLOAD_FOLDER'], filename, 'uploads')
 
 @bp.route('/', methods=['GET'])
 def get_products():
-    """Get all active products."""
+    """Get all active products, optionally one page at a time (?limit=&cursor=)."""
     try:
         db = get_db()
-        model = ProductModel(db)
-        products = [serialize_doc(p) for p in model.all()]
+
+        query = {'is_active': True}
+        if request.args.get('category'):
+            query['category'] = request.args['category']
+
+        if wants_pagination(request.args):
+            page, next_cursor = paginate(db.products, query, PRODUCT_SORT, request.args)
+            return jsonify({
+                'products': [serialize_doc(p) for p in page],
+                'nextCursor': next_cursor,
+                'hasMore': next_cursor is not None
+            })
+
+        products = current_app.catalog.all_active()
+        if 'category' in query:
+            products = [p for p in products if p.get('category') == query['category']]
         return jsonify({'products': products})
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error("Error getting products: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/search', methods=['GET'])
+def search_products():
+    """Ranked product search (?q=), with prefix matching on the last word"""
+    try:
+        query = request.args.get('q', '').strip()
+        if not query:
+            return jsonify({'products': [], 'count': 0})
+
+        try:
+            limit = max(1, min(int(request.args.get('limit', 20)), 100))
+        except ValueError:
+            limit = 20
+
+        results = current_app.search.search(query, limit=limit)
+        return jsonify({'products': results, 'count': len(results)})
+    except Exception as e:
+        logger.error("Error searching products: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/autocomplete', methods=['GET'])
+def autocomplete_products():
+    """Product name suggestions for search-as-you-type (?q=)"""
+    try:
+        query = request.args.get('q', '').strip()
+        suggestions = current_app.search.suggest(query) if query else []
+        return jsonify({'suggestions': suggestions})
     except Exception as e:
-        print(f"❌ Error getting products: {str(e)}")
+        logger.error("Error in autocomplete: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @bp.route('/<product_id>', methods=['GET'])
 def get_product(product_id):
     """Get single product by ID"""
     try:
-        db = get_db()
-        model = ProductModel(db)
-        product = model.get_by_id(product_id)
+        product = current_app.catalog.get(product_id)
         
         if not product:
             return jsonify({'error': 'Product not found'}), 404
             
-        return jsonify({'product': serialize_doc(product)}), 200
+        return jsonify({'product': product}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 # ✅ Helper: Generate professional product ID
 def generate_product_id(db):
-    """Generate formatted product ID like PROD-000001"""
-    last_product = db.products.find_one(
-        {"product_id": {"$regex": "^PROD-"}},
-        sort=[("product_id", -1)]
-    )
-    next_id = 1
-    if last_product and "product_id" in last_product:
-        try:
-            next_id = int(last_product["product_id"].split("-")[1]) + 1
-        except Exception as e:
-            print(f"⚠️ Product ID parse error: {e}")
-    return f"PROD-{next_id:06d}"
+    """Generate formatted product ID like PROD-000001 from an atomic counter"""
+    return f"PROD-{PRODUCT_IDS.next(db):06d}"
 
 @bp.route('/', methods=['POST'])
 def create_product():
@@ -157,42 +212,19 @@ def create_product():
         if not all([name, category, price, stock]):
             return jsonify({'error': 'Missing required fields: name, category, price, stock'}), 400
 
-        # Handle image upload - FIXED PATH ISSUE
-        image_filename = None
+        # Handle image upload - stored by content hash (app/storage.py)
+        image_url = "/static/uploads/default-product.jpg"  # Changed to relative path
         if image and image.filename:
             if allowed_file(image.filename):
-                # Generate unique filename with timestamp
-                timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S_%f')
-                original_name = secure_filename(image.filename)
-                name_without_ext = os.path.splitext(original_name)[0]
-                extension = os.path.splitext(original_name)[1]
-                unique_filename = f"{name_without_ext}_{timestamp}{extension}"
-                
-                # Use app config for upload folder - FIXED: Use absolute path
-                upload_folder = os.path.join(current_app.root_path, current_app.config['UPLOAD_FOLDER'])
-                save_path = os.path.join(upload_folder, unique_filename)
-                
-                # Ensure directory exists
-                os.makedirs(upload_folder, exist_ok=True)
-                
-                # Save the file
-                image.save(save_path)
-                image_filename = unique_filename
-                print(f"✅ Image saved: {save_path}")
-                print(f"📁 Upload folder: {upload_folder}")
-                print(f"🌐 Image will be served from: /static/uploads/{unique_filename}")
+                stored = save_image(image)
+                image_url = stored.url
+                logger.debug("Image stored: %s", image_url)
             else:
                 return jsonify({'error': 'Invalid file type. Allowed: png, jpg, jpeg, gif'}), 400
 
         # ✅ Generate new formatted product ID
         product_id = generate_product_id(db)
 
-        # Create image URL - FIXED: Use relative path for serving
-        if image_filename:
-            image_url = f"/static/uploads/{image_filename}"  # Changed to relative path
-        else:
-            image_url = "/static/uploads/default-product.jpg"  # Changed to relative path
-
         # Create product data
         data = {
             'product_id': product_id,
@@ -212,8 +244,10 @@ def create_product():
 
         # Insert into database
         inserted_id = model.create(data)
-        print(f"✅ Product added: {product_id} - {name}")
-        print(f"📸 Image URL stored: {image_url}")
+        current_app.catalog.invalidate(inserted_id)
+        current_app.images.submit(inserted_id, image_url)
+        logger.info("Product added: %s - %s", product_id, name)
+        logger.debug("Image URL stored: %s", image_url)
         
         # Return the created product with full URL
         created_product = model.get_by_id(inserted_id)
@@ -227,9 +261,43 @@ def create_product():
         }), 201
 
     except Exception as e:
-        print(f"❌ Error creating product: {str(e)}")
+        logger.error("Error creating product: %s", e)
         return jsonify({'error': f'Failed to create product: {str(e)}'}), 500
 
+@bp.route('/import', methods=['POST'])
+def import_products_route():
+    """Bulk-create products from a CSV/NDJSON `file` (+ optional `images` zip)"""
+    # Consignment files with their images are far bigger than a single upload
+    request.max_content_length = IMPORT_MAX_BYTES
+    images = None
+    try:
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            return jsonify({'error': 'No file provided (multipart field "file")'}), 400
+        fmt = detect_format(upload.filename, request.args.get('format'))
+        dry_run = request.args.get('dryRun', 'false').lower() == 'true'
+
+        archive = request.files.get('images')
+        if archive and archive.filename:
+            images = ImageArchive(archive.stream, current_app.storage)
+
+        report = import_products(get_db(), iter_rows(upload.stream, fmt), images=images,
+                                 variants=current_app.images, dry_run=dry_run)
+        if report.inserted:
+            current_app.catalog.invalidate()
+
+        status = 200 if dry_run or report.inserted or not report.failed else 422
+        return jsonify({'success': report.failed == 0, **report.to_dict()}), status
+
+    except ImportFormatError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.exception("Error importing products: %s", e)
+        return jsonify({'error': f'Failed to import products: {str(e)}'}), 500
+    finally:
+        if images is not None:
+            images.close()
+
 @bp.route('/<pid>', methods=['PUT'])
 def update_product(pid):
     """Update an existing product."""
@@ -245,28 +313,19 @@ def update_product(pid):
         data = request.form.to_dict()
         image = request.files.get('image')
 
-        # Handle image update - FIXED PATH ISSUE
+        # Handle image update - stored by content hash (app/storage.py)
         if image and image.filename and allowed_file(image.filename):
-            upload_folder = os.path.join(current_app.root_path, current_app.config['UPLOAD_FOLDER'])
-            
-            # Generate unique filename with timestamp
-            timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S_%f')
-            original_name = secure_filename(image.filename)
-            name_without_ext = os.path.splitext(original_name)[0]
-            extension = os.path.splitext(original_name)[1]
-            unique_filename = f"{name_without_ext}_{timestamp}{extension}"
-            save_path = os.path.join(upload_folder, unique_filename)
-            
-            # Ensure directory exists
-            os.makedirs(upload_folder, exist_ok=True)
-            
-            # Save the file
-            image.save(save_path)
-            data['image'] = f'/static/uploads/{unique_filename}'  # Store relative path
-            print(f"✅ Updated image saved: {save_path}")
+            stored = save_image(image)
+            if stored.url != existing_product.get('image'):
+                data['image'] = stored.url
+                data['image_variants'] = None  # Rebuilt for the new image below
+            logger.debug("Updated image stored: %s", stored.url)
 
         data['updated_at'] = datetime.utcnow()
         success = model.update(pid, data)
+        current_app.catalog.invalidate(pid)
+        if success and 'image_variants' in data:
+            current_app.images.submit(pid, data['image'])
         
         if success:
             updated_product = model.get_by_id(pid)
@@ -279,7 +338,7 @@ def update_product(pid):
             return jsonify({'message': 'No changes made'})
 
     except Exception as e:
-        print(f"❌ Error updating product: {str(e)}")
+        logger.error("Error updating product: %s", e)
         return jsonify({'error': f'Failed to update product: {str(e)}'}), 500
 
 @bp.route('/<pid>', methods=['DELETE'])
@@ -289,6 +348,7 @@ def delete_product(pid):
         db = get_db()
         model = ProductModel(db)
         success = model.delete(pid)
+        current_app.catalog.invalidate(pid)
         
         if success:
             return jsonify({
@@ -299,7 +359,7 @@ def delete_product(pid):
             return jsonify({'error': 'Product not found'}), 404
             
     except Exception as e:
-        print(f"❌ Error deleting product: {str(e)}")
+        logger.error("Error deleting product: %s", e)
         return jsonify({'error': f'Failed to delete product: {str(e)}'}), 500
 
 @bp.route('/check-stock/<product_id>', methods=['POST', 'OPTIONS'])
@@ -314,14 +374,11 @@ def check_product_stock(product_id):
         return response
         
     try:
-        db = get_db()
-        model = ProductModel(db)
-        
         data = request.get_json()
         quantity = data.get('quantity', 1)
         
         # Get current product stock
-        product = model.get_by_id(product_id)
+        product = current_app.catalog.get(product_id)
         if not product:
             return jsonify({
                 'available': False,
@@ -393,9 +450,10 @@ def update_product_stock(product_id):
             {'_id': ObjectId(product_id)},
             {'$set': {'stock': int(new_stock)}}
         )
+        current_app.catalog.invalidate(product_id)
         
         if result.modified_count:
-            print(f"✅ Stock updated for {product['name']}: {new_stock}")
+            logger.info("Stock updated for %s: %s", product['name'], new_stock)
             response = jsonify({
                 'success': True,
                 'message': f'Stock updated successfully for {product["name"]}',
@@ -413,7 +471,7 @@ def update_product_stock(product_id):
             return response, 500
         
     except Exception as e:
-        print(f"❌ Error updating stock: {str(e)}")
+        logger.error("Error updating stock: %s", e)
         response = jsonify({
             'success': False,
             'message': f'Error updating stock: {str(e)}'
@@ -1,8 +1,10 @@
 from flask import Blueprint, jsonify, request
 import datetime
 from bson import ObjectId
+from ..log import get_logger
 
 bp = Blueprint('users', __name__, url_prefix='/api/users')
+logger = get_logger(__name__)
 
 @bp.route('/')
 def get_users():
@@ -36,7 +38,7 @@ def get_user_profile(user_id):
     try:
         from flask import current_app
         
-        print(f"🔍 Fetching profile for user: {user_id}")
+        logger.debug("Fetching profile for user: %s", user_id)
         
         # Find user by username or user_id
         user = current_app.db.users.find_one({
@@ -48,18 +50,17 @@ def get_user_profile(user_id):
         })
         
         if not user:
-            print(f"❌ User not found: {user_id}")
+            logger.warning("User not found: %s", user_id)
             return jsonify({"error": "User not found"}), 404
         
         # Prepare user data (exclude password)
-        user['_id'] = str(user['_id'])
         user_data = {k: v for k, v in user.items() if k != 'password'}
         
-        print(f"✅ Profile found for: {user_data.get('username')}")
+        logger.debug("Profile found for: %s", user_data.get('username'))
         return jsonify({"user": user_data})
         
     except Exception as e:
-        print(f"❌ Error fetching user profile: {e}")
+        logger.error("Error fetching user profile: %s", e)
         return jsonify({"error": "Server error"}), 500
 
 # -----------------------------------------------------
@@ -71,8 +72,8 @@ def update_user_profile(user_id):
         from flask import current_app
         
         data = request.get_json()
-        print(f"📝 Updating profile for user: {user_id}")
-        print(f"📦 Update data: {data}")
+        logger.debug("Updating profile for user: %s", user_id)
+        logger.debug("Update data: %s", data)
         
         # Find user by username or user_id
         user = current_app.db.users.find_one({
@@ -84,7 +85,7 @@ def update_user_profile(user_id):
         })
         
         if not user:
-            print(f"❌ User not found: {user_id}")
+            logger.warning("User not found: %s", user_id)
             return jsonify({"error": "User not found"}), 404
         
         # Update fields that are provided in the request
@@ -115,11 +116,10 @@ def update_user_profile(user_id):
         )
         
         if result.modified_count > 0:
-            print(f"✅ Profile updated for: {user_id}")
+            logger.info("Profile updated for: %s", user_id)
             
             # Fetch updated user data
             updated_user = current_app.db.users.find_one({'_id': user['_id']})
-            updated_user['_id'] = str(updated_user['_id'])
             user_data = {k: v for k, v in updated_user.items() if k != 'password'}
             
             return jsonify({
@@ -127,11 +127,11 @@ def update_user_profile(user_id):
                 "user": user_data
             })
         else:
-            print(f"ℹ️ No changes made for: {user_id}")
+            logger.debug("No changes made for: %s", user_id)
             return jsonify({"message": "No changes made"})
             
     except Exception as e:
-        print(f"❌ Error updating user profile: {e}")
+        logger.error("Error updating user profile: %s", e)
         return jsonify({"error": "Server error"}), 500
 
 # -----------------------------------------------------
@@ -143,8 +143,8 @@ def update_user_address(user_id):
         from flask import current_app
         
         data = request.get_json()
-        print(f"🏠 Updating address for user: {user_id}")
-        print(f"📦 Address data: {data}")
+        logger.debug("Updating address for user: %s", user_id)
+        logger.debug("Address data: %s", data)
         
         # Find user by username or user_id
         user = current_app.db.users.find_one({
@@ -156,7 +156,7 @@ def update_user_address(user_id):
         })
         
         if not user:
-            print(f"❌ User not found: {user_id}")
+            logger.warning("User not found: %s", user_id)
             return jsonify({"error": "User not found"}), 404
         
         # Update address
@@ -166,14 +166,14 @@ def update_user_address(user_id):
         )
         
         if result.modified_count > 0:
-            print(f"✅ Address updated for: {user_id}")
+            logger.info("Address updated for: %s", user_id)
             return jsonify({"message": "Address updated successfully"})
         else:
-            print(f"ℹ️ No address changes for: {user_id}")
+            logger.debug("No address changes for: %s", user_id)
             return jsonify({"message": "No changes made"})
             
     except Exception as e:
-        print(f"❌ Error updating user address: {e}")
+        logger.error("Error updating user address: %s", e)
         return jsonify({"error": "Server error"}), 500
 
 
@@ -188,7 +188,7 @@ def update_user_phone():
         username = data.get('username')
         new_phone = data.get('phone')
 
-        print(f"📱 Phone update request for user: {username} -> {new_phone}")
+        logger.debug("Phone update request for user: %s -> %s", username, new_phone)
 
         # Validate
         if not username or not new_phone:
@@ -209,12 +209,12 @@ def update_user_phone():
         )
 
         if result.modified_count > 0:
-            print(f"✅ Phone updated successfully for {username}")
+            logger.info("Phone updated successfully for %s", username)
             return jsonify({"message": "Phone number updated successfully"})
         else:
-            print(f"ℹ️ No change made (same phone number) for {username}")
+            logger.debug("No change made (same phone number) for %s", username)
             return jsonify({"message": "No change made"})
 
     except Exception as e:
-        print(f"❌ Error updating phone number: {e}")
+        logger.error("Error updating phone number: %s", e)
         return jsonify({"error": "Server error"}), 500
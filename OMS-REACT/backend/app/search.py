@@ -0,0 +1,216 @@
+import bisect
+import heapq
+import math
+import re
+import threading
+import time
+from .models.product import TEXT_INDEX_WEIGHTS
+
+# Relevance weight per product field; the same weights as the Mongo text index
+FIELD_WEIGHTS = TEXT_INDEX_WEIGHTS
+
+# Score multiplier for a prefix match (e.g. "jack" -> "jacket") vs an exact term
+PREFIX_WEIGHT = 0.6
+
+# Cap on vocabulary terms a single prefix may expand to
+MAX_PREFIX_EXPANSION = 64
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+def tokenize(text):
+    """Lowercase alphanumeric tokens"""
+    if not text:
+        return []
+    return TOKEN_PATTERN.findall(str(text).lower())
+
+class SearchIndex:
+    """In-process inverted index over the active product catalog.
+
+    Built from the catalog cache and kept current through its invalidation
+    callbacks: changed products are re-indexed lazily on the next query,
+    so a stock update never triggers a full rebuild. Without a change
+    stream other workers' writes never reach those callbacks, so in TTL
+    mode the index is also rebuilt once it's older than the catalog TTL.
+    """
+
+    def __init__(self, catalog):
+        self._catalog = catalog
+        self._lock = threading.RLock()
+        self._postings = {}     # term -> {product_id: weighted term frequency}
+        self._doc_terms = {}    # product_id -> set of terms (for removal)
+        self._vocabulary = []   # sorted terms, for prefix lookup
+        self._built = False
+        self._built_at = None
+        self._generation = 0    # Bumped when the whole catalog is invalidated
+        self._dirty = set()
+
+        catalog.subscribe(self._on_invalidate)
+
+    # ---------------- Maintenance ----------------
+    def _on_invalidate(self, product_id):
+        with self._lock:
+            if product_id is None:
+                self._built = False
+                self._generation += 1
+            else:
+                self._dirty.add(product_id)
+
+    def _expired(self):
+        if self._catalog.mode == 'change_stream' or self._built_at is None:
+            return False
+        return time.monotonic() - self._built_at >= self._catalog.ttl
+
+    def _refresh(self):
+        with self._lock:
+            built = self._built and not self._expired()
+            generation = self._generation
+            dirty = list(self._dirty)
+            self._dirty.clear()
+
+        if not built:
+            started = time.monotonic()
+            products = self._catalog.all_active()
+            with self._lock:
+                self._postings.clear()
+                self._doc_terms.clear()
+                self._vocabulary = []
+                for product in products:
+                    self._add(product)
+                self._vocabulary.sort()
+                self._built = self._generation == generation
+                self._built_at = started
+        elif dirty:
+            products = self._catalog.get_many(dirty)
+            with self._lock:
+                for product_id in dirty:
+                    self._remove(product_id)
+                    product = products.get(product_id)
+                    if product and product.get('is_active', True):
+                        self._add(product, keep_sorted=True)
+
+    def _add(self, product, keep_sorted=False):
+        product_id = product['_id']
+        weights = {}
+        for field, weight in FIELD_WEIGHTS.items():
+            for term in tokenize(product.get(field)):
+                weights[term] = weights.get(term, 0) + weight
+
+        for term, weight in weights.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                if keep_sorted:
+                    bisect.insort(self._vocabulary, term)
+                else:
+                    self._vocabulary.append(term)
+            postings[product_id] = weight
+        self._doc_terms[product_id] = set(weights)
+
+    def _remove(self, product_id):
+        for term in self._doc_terms.pop(product_id, ()):
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(product_id, None)
+            if not postings:
+                del self._postings[term]
+                index = bisect.bisect_left(self._vocabulary, term)
+                if index < len(self._vocabulary) and self._vocabulary[index] == term:
+                    self._vocabulary.pop(index)
+
+    # ---------------- Queries ----------------
+    def _expand_prefix(self, prefix):
+        start = bisect.bisect_left(self._vocabulary, prefix)
+        terms = []
+        for term in self._vocabulary[start:start + MAX_PREFIX_EXPANSION]:
+            if not term.startswith(prefix):
+                break
+            terms.append(term)
+        return terms
+
+    def _term_postings(self, token, allow_prefix):
+        """[(postings, idf * match factor)] for every term a query token matches"""
+        total_docs = max(len(self._doc_terms), 1)
+        matches = []
+        terms = self._expand_prefix(token) if allow_prefix else [token]
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings:
+                idf = math.log(1 + total_docs / len(postings))
+                factor = 1.0 if term == token else PREFIX_WEIGHT
+                matches.append((postings, idf * factor))
+        return matches
+
+    @staticmethod
+    def _score(matches, product_id):
+        """Best score for one product across a token's matching terms"""
+        best = 0
+        for postings, boost in matches:
+            weight = postings.get(product_id)
+            if weight is not None and weight * boost > best:
+                best = weight * boost
+        return best
+
+    def search(self, query, limit=20, prefix=True):
+        """Rank active products matching every query term.
+
+        With `prefix` on, the last term also matches longer words so the
+        index can back search-as-you-type.
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+
+        self._refresh()
+        with self._lock:
+            token_matches = [
+                self._term_postings(token, prefix and i == len(tokens) - 1)
+                for i, token in enumerate(tokens)
+            ]
+            if not all(token_matches):
+                return []
+
+            # Intersect starting from the rarest token so later tokens only
+            # probe the surviving candidates
+            token_matches.sort(key=lambda matches: sum(len(p) for p, _ in matches))
+            combined = {}
+            for postings, boost in token_matches[0]:
+                for product_id, weight in postings.items():
+                    if weight * boost > combined.get(product_id, 0):
+                        combined[product_id] = weight * boost
+
+            for matches in token_matches[1:]:
+                if len(matches) == 1:
+                    postings, boost = matches[0]
+                    combined = {
+                        product_id: score + postings[product_id] * boost
+                        for product_id, score in combined.items()
+                        if product_id in postings
+                    }
+                else:
+                    narrowed = {}
+                    for product_id, score in combined.items():
+                        term_score = self._score(matches, product_id)
+                        if term_score:
+                            narrowed[product_id] = score + term_score
+                    combined = narrowed
+                if not combined:
+                    return []
+
+            ranked = heapq.nlargest(limit, combined.items(), key=lambda pair: pair[1])
+
+        products = self._catalog.get_many([product_id for product_id, _ in ranked])
+        results = []
+        for product_id, score in ranked:
+            product = products.get(product_id)
+            if product and product.get('is_active', True):
+                product['score'] = round(score, 4)
+                results.append(product)
+        return results
+
+    def suggest(self, prefix, limit=8):
+        """Autocomplete product names for a partially typed query"""
+        return [
+            {'_id': product['_id'], 'name': product.get('name', '')}
+            for product in self.search(prefix, limit=limit, prefix=True)
+        ]
@@ -0,0 +1,91 @@
+import dataclasses
+import decimal
+import json
+import uuid
+from datetime import date, datetime, timezone
+from bson import ObjectId
+from bson.decimal128 import Decimal128
+from flask.json.provider import JSONProvider
+
+try:
+    import orjson
+except ImportError:  # Falls back to the stdlib encoder with the same rules
+    orjson = None
+
+def default(o):
+    """Types Mongo documents carry that JSON doesn't know about"""
+    if isinstance(o, ObjectId):
+        return str(o)
+    if isinstance(o, Decimal128):
+        return str(o.to_decimal())
+    if isinstance(o, decimal.Decimal):
+        return str(o)
+    if isinstance(o, datetime):
+        # Mongo hands back naive datetimes that are UTC
+        if o.tzinfo is None:
+            o = o.replace(tzinfo=timezone.utc)
+        return o.isoformat()
+    if isinstance(o, date):
+        return o.isoformat()
+    if isinstance(o, uuid.UUID):
+        return str(o)
+    if isinstance(o, (set, frozenset)):
+        return list(o)
+    if dataclasses.is_dataclass(o) and not isinstance(o, type):
+        return dataclasses.asdict(o)
+    if hasattr(o, '__html__'):
+        return str(o.__html__())
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+if orjson is not None:
+    # Naive datetimes are UTC (as above); non-str keys such as status codes are allowed
+    _ORJSON_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS
+    _OrjsonError = orjson.JSONEncodeError
+
+class FastJSONProvider(JSONProvider):
+    """JSON provider that serializes with orjson when it's installed.
+
+    ObjectId, datetime, Decimal/Decimal128 and UUID are encoded directly,
+    so routes can return Mongo documents without converting `_id` and
+    dates first. Responses are built from the encoded bytes without an
+    intermediate str. Values orjson rejects (e.g. integers over 64 bits)
+    fall back to the stdlib encoder.
+    """
+
+    mimetype = 'application/json'
+
+    # Pretty-printed in debug mode like Flask's default provider; None = auto
+    compact = None
+
+    def dumps(self, obj, **kwargs):
+        return self._encode(obj, **kwargs).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
+
+    def dumpb(self, obj):
+        """Compact encoded bytes, for writers that frame JSON themselves (NDJSON)"""
+        return self._encode(obj, indent=False)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self._encode(obj), mimetype=self.mimetype)
+
+    def _encode(self, obj, indent=None, **kwargs):
+        if indent is None:
+            indent = not self.compact if self.compact is not None else self._app.debug
+        if orjson is not None and not kwargs:
+            options = _ORJSON_OPTIONS | orjson.OPT_INDENT_2 if indent else _ORJSON_OPTIONS
+            try:
+                return orjson.dumps(obj, default=default, option=options)
+            except _OrjsonError:
+                pass
+        kwargs.setdefault('default', default)
+        kwargs.setdefault('ensure_ascii', False)
+        if indent:
+            kwargs.setdefault('indent', 2)
+        else:
+            kwargs.setdefault('separators', (',', ':'))
+        return json.dumps(obj, **kwargs).encode('utf-8')
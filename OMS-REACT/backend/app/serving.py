@@ -0,0 +1,100 @@
+import collections
+import hashlib
+import mimetypes
+import os
+import stat
+import threading
+from urllib.parse import quote
+from flask import abort, current_app, request, send_file
+from werkzeug.security import safe_join
+from .log import get_logger
+
+logger = get_logger(__name__)
+
+# Who sends the bytes: 'off' (the worker streams them), 'x-accel' (nginx) or 'x-sendfile' (Apache/lighttpd)
+HANDOFF = os.getenv('STATIC_HANDOFF', 'off').lower()
+
+# nginx `internal` location prefix; files are handed off as <prefix><area>/<path>
+ACCEL_PREFIX = '/' + os.getenv('STATIC_ACCEL_PREFIX', '/_protected/').strip('/') + '/'
+
+# Files whose name doesn't change with their content are revalidated after this long
+STATIC_MAX_AGE = int(os.getenv('STATIC_MAX_AGE', 86400))
+
+# Content-hashed names never change content, so caches may keep them for a year
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Content digests of files without a hash in their name, keyed by path
+ETAG_CACHE_SIZE = 4096
+
+_etags = collections.OrderedDict()     # path -> (mtime_ns, size, etag)
+_etags_lock = threading.Lock()
+
+def content_etag(path, st):
+    """Strong ETag from the file's SHA-256, recomputed only when mtime/size change"""
+    with _etags_lock:
+        cached = _etags.get(path)
+        if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+            _etags.move_to_end(path)
+            return cached[2]
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(64 * 1024), b''):
+            digest.update(block)
+    etag = digest.hexdigest()[:32]
+
+    with _etags_lock:
+        _etags[path] = (st.st_mtime_ns, st.st_size, etag)
+        _etags.move_to_end(path)
+        while len(_etags) > ETAG_CACHE_SIZE:
+            _etags.popitem(last=False)
+    return etag
+
+def send_static(root, filename, area, etag=None, immutable=False, mimetype=None):
+    """Serve `filename` under `root` with a strong ETag, 304s and byte ranges.
+
+    `etag` is the content hash when the caller already knows it (blob keys);
+    otherwise it's computed once per file version. `immutable` marks names
+    that change whenever the content does. `mimetype` overrides the guess
+    from the file name (blob keys have no extension). `area` names the directory for
+    X-Accel-Redirect (STATIC_HANDOFF=x-accel), where nginx sends the bytes
+    after this worker has checked the path and answered any 304.
+    """
+    path = safe_join(root, filename)
+    if path is None:
+        abort(404)
+    try:
+        st = os.stat(path)
+    except OSError:
+        abort(404)
+    if not stat.S_ISREG(st.st_mode):
+        abort(404)
+
+    etag = etag or content_etag(path, st)
+    mimetype = mimetype or mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    cache_control = IMMUTABLE_CACHE_CONTROL if immutable else f'public, max-age={STATIC_MAX_AGE}'
+
+    if HANDOFF == 'x-accel':
+        response = current_app.response_class(mimetype=mimetype)
+        response.set_etag(etag)
+        response.last_modified = int(st.st_mtime)
+        response.make_conditional(request)
+        if response.status_code != 304:
+            # nginx serves the body, including Range requests, from its internal location
+            response.headers['X-Accel-Redirect'] = quote(f"{ACCEL_PREFIX}{area}/{filename}")
+    else:
+        # With USE_X_SENDFILE (STATIC_HANDOFF=x-sendfile) send_file only sets the header
+        response = send_file(path, mimetype=mimetype, etag=etag, conditional=True,
+                             last_modified=st.st_mtime)
+
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+def init_serving(app):
+    """Apply STATIC_HANDOFF to the app"""
+    if HANDOFF not in ('off', 'x-accel', 'x-sendfile'):
+        raise ValueError(f"Unknown STATIC_HANDOFF {HANDOFF!r} (expected off, x-accel or x-sendfile)")
+    if HANDOFF == 'x-sendfile':
+        app.config['USE_X_SENDFILE'] = True
+    if HANDOFF != 'off':
+        logger.info("Static files are handed off to the proxy via %s", HANDOFF)
@@ -0,0 +1,262 @@
+import collections
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pymongo import monitoring
+from .log import get_logger
+
+logger = get_logger(__name__)
+
+# Commands slower than this (ms) are logged and kept for /api/admin/slow-queries
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', 100))
+
+# Explain each new slow query shape once in the background and flag COLLSCANs
+EXPLAIN_ENABLED = os.getenv('SLOW_QUERY_EXPLAIN', 'false').lower() == 'true'
+
+# Most recent slow commands kept in memory (per worker)
+RECENT_LIMIT = 200
+
+# Cap on distinct shapes tracked, so ad hoc filters can't grow this forever
+SHAPE_LIMIT = 500
+
+# Where each command keeps the filter that decides which documents it reads
+_FILTER_FIELDS = {
+    'find': lambda cmd: cmd.get('filter'),
+    'count': lambda cmd: cmd.get('query'),
+    'distinct': lambda cmd: cmd.get('query'),
+    'findAndModify': lambda cmd: cmd.get('query'),
+    'delete': lambda cmd: (cmd.get('deletes') or [{}])[0].get('q'),
+    'update': lambda cmd: (cmd.get('updates') or [{}])[0].get('q'),
+    'aggregate': lambda cmd: _pipeline_match(cmd.get('pipeline') or []),
+}
+
+# Session/transport fields the driver adds; explain rejects some of them
+_DRIVER_FIELDS = {'lsid', 'txnNumber', 'autocommit', 'startTransaction', '$db',
+                  '$clusterTime', '$readPreference', 'writeConcern'}
+
+def _pipeline_match(pipeline):
+    if pipeline and '$match' in pipeline[0]:
+        return pipeline[0]['$match']
+    return None
+
+def query_shape(value):
+    """Filter with every literal replaced by '?', e.g. {'username': '?'}"""
+    if isinstance(value, dict):
+        return {key: query_shape(value[key]) for key in sorted(value)}
+    if isinstance(value, (list, tuple)):
+        # $or/$and branches keep their structure; value lists collapse to one '?'
+        if value and all(isinstance(item, dict) for item in value):
+            return [query_shape(item) for item in value]
+        return ['?']
+    return '?'
+
+def _current_route():
+    # Imported lazily so the listener also works outside Flask (CLI, threads)
+    from flask import has_request_context, request
+    if has_request_context():
+        rule = request.url_rule.rule if request.url_rule else request.path
+        return f"{request.method} {rule}"
+    return f"<{threading.current_thread().name}>"
+
+def _plan_stages(explain):
+    """Stage names and index names of the winning plan(s) in an explain result"""
+    stages, indexes = [], []
+
+    def walk(node, in_plan):
+        if isinstance(node, dict):
+            if in_plan and 'stage' in node:
+                stages.append(node['stage'])
+                if 'indexName' in node:
+                    indexes.append(node['indexName'])
+            for key, child in node.items():
+                walk(child, in_plan or key == 'winningPlan')
+        elif isinstance(node, list):
+            for child in node:
+                walk(child, in_plan)
+
+    walk(explain, False)
+    return stages, indexes
+
+class ShapeStats:
+    """Aggregates for one collection + command + filter shape"""
+
+    def __init__(self, collection, command, shape):
+        self.collection = collection
+        self.command = command
+        self.shape = shape
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.routes = collections.Counter()
+        self.last_at = None
+        self.plan = None          # filled in by explain, if enabled
+
+    def snapshot(self):
+        return {
+            'collection': self.collection,
+            'command': self.command,
+            'shape': self.shape,
+            'count': self.count,
+            'avgMs': round(self.total_ms / self.count, 2) if self.count else 0,
+            'maxMs': round(self.max_ms, 2),
+            'routes': dict(self.routes.most_common(5)),
+            'lastAt': self.last_at,
+            'plan': self.plan
+        }
+
+class SlowQueryLog(monitoring.CommandListener):
+    """Logs Mongo commands slower than SLOW_QUERY_MS with their filter shape.
+
+    `started` notes the collection, filter shape and calling route (it runs
+    on the thread that issued the command, so the request context is still
+    there); `succeeded`/`failed` only do work when the threshold is crossed.
+    With SLOW_QUERY_EXPLAIN=true each new slow shape is explained once on a
+    background thread and COLLSCAN plans are logged as warnings.
+    """
+
+    def __init__(self, app=None, threshold_ms=SLOW_QUERY_MS, explain=EXPLAIN_ENABLED):
+        self.threshold_ms = threshold_ms
+        self.explain = explain
+        self._app = None
+        self._lock = threading.Lock()
+        self._inflight = {}       # (connection_id, request_id) -> command details
+        self._shapes = {}         # (collection, command, shape) -> ShapeStats
+        self._recent = collections.deque(maxlen=RECENT_LIMIT)
+        self._executor = None
+        self._executor_pid = None
+        self.started_at = time.time()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self._app = app
+        app.extensions.setdefault('mongo_listeners', []).append(self)
+        app.slow_queries = self
+
+    # ---------------- Command events ----------------
+    def started(self, event):
+        extract = _FILTER_FIELDS.get(event.command_name)
+        if extract is None:
+            return
+        command = event.command
+        details = {
+            'collection': command.get(event.command_name),
+            'shape': query_shape(extract(command) or {}),
+            'route': _current_route(),
+            'database': event.database_name,
+            # Only kept for explain; the driver doesn't reuse the document
+            'command': command if self.explain else None
+        }
+        with self._lock:
+            self._inflight[(event.connection_id, event.request_id)] = details
+
+    def succeeded(self, event):
+        self._finish(event, ok=True)
+
+    def failed(self, event):
+        self._finish(event, ok=False)
+
+    def _finish(self, event, ok):
+        if event.command_name not in _FILTER_FIELDS:
+            return
+        with self._lock:
+            details = self._inflight.pop((event.connection_id, event.request_id), None)
+        duration_ms = event.duration_micros / 1000
+        if details is None or duration_ms < self.threshold_ms:
+            return
+        self._record(event.command_name, details, duration_ms, ok)
+
+    # ---------------- Recording ----------------
+    def _record(self, command_name, details, duration_ms, ok):
+        collection, shape, route = details['collection'], details['shape'], details['route']
+        key = (collection, command_name, repr(shape))
+        now = time.time()
+
+        with self._lock:
+            stats = self._shapes.get(key)
+            is_new = stats is None
+            if is_new and len(self._shapes) < SHAPE_LIMIT:
+                stats = self._shapes[key] = ShapeStats(collection, command_name, shape)
+            if stats is not None:
+                stats.count += 1
+                stats.total_ms += duration_ms
+                stats.max_ms = max(stats.max_ms, duration_ms)
+                stats.routes[route] += 1
+                stats.last_at = now
+            self._recent.append({
+                'at': now,
+                'collection': collection,
+                'command': command_name,
+                'shape': shape,
+                'route': route,
+                'durationMs': round(duration_ms, 2),
+                'ok': ok
+            })
+
+        logger.warning(
+            "Slow %s on %s took %.1fms (%s): %s",
+            command_name, collection, duration_ms, route, shape,
+            extra={'collection': collection, 'command': command_name,
+                   'durationMs': round(duration_ms, 2), 'route': route}
+        )
+
+        if is_new and stats is not None and self.explain and details['command'] is not None:
+            self._submit_explain(stats, details)
+
+    # ---------------- Explain ----------------
+    def _get_executor(self):
+        # One thread per process; explains are rare and must not compete with requests
+        if self._executor_pid != os.getpid():
+            with self._lock:
+                if self._executor_pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='slow-query-explain')
+                    self._executor_pid = os.getpid()
+        return self._executor
+
+    def _submit_explain(self, stats, details):
+        command = {key: value for key, value in details['command'].items() if key not in _DRIVER_FIELDS}
+        self._get_executor().submit(self._explain, stats, details['database'], command)
+
+    def _explain(self, stats, database, command):
+        client = getattr(self._app, 'mongo_client', None)
+        if client is None:
+            return
+        try:
+            result = client[database].command('explain', command, verbosity='queryPlanner')
+        except Exception as e:
+            logger.debug("Explain failed for %s on %s: %s", stats.command, stats.collection, e)
+            stats.plan = {'error': str(e)}
+            return
+
+        stages, indexes = _plan_stages(result)
+        collscan = 'COLLSCAN' in stages
+        stats.plan = {'stages': stages, 'indexes': indexes, 'collscan': collscan}
+        if collscan:
+            logger.warning(
+                "COLLSCAN: %s on %s with %s (%s)",
+                stats.command, stats.collection, stats.shape, ', '.join(stats.routes),
+                extra={'collection': stats.collection, 'command': stats.command}
+            )
+
+    # ---------------- Reporting ----------------
+    def snapshot(self):
+        """Slow shapes (slowest first) and the most recent slow commands"""
+        with self._lock:
+            shapes = [stats.snapshot() for stats in self._shapes.values()]
+            recent = list(self._recent)
+        shapes.sort(key=lambda entry: entry['maxMs'], reverse=True)
+        return {
+            'pid': os.getpid(),
+            'since': self.started_at,
+            'thresholdMs': self.threshold_ms,
+            'explain': self.explain,
+            'shapes': shapes,
+            'recent': recent[::-1]
+        }
+
+    def reset(self):
+        with self._lock:
+            self._shapes.clear()
+            self._recent.clear()
+            self.started_at = time.time()
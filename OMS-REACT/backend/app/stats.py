@@ -0,0 +1,291 @@
+import os
+import socket
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import DESCENDING, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from .log import get_logger
+
+logger = get_logger(__name__)
+
+# Rollup documents live in one small collection:
+#   orders              - order count, per-status counts/totals, completed revenue
+#   month:YYYY-MM       - completed revenue and orders per month
+#   day:YYYY-MM-DD      - completed revenue and orders per day
+#   customer:<userId>   - completed spend and order count per customer
+#   product:<name>      - units sold and revenue per product (all orders)
+#   built               - marker written only by rebuild_rollups
+ROLLUP_COLLECTION = 'stats_rollups'
+ORDERS_ROLLUP_ID = 'orders'
+
+# Incremental $inc upserts can create any other rollup document, so only
+# this one tells whether existing orders were ever counted
+ROLLUPS_BUILT_ID = 'built'
+
+# One rebuild at a time across every process: the lease lives outside the
+# collection that the rebuild replaces
+ROLLUP_LOCK_COLLECTION = 'stats_rollups_lock'
+ROLLUP_LOCK_ID = 'rebuild'
+
+# Seconds a rebuild may hold the lease before another process may take over
+ROLLUP_REBUILD_LEASE_SECONDS = int(os.getenv('ROLLUP_REBUILD_LEASE_SECONDS', 600))
+
+class RebuildInProgress(Exception):
+    """Another process holds the rebuild lease"""
+
+def _number(value):
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else 0
+
+def _status_key(status):
+    """Status values become field names, so keep them path-safe"""
+    return str(status or 'pending').replace('.', '_').replace('$', '_')
+
+def _order_date(order):
+    order_date = order.get('orderDate')
+    if isinstance(order_date, str):
+        try:
+            order_date = datetime.fromisoformat(order_date.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    return order_date if isinstance(order_date, datetime) else None
+
+def order_contributions(order):
+    """What one order adds to each rollup: {rollup _id: (static fields, {field: amount})}"""
+    contributions = {}
+    if not order:
+        return contributions
+
+    def add(rollup_id, static, **amounts):
+        _, totals = contributions.setdefault(rollup_id, (static, {}))
+        for field, amount in amounts.items():
+            totals[field] = totals.get(field, 0) + amount
+
+    status = _status_key(order.get('status'))
+    total = _number(order.get('total'))
+
+    add(ORDERS_ROLLUP_ID, {'kind': 'orders'}, orderCount=1, **{
+        f'statusCounts.{status}': 1,
+        f'statusTotals.{status}': total
+    })
+
+    if status == 'completed':
+        add(ORDERS_ROLLUP_ID, {'kind': 'orders'}, revenue=total)
+
+        order_date = _order_date(order)
+        if order_date:
+            month = order_date.strftime('%Y-%m')
+            day = order_date.strftime('%Y-%m-%d')
+            add(f'month:{month}', {'kind': 'month', 'period': month}, revenue=total, orders=1)
+            add(f'day:{day}', {'kind': 'day', 'period': day}, revenue=total, orders=1)
+
+        user_id = order.get('userId')
+        add(f'customer:{user_id}', {'kind': 'customer', 'userId': user_id}, totalSpent=total, orderCount=1)
+
+    for item in order.get('items', []):
+        name = item.get('name')
+        qty = _number(item.get('qty'))
+        price = _number(item.get('price'))
+        add(f'product:{name}', {'kind': 'product', 'name': name}, totalSold=qty, totalRevenue=qty * price)
+
+    return contributions
+
+def record_order_change(db, before, after):
+    """Move the rollups from `before` to `after` (either may be None) in one bulk write.
+
+    Called on order creation (None -> order), any update (old -> new) and
+    deletion (order -> None). Failures are logged, never raised, so a stats
+    hiccup can't fail a checkout; `rebuild_rollups` repairs any drift.
+    """
+    try:
+        old = order_contributions(before)
+        new = order_contributions(after)
+
+        ops = []
+        for rollup_id in set(old) | set(new):
+            static = (new.get(rollup_id) or old.get(rollup_id))[0]
+            amounts = dict(new.get(rollup_id, ({}, {}))[1])
+            for field, amount in old.get(rollup_id, ({}, {}))[1].items():
+                amounts[field] = amounts.get(field, 0) - amount
+
+            amounts = {field: amount for field, amount in amounts.items() if amount}
+            if amounts:
+                ops.append(UpdateOne(
+                    {'_id': rollup_id},
+                    {'$inc': amounts, '$setOnInsert': static},
+                    upsert=True
+                ))
+
+        if ops:
+            db[ROLLUP_COLLECTION].bulk_write(ops, ordered=False)
+    except Exception as e:
+        logger.warning("Failed to update dashboard rollups: %s", e)
+
+# ---------------- Rebuild ----------------
+ORDER_PROJECTION = {'status': 1, 'total': 1, 'orderDate': 1, 'userId': 1, 'items.name': 1,
+                    'items.qty': 1, 'items.price': 1}
+
+def _acquire_lease(db, owner):
+    now = datetime.utcnow()
+    try:
+        db[ROLLUP_LOCK_COLLECTION].find_one_and_update(
+            {'_id': ROLLUP_LOCK_ID, '$or': [{'lockedUntil': None}, {'lockedUntil': {'$lt': now}}]},
+            {'$set': {'owner': owner, 'lockedAt': now,
+                      'lockedUntil': now + timedelta(seconds=ROLLUP_REBUILD_LEASE_SECONDS)}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # The lock document exists and its lease is still running
+        return False
+    return True
+
+def _release_lease(db, owner):
+    db[ROLLUP_LOCK_COLLECTION].update_one(
+        {'_id': ROLLUP_LOCK_ID, 'owner': owner},
+        {'$set': {'lockedUntil': None}}
+    )
+
+def _newest_order_id(db):
+    newest = db.orders.find_one({}, {'_id': 1}, sort=[('_id', DESCENDING)])
+    return newest['_id'] if newest else None
+
+def _id_range(after, upto):
+    bounds = {}
+    if after is not None:
+        bounds['$gt'] = after
+    if upto is not None:
+        bounds['$lte'] = upto
+    return {'_id': bounds} if bounds else {}
+
+def rebuild_rollups(db):
+    """Recompute every rollup from the orders collection and swap it in.
+
+    Holds a lease in `stats_rollups_lock` so only one process rebuilds at a
+    time (raises RebuildInProgress otherwise), and builds into a staging
+    collection of its own. Orders placed while it scans are replayed onto
+    the new rollups after the swap. Status changes and deletions during
+    the scan are not: their $inc lands on the collection being replaced,
+    so run a manual rebuild while order writes are quiet.
+    """
+    owner = f"{socket.gethostname()}:{os.getpid()}:{ObjectId()}"
+    if not _acquire_lease(db, owner):
+        raise RebuildInProgress("Another process is rebuilding the dashboard rollups")
+    staging = db[f'{ROLLUP_COLLECTION}_rebuild_{ObjectId()}']
+    try:
+        return _rebuild(db, staging)
+    finally:
+        staging.drop()
+        _release_lease(db, owner)
+
+def _rebuild(db, staging):
+    from .indexes import INDEXES
+
+    rollups = {}
+    # ObjectIds grow with time, so anything above this was placed after the scan began
+    high_water = _newest_order_id(db)
+
+    order_count = 0
+    orders = db.orders.find(_id_range(None, high_water), ORDER_PROJECTION).batch_size(1000) if high_water else []
+    for order in orders:
+        order_count += 1
+        for rollup_id, (static, amounts) in order_contributions(order).items():
+            doc = rollups.setdefault(rollup_id, {'_id': rollup_id, **static})
+            for field, amount in amounts.items():
+                # Dotted fields (statusCounts.pending) become nested documents
+                target = doc
+                *parents, leaf = field.split('.')
+                for parent in parents:
+                    target = target.setdefault(parent, {})
+                target[leaf] = target.get(leaf, 0) + amount
+
+    rollups.setdefault(ORDERS_ROLLUP_ID, {
+        '_id': ORDERS_ROLLUP_ID, 'kind': 'orders', 'orderCount': 0, 'revenue': 0,
+        'statusCounts': {}, 'statusTotals': {}
+    })
+
+    rollups[ROLLUPS_BUILT_ID] = {
+        '_id': ROLLUPS_BUILT_ID, 'kind': 'meta', 'builtAt': datetime.utcnow(), 'orders': order_count
+    }
+
+    staging.insert_many(list(rollups.values()))
+    # rename() replaces the target's indexes with the staging collection's
+    for spec in INDEXES:
+        if spec['collection'] == ROLLUP_COLLECTION:
+            staging.create_index(spec['keys'], name=spec['name'], **spec['options'])
+
+    cutoff = _newest_order_id(db)
+    staging.rename(ROLLUP_COLLECTION, dropTarget=True)
+
+    # Orders placed during the scan had their $inc applied to the replaced collection
+    replayed = 0
+    if cutoff is not None and cutoff != high_water:
+        for order in db.orders.find(_id_range(high_water, cutoff), ORDER_PROJECTION):
+            record_order_change(db, None, order)
+            replayed += 1
+
+    logger.info("Rebuilt %s dashboard rollups from %s orders (%s placed during the rebuild replayed)",
+                len(rollups) - 1, order_count, replayed)
+    return len(rollups) - 1
+
+def ensure_rollups(db):
+    """Build the rollups from existing orders unless a rebuild has already run.
+
+    Called at startup so orders placed before the rollups existed are
+    counted before the first incremental update; returns True if it rebuilt.
+    Every worker calls it, and all but the one holding the lease skip it.
+    """
+    if db[ROLLUP_COLLECTION].find_one({'_id': ROLLUPS_BUILT_ID}, {'_id': 1}) is not None:
+        return False
+    try:
+        rebuild_rollups(db)
+    except RebuildInProgress:
+        logger.info("Dashboard rollups are being built by another process")
+        return False
+    return True
+
+# ---------------- Reads ----------------
+def get_order_rollup(db):
+    """The global order rollup; until the first build finishes it holds only incremental updates"""
+    return db[ROLLUP_COLLECTION].find_one({'_id': ORDERS_ROLLUP_ID}) or {}
+
+def status_breakdown(rollup):
+    """[{_id: status, count, totalValue}] like the old $group on status"""
+    counts = rollup.get('statusCounts', {})
+    totals = rollup.get('statusTotals', {})
+    return [
+        {'_id': status, 'count': count, 'totalValue': totals.get(status, 0)}
+        for status, count in counts.items()
+        if count
+    ]
+
+def monthly_revenue(db, limit=6, newest_first=True):
+    """[{_id: 'YYYY-MM', revenue, orders}] from the month rollups"""
+    cursor = db[ROLLUP_COLLECTION].find(
+        {'kind': 'month', 'orders': {'$gt': 0}},
+        {'period': 1, 'revenue': 1, 'orders': 1}
+    ).sort('period', -1 if newest_first else 1).limit(limit)
+    return [
+        {'_id': doc['period'], 'revenue': doc.get('revenue', 0), 'orders': doc.get('orders', 0)}
+        for doc in cursor
+    ]
+
+def top_customers(db, limit=5):
+    """[{_id: userId, totalSpent, orderCount}] by completed spend"""
+    cursor = db[ROLLUP_COLLECTION].find(
+        {'kind': 'customer', 'orderCount': {'$gt': 0}},
+        {'userId': 1, 'totalSpent': 1, 'orderCount': 1}
+    ).sort('totalSpent', -1).limit(limit)
+    return [
+        {'_id': doc.get('userId'), 'totalSpent': doc.get('totalSpent', 0), 'orderCount': doc.get('orderCount', 0)}
+        for doc in cursor
+    ]
+
+def top_products(db, limit=5):
+    """[{_id: product name, totalSold, totalRevenue}] by units sold"""
+    cursor = db[ROLLUP_COLLECTION].find(
+        {'kind': 'product', 'totalSold': {'$gt': 0}},
+        {'name': 1, 'totalSold': 1, 'totalRevenue': 1}
+    ).sort('totalSold', -1).limit(limit)
+    return [
+        {'_id': doc.get('name'), 'totalSold': doc.get('totalSold', 0), 'totalRevenue': doc.get('totalRevenue', 0)}
+        for doc in cursor
+    ]
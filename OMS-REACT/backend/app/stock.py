@@ -0,0 +1,178 @@
+from bson import ObjectId
+from datetime import datetime
+from pymongo import UpdateOne
+from pymongo.errors import OperationFailure
+from .log import get_logger
+
+logger = get_logger(__name__)
+
+# Topologies that support multi-document transactions
+TRANSACTION_TOPOLOGIES = {'ReplicaSetWithPrimary', 'Sharded', 'LoadBalanced'}
+
+class InsufficientStock(Exception):
+    """Raised when one or more order lines cannot be reserved"""
+    def __init__(self, lines):
+        self.lines = lines
+        failed = [line for line in lines if not line['ok']]
+        super().__init__(failed[0]['message'] if failed else 'Insufficient stock')
+
+def group_order_lines(items):
+    """Collapse order items into {product_id: qty}, summing repeated products"""
+    lines = {}
+    names = {}
+    for item in items:
+        product_id = str(item['id'])
+        lines[product_id] = lines.get(product_id, 0) + int(item['qty'])
+        names.setdefault(product_id, item.get('name', 'Unknown'))
+    return lines, names
+
+def _as_items(lines, names):
+    """Expand grouped lines back into order-item shaped dicts"""
+    return [{'id': pid, 'qty': qty, 'name': names[pid]} for pid, qty in lines.items()]
+
+def _line_result(product_id, name, requested, product):
+    """Build the per-line report entry for one product"""
+    if not product:
+        return {
+            'id': product_id,
+            'name': name,
+            'requested': requested,
+            'available': 0,
+            'found': False,
+            'ok': False,
+            'message': f"Product not found: {name}"
+        }
+
+    available = product.get('stock', 0)
+    ok = available >= requested
+    product_name = product.get('name', name)
+    return {
+        'id': product_id,
+        'name': product_name,
+        'requested': requested,
+        'available': available,
+        'found': True,
+        'ok': ok,
+        'message': (
+            f"Stock available: {available}" if ok
+            else f"Insufficient stock for {product_name}. Available: {available}, Requested: {requested}"
+        )
+    }
+
+def check_stock(db, items, catalog=None):
+    """Check every order line against current stock with one query (no deduction).
+
+    Pass the catalog cache to read through it; without it the check goes
+    straight to the database (used for authoritative failure reports).
+    """
+    lines, names = group_order_lines(items)
+    valid_ids = [pid for pid in lines if ObjectId.is_valid(pid)]
+    if catalog is not None:
+        products = catalog.get_many(valid_ids)
+    else:
+        products = {
+            str(product['_id']): product
+            for product in db.products.find(
+                {'_id': {'$in': [ObjectId(pid) for pid in valid_ids]}},
+                {'name': 1, 'stock': 1}
+            )
+        }
+    return [
+        _line_result(pid, names[pid], qty, products.get(pid))
+        for pid, qty in lines.items()
+    ]
+
+def supports_transactions(db):
+    """True when the connected deployment can run multi-document transactions"""
+    try:
+        return db.client.topology_description.topology_type_name in TRANSACTION_TOPOLOGIES
+    except Exception:
+        return False
+
+def _deduct_ops(lines, reservation_id=None):
+    """Conditional $inc per line - only matches while stock >= qty"""
+    ops = []
+    for product_id, qty in lines.items():
+        update = {
+            '$inc': {'stock': -qty},
+            '$set': {'updated_at': datetime.utcnow()}
+        }
+        if reservation_id:
+            update['$addToSet'] = {'stock_reservations': reservation_id}
+        ops.append(UpdateOne(
+            {'_id': ObjectId(product_id), 'stock': {'$gte': qty}},
+            update
+        ))
+    return ops
+
+def _reserve_in_transaction(db, lines, names):
+    """Deduct all lines inside a transaction, aborting if any line misses"""
+    def callback(session):
+        result = db.products.bulk_write(_deduct_ops(lines), ordered=False, session=session)
+        if result.matched_count != len(lines):
+            # Report against the pre-transaction snapshot once we abort
+            raise InsufficientStock([])
+        return result
+
+    with db.client.start_session() as session:
+        try:
+            session.with_transaction(callback)
+        except InsufficientStock:
+            raise InsufficientStock(check_stock(db, _as_items(lines, names)))
+
+def _reserve_with_compensation(db, lines, names):
+    """Deduct all lines in one bulk write and undo the applied ones on a miss"""
+    reservation_id = str(ObjectId())
+    result = db.products.bulk_write(_deduct_ops(lines, reservation_id), ordered=False)
+
+    if result.matched_count != len(lines):
+        # Only products tagged with this reservation were actually deducted
+        db.products.bulk_write([
+            UpdateOne(
+                {'_id': ObjectId(product_id), 'stock_reservations': reservation_id},
+                {'$inc': {'stock': qty}, '$pull': {'stock_reservations': reservation_id}}
+            )
+            for product_id, qty in lines.items()
+        ], ordered=False)
+        raise InsufficientStock(check_stock(db, _as_items(lines, names)))
+
+    db.products.update_many(
+        {'_id': {'$in': [ObjectId(pid) for pid in lines]}},
+        {'$pull': {'stock_reservations': reservation_id}}
+    )
+
+def reserve_stock(db, items):
+    """Atomically deduct stock for every order line, all-or-nothing.
+
+    Returns the per-line results on success and raises InsufficientStock
+    (carrying the per-line results) when any line cannot be fulfilled.
+    """
+    lines, names = group_order_lines(items)
+
+    invalid = [pid for pid in lines if not ObjectId.is_valid(pid)]
+    if invalid:
+        raise InsufficientStock(check_stock(db, items))
+
+    if supports_transactions(db):
+        try:
+            _reserve_in_transaction(db, lines, names)
+        except OperationFailure as e:
+            # e.g. transactions disabled on this cluster tier
+            if e.code not in (20, 263):
+                raise
+            logger.warning("Transactions unavailable (%s), using compensating writes", e)
+            _reserve_with_compensation(db, lines, names)
+    else:
+        _reserve_with_compensation(db, lines, names)
+
+    return [
+        {
+            'id': pid,
+            'name': names[pid],
+            'requested': qty,
+            'found': True,
+            'ok': True,
+            'message': 'Stock reserved'
+        }
+        for pid, qty in lines.items()
+    ]
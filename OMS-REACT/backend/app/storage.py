@@ -0,0 +1,389 @@
+import hashlib
+import io
+import mimetypes
+import os
+import tempfile
+from datetime import datetime, timedelta
+from flask import abort, current_app, redirect, request, send_file
+from .log import get_logger
+from .serving import IMMUTABLE_CACHE_CONTROL, send_static
+
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+except ImportError:  # Only the s3 backend needs it
+    boto3 = None
+
+logger = get_logger(__name__)
+
+# URL prefix blobs are served under (see init_storage)
+BLOB_URL_PREFIX = '/blobs/'
+
+# Read/hash/write granularity while streaming an upload to disk
+CHUNK_SIZE = 64 * 1024
+
+# Blobs that may have lost their last reference wait here for `flask gc-blobs`
+ORPHAN_COLLECTION = 'orphaned_blobs'
+
+# Hours a released blob is kept before gc-blobs may delete it
+BLOB_GC_GRACE_HOURS = int(os.getenv('BLOB_GC_GRACE_HOURS', 24))
+
+# Every field that can hold a /blobs/ URL; a blob still named in any of them is kept
+BLOB_REFERENCES = {
+    'orders': ('paymentProof', 'paymentProofThumbnail', 'receiptProof', 'items.image'),
+    'products': ('image', 'image_variants.webp.url', 'image_variants.fallback.url'),
+    'admin_notifications': ('url',),
+}
+
+class BlobTooLarge(ValueError):
+    """The stream was longer than the caller's max_bytes"""
+
+class StoredBlob:
+    """Where an upload ended up; `deduped` means the content was already stored"""
+
+    def __init__(self, key, url, size, digest, content_type, deduped):
+        self.key = key
+        self.url = url
+        self.size = size
+        self.digest = digest
+        self.content_type = content_type
+        self.deduped = deduped
+
+def blob_key(digest):
+    """Sharded key: ab/cd/abcd...ef (two levels keep directories small)"""
+    return f"{digest[:2]}/{digest[2:4]}/{digest}"
+
+def blob_extension(content_type, extension=''):
+    """One extension per content type (.jpeg -> .jpg), for the blob's URL"""
+    if content_type and content_type != 'application/octet-stream':
+        return mimetypes.guess_extension(content_type) or extension
+    return extension
+
+def _url_path(url):
+    if url and url.startswith(BLOB_URL_PREFIX):
+        return url[len(BLOB_URL_PREFIX):]
+    return None
+
+def key_from_url(url):
+    """Blob key for a /blobs/ URL (None for anything else).
+
+    The extension in the URL only carries the content type, so
+    /blobs/ab/cd/<sha>.jpg and /blobs/ab/cd/<sha>.jpeg are the same blob.
+    """
+    path = _url_path(url)
+    return os.path.splitext(path)[0] if path else None
+
+def _legacy_key(path):
+    # Blobs stored before keys were hash-only kept the extension in their key
+    key = os.path.splitext(path)[0]
+    return path if path != key else None
+
+# ---------------- Backends ----------------
+class StorageBackend:
+    """Where blob bytes live. Keys are relative paths made by blob_key()."""
+
+    # Directory for staging uploads; None = system temp dir
+    staging_dir = None
+
+    # Directory the blobs live in when they're on local disk (served by send_static)
+    root = None
+
+    def exists(self, key):
+        raise NotImplementedError
+
+    def put(self, key, path, content_type):
+        """Store the file at `path` (the backend may move or delete it)"""
+        raise NotImplementedError
+
+    def open(self, key):
+        """Readable binary file object for the blob"""
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def public_url(self, key):
+        """URL clients can fetch directly, else None (then /blobs/ serves it)"""
+        return None
+
+class LocalStorage(StorageBackend):
+    """Blobs as files under `root`, sharded by digest prefix"""
+
+    def __init__(self, root):
+        self.root = root
+        # Staged on the same filesystem so the final move is an atomic rename
+        self.staging_dir = os.path.join(root, '.staging')
+        os.makedirs(self.staging_dir, exist_ok=True)
+
+    def _path(self, key):
+        path = os.path.normpath(os.path.join(self.root, key))
+        if not path.startswith(os.path.normpath(self.root) + os.sep):
+            raise KeyError(key)
+        return path
+
+    def exists(self, key):
+        return os.path.exists(self._path(key))
+
+    def put(self, key, path, content_type):
+        target = self._path(key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(path, target)
+
+    def open(self, key):
+        return open(self._path(key), 'rb')
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+class S3Storage(StorageBackend):
+    """Blobs as objects in an S3-compatible bucket (AWS, MinIO, R2, moto...)"""
+
+    def __init__(self, bucket, prefix='', endpoint_url=None, public_base_url=None, client=None):
+        if client is None and boto3 is None:
+            raise RuntimeError("STORAGE_BACKEND=s3 needs boto3 (pip install boto3)")
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+        self.public_base_url = public_base_url.rstrip('/') if public_base_url else None
+        self.client = client or boto3.client('s3', endpoint_url=endpoint_url)
+
+    def _object(self, key):
+        return self.prefix + key
+
+    def exists(self, key):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._object(key))
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    def put(self, key, path, content_type):
+        try:
+            self.client.upload_file(path, self.bucket, self._object(key), ExtraArgs={
+                'ContentType': content_type,
+                'CacheControl': IMMUTABLE_CACHE_CONTROL
+            })
+        finally:
+            os.remove(path)
+
+    def open(self, key):
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._object(key))['Body']
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                raise FileNotFoundError(key)
+            raise
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._object(key))
+
+    def public_url(self, key):
+        if self.public_base_url:
+            return f"{self.public_base_url}/{self._object(key)}"
+        return None
+
+# ---------------- Blob store ----------------
+class BlobStore:
+    """Content-addressed uploads on top of a StorageBackend.
+
+    `save()` hashes the stream while writing it to a staging file, then
+    stores it under its SHA-256. Re-uploading identical bytes costs no
+    extra space and returns the same URL, and since a URL's content can
+    never change it's served with an immutable Cache-Control.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def save(self, stream, extension='', content_type=None, max_bytes=None):
+        """Store a binary stream; returns a StoredBlob"""
+        extension = extension.lower()
+        if extension and not extension.startswith('.'):
+            extension = '.' + extension
+        content_type = content_type or mimetypes.guess_type('x' + extension)[0] or 'application/octet-stream'
+
+        digest = hashlib.sha256()
+        size = 0
+        fd, staging_path = tempfile.mkstemp(dir=self.backend.staging_dir, suffix=extension)
+        try:
+            with os.fdopen(fd, 'wb') as staging:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if max_bytes is not None and size > max_bytes:
+                        raise BlobTooLarge(f'File is larger than {max_bytes // (1024 * 1024)}MB')
+                    digest.update(chunk)
+                    staging.write(chunk)
+
+            digest = digest.hexdigest()
+            key = blob_key(digest)
+            deduped = self.backend.exists(key)
+            if not deduped:
+                self.backend.put(key, staging_path, content_type)
+        finally:
+            if os.path.exists(staging_path):
+                os.remove(staging_path)
+
+        logger.debug("Stored blob %s (%d bytes%s)", key, size, ', deduplicated' if deduped else '')
+        return StoredBlob(key, self.url(key, blob_extension(content_type, extension)),
+                          size, digest, content_type, deduped)
+
+    def save_bytes(self, data, extension='', content_type=None):
+        return self.save(io.BytesIO(data), extension, content_type)
+
+    def url(self, key, extension=''):
+        """Public URL if the backend has one (it serves the stored content type),
+        else /blobs/<key><extension>, where the extension gives the content type"""
+        return self.backend.public_url(key) or BLOB_URL_PREFIX + key + extension
+
+    def open(self, key):
+        return self.backend.open(key)
+
+    def open_path(self, path):
+        """Open the blob behind a /blobs/ path, falling back to its pre-hash-only key"""
+        try:
+            return self.backend.open(os.path.splitext(path)[0])
+        except FileNotFoundError:
+            legacy = _legacy_key(path)
+            if legacy is None:
+                raise
+            return self.backend.open(legacy)
+
+    def open_url(self, url):
+        """Open a stored blob by its URL; None if the URL isn't a blob URL"""
+        path = _url_path(url)
+        return self.open_path(path) if path else None
+
+    def delete_url(self, url):
+        """Delete the blob behind a /blobs/ URL, under either key scheme"""
+        path = _url_path(url)
+        if path is None:
+            return
+        self.backend.delete(os.path.splitext(path)[0])
+        legacy = _legacy_key(path)
+        if legacy:
+            self.backend.delete(legacy)
+
+# ---------------- Orphans ----------------
+def mark_orphaned(db, url):
+    """Queue a blob that may no longer be referenced for the next gc-blobs sweep.
+
+    Blobs are shared by content, so an upload of the same bytes can start
+    using it again at any moment; nothing is deleted here.
+    """
+    key = key_from_url(url)
+    if key is None:
+        return
+    db[ORPHAN_COLLECTION].update_one(
+        {'_id': key},
+        {'$set': {'url': url, 'releasedAt': datetime.utcnow()}},
+        upsert=True
+    )
+
+def _values(doc, path):
+    """Every value at a dotted path, through nested lists"""
+    head, _, rest = path.partition('.')
+    values = doc.get(head) if isinstance(doc, dict) else None
+    for value in values if isinstance(values, list) else [values]:
+        if rest:
+            yield from _values(value, rest)
+        elif value is not None:
+            yield value
+
+def _referenced_keys(db):
+    keys = set()
+    for collection, fields in BLOB_REFERENCES.items():
+        projection = {field: 1 for field in fields}
+        for doc in db[collection].find({}, projection).batch_size(1000):
+            for field in fields:
+                for url in _values(doc, field):
+                    key = key_from_url(url) if isinstance(url, str) else None
+                    if key:
+                        keys.add(key)
+    return keys
+
+def sweep_orphaned_blobs(db, store, grace_hours=BLOB_GC_GRACE_HOURS):
+    """Delete queued blobs released over `grace_hours` ago that nothing references.
+
+    References are read in one pass over BLOB_REFERENCES after the
+    candidates are chosen, so a blob picked up again by a later upload is
+    kept. An upload that dedups onto a candidate during the pass itself can
+    still lose its blob; run the sweep at a quiet hour.
+    """
+    cutoff = datetime.utcnow() - timedelta(hours=grace_hours)
+    candidates = list(db[ORPHAN_COLLECTION].find({'releasedAt': {'$lt': cutoff}}))
+    report = {'deleted': 0, 'kept': 0}
+    if not candidates:
+        return report
+
+    referenced = _referenced_keys(db)
+    for candidate in candidates:
+        if candidate['_id'] in referenced:
+            report['kept'] += 1
+        else:
+            store.delete_url(candidate['url'])
+            report['deleted'] += 1
+        db[ORPHAN_COLLECTION].delete_one({'_id': candidate['_id'], 'releasedAt': candidate['releasedAt']})
+
+    logger.info("Blob sweep deleted %d orphaned blob(s), kept %d still in use", report['deleted'], report['kept'])
+    return report
+
+def _backend_from_env(app):
+    kind = os.getenv('STORAGE_BACKEND', 'local').lower()
+    if kind == 's3':
+        return S3Storage(
+            bucket=os.environ['STORAGE_S3_BUCKET'],
+            prefix=os.getenv('STORAGE_S3_PREFIX', 'blobs'),
+            endpoint_url=os.getenv('STORAGE_S3_ENDPOINT') or None,
+            public_base_url=os.getenv('STORAGE_PUBLIC_URL') or None
+        )
+    if kind != 'local':
+        raise ValueError(f"Unknown STORAGE_BACKEND {kind!r} (expected local or s3)")
+    return LocalStorage(os.getenv('STORAGE_ROOT') or os.path.join(app.root_path, 'static', 'blobs'))
+
+def init_storage(app, backend=None):
+    """Attach app.storage and the /blobs/<key> route"""
+    app.storage = BlobStore(backend or _backend_from_env(app))
+
+    @app.route(BLOB_URL_PREFIX + '<path:path>', methods=['GET'])
+    def serve_blob(path):
+        store = current_app.storage
+        backend = store.backend
+        key = os.path.splitext(path)[0]
+        public = backend.public_url(key)
+        if public:
+            if _legacy_key(path) and not backend.exists(key):
+                public = backend.public_url(path)
+            return redirect(public, code=301)
+
+        # The key is the content hash, which makes it a strong ETag; the URL's extension gives the type
+        digest = os.path.basename(key)
+        mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        if backend.root:
+            try:
+                stored = backend.exists(key)
+            except KeyError:
+                abort(404)
+            if not stored and _legacy_key(path):
+                key = path
+            return send_static(backend.root, key, 'blobs', etag=digest, immutable=True, mimetype=mimetype)
+
+        if request.if_none_match.contains(digest):
+            response = current_app.response_class(status=304)
+        else:
+            try:
+                source = store.open_path(path)
+            except (FileNotFoundError, KeyError):
+                abort(404)
+            response = send_file(source, mimetype=mimetype, etag=digest, conditional=True, last_modified=None)
+        response.set_etag(digest)
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        return response
+
+    return app.storage
@@ -0,0 +1,122 @@
+import binascii
+import re
+from .storage import BlobTooLarge
+
+# Magic numbers of the image types we accept, by stored extension
+IMAGE_SIGNATURES = {
+    '.jpg': (b'\xff\xd8\xff',),
+    '.png': (b'\x89PNG\r\n\x1a\n',),
+    '.gif': (b'GIF87a', b'GIF89a'),
+}
+
+# Base64 characters decoded per read(); a multiple of 4 so chunks decode independently
+BASE64_CHUNK_CHARS = 64 * 1024
+
+_WHITESPACE = re.compile(r'\s+')
+
+class UploadRejected(ValueError):
+    """An upload failed validation; `status` is the HTTP status to answer with"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+def sniff_image_extension(head):
+    """'.jpg', '.png', '.gif' or '.webp' from the first bytes, else None"""
+    for extension, signatures in IMAGE_SIGNATURES.items():
+        if head.startswith(signatures):
+            return extension
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return '.webp'
+    return None
+
+class Base64Reader:
+    """Binary read() over base64 text, decoding one chunk per call.
+
+    Reads slices of the original string, so the encoded data is never
+    copied whole and the decoded image never sits in memory at once.
+    Whitespace/newlines inside the data are skipped.
+    """
+
+    def __init__(self, text, start=0):
+        self._text = text
+        self._position = start
+        self._carry = ''          # Characters left over from a chunk that wasn't a multiple of 4
+
+    def read(self, size=-1):
+        chars = BASE64_CHUNK_CHARS if size is None or size < 0 else max(4, (size + 2) // 3 * 4)
+        while True:
+            chunk = self._text[self._position:self._position + chars]
+            self._position += len(chunk)
+            if not chunk:
+                break
+            if not chunk.isascii() or _WHITESPACE.search(chunk):
+                chunk = _WHITESPACE.sub('', chunk)
+            chunk = self._carry + chunk
+            usable = len(chunk) // 4 * 4
+            self._carry = chunk[usable:]
+            if usable:
+                return self._decode(chunk[:usable])
+
+        if self._carry:
+            # Unpadded tail; decode it with the padding it's missing
+            tail, self._carry = self._carry, ''
+            return self._decode(tail + '=' * (-len(tail) % 4))
+        return b''
+
+    @staticmethod
+    def _decode(chunk):
+        try:
+            return binascii.a2b_base64(chunk.encode('ascii'), strict_mode=True)
+        except (binascii.Error, UnicodeEncodeError) as e:
+            raise UploadRejected(f'Image is not valid base64: {e}')
+
+def decode_data_url(value, allowed_types=None):
+    """Base64Reader over a `data:image/...;base64,` URL or bare base64 string"""
+    if value.startswith('data:'):
+        comma = value.find(',', 0, 256)
+        header = value[5:comma] if comma != -1 else ''
+        if comma == -1 or not header.endswith(';base64'):
+            raise UploadRejected('Image must be a base64 data URL')
+        declared = header[:-len(';base64')].lower()
+        if allowed_types and declared not in allowed_types:
+            raise UploadRejected(f'Unsupported image type {declared or "(none)"}', 415)
+        return Base64Reader(value, comma + 1)
+    return Base64Reader(value)
+
+class _Replay:
+    """Stream that returns already-read `head` bytes before the rest"""
+
+    def __init__(self, head, stream):
+        self._head = head
+        self._stream = stream
+
+    def read(self, size=-1):
+        if self._head:
+            if size is None or size < 0 or size >= len(self._head):
+                head, self._head = self._head, b''
+                return head
+            head, self._head = self._head[:size], self._head[size:]
+            return head
+        return self._stream.read(size)
+
+def save_image_upload(storage, stream, max_bytes):
+    """Store an image stream after checking its magic number; returns a StoredBlob.
+
+    Nothing is written unless the first bytes are a JPEG, PNG, GIF or WebP
+    header, and the copy stops as soon as it passes `max_bytes`.
+    """
+    head = b''
+    while len(head) < 12:
+        chunk = stream.read(12 - len(head))
+        if not chunk:
+            break
+        head += chunk
+
+    extension = sniff_image_extension(head)
+    if extension is None:
+        raise UploadRejected('File is not a JPEG, PNG, GIF or WebP image', 415)
+    try:
+        return storage.save(_Replay(head, stream), extension, max_bytes=max_bytes)
+    except BlobTooLarge as e:
+        raise UploadRejected(str(e), 413)
@@ -0,0 +1,74 @@
+"""Throughput benchmark for a running backend.
+
+    python bench.py --url http://localhost:5000/api/products/ --concurrency 32 --duration 20
+
+Each client thread reuses one keep-alive connection, like a browser or a
+proxy in front of the app would. See README.md for how to compare servers.
+"""
+import argparse
+import http.client
+import threading
+import time
+from urllib.parse import urlsplit
+
+def client(url, deadline, latencies, errors):
+    parts = urlsplit(url)
+    path = parts.path + (f'?{parts.query}' if parts.query else '')
+    connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+    connection = connection_class(parts.hostname, parts.port, timeout=30)
+
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        try:
+            connection.request('GET', path)
+            response = connection.getresponse()
+            response.read()
+            if response.status != 200:
+                errors.append(response.status)
+                continue
+            latencies.append(time.perf_counter() - started)
+        except (OSError, http.client.HTTPException) as e:
+            errors.append(type(e).__name__)
+            connection.close()
+            connection = connection_class(parts.hostname, parts.port, timeout=30)
+    connection.close()
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://localhost:5000/api/products/')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--warmup', type=float, default=3)
+    args = parser.parse_args()
+
+    # Warm caches (catalog cache, connection pools) before measuring
+    warm_latencies, warm_errors = [], []
+    client(args.url, time.monotonic() + args.warmup, warm_latencies, warm_errors)
+
+    latencies, errors = [], []
+    deadline = time.monotonic() + args.duration
+    threads = [
+        threading.Thread(target=client, args=(args.url, deadline, latencies, errors))
+        for _ in range(args.concurrency)
+    ]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    latencies.sort()
+    print(f"URL          {args.url}")
+    print(f"Concurrency  {args.concurrency}")
+    print(f"Requests     {len(latencies)} ok, {len(errors)} failed in {elapsed:.1f}s")
+    print(f"Throughput   {len(latencies) / elapsed:.1f} req/s")
+    print(f"Latency      p50 {percentile(latencies, 0.50) * 1000:.1f} ms, "
+          f"p95 {percentile(latencies, 0.95) * 1000:.1f} ms, "
+          f"p99 {percentile(latencies, 0.99) * 1000:.1f} ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""Production server for the backend.
+
+    python serve.py
+
+Runs gunicorn with threaded workers where it's available (Linux/macOS) and
+falls back to waitress (Windows). run.py stays the development server.
+Settings come from the environment - see README.md.
+"""
+import multiprocessing
+import os
+import signal
+import tempfile
+
+from app import create_app, connect_db
+from app.concurrency import FANOUT_WORKERS
+from app.log import get_logger
+from app.metrics import METRICS, MULTIPROC_DIR_ENV, clear_multiproc_dir
+
+logger = get_logger('serve')
+
+HOST = os.getenv('HOST', '0.0.0.0')
+PORT = int(os.getenv('PORT', 5000))
+
+WORKERS = int(os.getenv('WEB_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+THREADS = int(os.getenv('WEB_THREADS', 4))
+KEEPALIVE = int(os.getenv('WEB_KEEPALIVE', 5))                 # Seconds an idle keep-alive connection stays open
+TIMEOUT = int(os.getenv('WEB_TIMEOUT', 30))                     # Kill a worker stuck on one request this long
+GRACEFUL_TIMEOUT = int(os.getenv('WEB_GRACEFUL_TIMEOUT', 30))   # Time to finish in-flight requests on SIGTERM
+MAX_REQUESTS = int(os.getenv('WEB_MAX_REQUESTS', 0))            # Recycle workers after N requests (0 = never)
+
+def worker_pool_size(threads=THREADS):
+    """Mongo connections one worker can use at once: a request per thread,
+    the dashboard fan-out pool and a little headroom for background work"""
+    return threads + FANOUT_WORKERS + 2
+
+# Every worker opens its own pool; size it to the worker rather than the
+# driver default of 100 so WORKERS x pool stays within the cluster's limit
+os.environ.setdefault('MONGO_MAX_POOL_SIZE', str(worker_pool_size()))
+
+# ---------------- gunicorn ----------------
+def _app_of(worker):
+    # With preload_app the Flask app is built once in the master
+    return worker.app.wsgi()
+
+def when_ready(server):
+    # The master only supervises, so drop the client it used while preloading
+    _app_of(server).mongo_client.close()
+
+def post_fork(server, worker):
+    connect_db(_app_of(worker))
+
+def worker_exit(server, worker):
+    METRICS.flush()
+    _app_of(worker).mongo_client.close()
+
+def run_gunicorn():
+    from gunicorn.app.base import BaseApplication
+
+    # Workers share /metrics totals through files in this directory
+    os.environ.setdefault(MULTIPROC_DIR_ENV, tempfile.mkdtemp(prefix='oms-metrics-'))
+    clear_multiproc_dir()
+
+    class OMSApplication(BaseApplication):
+        def __init__(self, options):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return create_app()
+
+    # gunicorn already treats SIGTERM as a graceful stop: workers stop
+    # accepting, finish in-flight requests within graceful_timeout, exit
+    OMSApplication({
+        'bind': f'{HOST}:{PORT}',
+        'workers': WORKERS,
+        'worker_class': 'gthread',
+        'threads': THREADS,
+        'keepalive': KEEPALIVE,
+        'timeout': TIMEOUT,
+        'graceful_timeout': GRACEFUL_TIMEOUT,
+        'max_requests': MAX_REQUESTS,
+        'max_requests_jitter': MAX_REQUESTS // 10,
+        'preload_app': True,
+        'when_ready': when_ready,
+        'post_fork': post_fork,
+        'worker_exit': worker_exit,
+        'accesslog': os.getenv('WEB_ACCESS_LOG') or None,
+    }).run()
+
+# ---------------- waitress ----------------
+def run_waitress():
+    from waitress import create_server
+
+    app = create_app()
+    if WORKERS > 1:
+        logger.info("waitress runs a single process; WEB_WORKERS is ignored, raise WEB_THREADS instead")
+
+    server = create_server(
+        app,
+        host=HOST,
+        port=PORT,
+        threads=THREADS,
+        channel_timeout=max(KEEPALIVE, TIMEOUT)
+    )
+
+    def stop(signum, frame):
+        # waitress finishes queued requests when its loop exits with SystemExit
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    logger.info("Serving on http://%s:%s with waitress (%s threads)", HOST, PORT, THREADS)
+    try:
+        server.run()
+    finally:
+        app.mongo_client.close()
+
+if __name__ == '__main__':
+    try:
+        import gunicorn  # noqa: F401  (not available on Windows)
+    except ImportError:
+        run_waitress()
+    else:
+        run_gunicorn()
@@ -0,0 +1,89 @@
+"""Idempotency-Key handling on mongomock (pip install -r requirements-dev.txt)"""
+from datetime import datetime, timedelta
+import pytest
+from flask import Flask, jsonify, request
+
+mongomock = pytest.importorskip('mongomock')
+
+from app.idempotency import IDEMPOTENCY_LOCK_SECONDS, idempotent
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.db = mongomock.MongoClient().oms_test
+    app.calls = []
+
+    @app.route('/orders', methods=['POST'])
+    @idempotent
+    def create_order():
+        body = request.get_json()
+        app.calls.append(body)
+        if body.get('fail'):
+            return jsonify({'success': False}), 503
+        return jsonify({'success': True, 'order': len(app.calls)}), 201
+
+    return app
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+def _post(client, body, key='key-1'):
+    return client.post('/orders', json=body, headers={'Idempotency-Key': key} if key else {})
+
+def test_retry_replays_the_stored_response(app, client):
+    first = _post(client, {'item': 1})
+    second = _post(client, {'item': 1})
+
+    assert first.status_code == second.status_code == 201
+    assert second.get_json() == first.get_json() == {'success': True, 'order': 1}
+    assert second.headers['Idempotent-Replayed'] == 'true'
+    assert 'Idempotent-Replayed' not in first.headers
+    assert len(app.calls) == 1
+
+def test_different_keys_run_separately(app, client):
+    _post(client, {'item': 1}, key='a')
+    _post(client, {'item': 1}, key='b')
+    assert len(app.calls) == 2
+
+def test_requests_without_a_key_are_unaffected(app, client):
+    _post(client, {'item': 1}, key=None)
+    _post(client, {'item': 1}, key=None)
+    assert len(app.calls) == 2
+    assert app.db.idempotency_keys.count_documents({}) == 0
+
+def test_key_reused_with_another_body_is_rejected(app, client):
+    _post(client, {'item': 1})
+    response = _post(client, {'item': 2})
+    assert response.status_code == 422
+    assert len(app.calls) == 1
+
+def test_invalid_key(client):
+    assert _post(client, {'item': 1}, key='x' * 256).status_code == 400
+
+def test_request_still_running_gets_409(app, client):
+    _post(client, {'item': 1})
+    app.db.idempotency_keys.update_one({}, {'$set': {'status': 'processing', 'lockedAt': datetime.utcnow()}})
+
+    response = _post(client, {'item': 1})
+    assert response.status_code == 409
+    assert response.headers['Retry-After'] == '1'
+    assert len(app.calls) == 1
+
+def test_stale_lock_is_taken_over(app, client):
+    _post(client, {'item': 1})
+    app.db.idempotency_keys.update_one({}, {'$set': {
+        'status': 'processing',
+        'lockedAt': datetime.utcnow() - timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS + 1)
+    }})
+
+    response = _post(client, {'item': 1})
+    assert response.status_code == 201
+    assert len(app.calls) == 2
+    assert app.db.idempotency_keys.find_one()['status'] == 'done'
+
+def test_server_errors_are_not_stored(app, client):
+    assert _post(client, {'fail': True}).status_code == 503
+    assert app.db.idempotency_keys.count_documents({}) == 0
+    assert _post(client, {'fail': True}).status_code == 503
+    assert len(app.calls) == 2
@@ -0,0 +1,148 @@
+"""JobQueue claim/retry/lease behaviour on mongomock (pip install -r requirements-dev.txt)"""
+from datetime import datetime, timedelta
+import pytest
+from flask import Flask
+
+mongomock = pytest.importorskip('mongomock')
+
+from app.jobs import JobQueue, PermanentJobError
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.db = mongomock.MongoClient().oms_test
+    return app
+
+def _queue(app, worker_id):
+    queue = JobQueue(app, workers=0)
+    queue.worker_id = worker_id
+    queue.calls = []
+
+    @queue.register('echo')
+    def echo(payload):
+        queue.calls.append(payload)
+        return {'echo': payload['n']}
+
+    @queue.register('broken')
+    def broken(payload):
+        raise RuntimeError('boom')
+
+    @queue.register('hopeless')
+    def hopeless(payload):
+        raise PermanentJobError('bad input')
+
+    return queue
+
+@pytest.fixture
+def queue(app):
+    return _queue(app, 'worker-a')
+
+def _job(queue, job_id):
+    return queue.collection.find_one({'_id': job_id})
+
+def _expire_lease(queue, job_id):
+    queue.collection.update_one({'_id': job_id}, {'$set': {'lockedUntil': datetime.utcnow() - timedelta(seconds=1)}})
+
+def test_claim_runs_due_jobs_once(queue):
+    job_id = queue.enqueue('echo', {'n': 1})
+
+    job = queue.claim()
+    assert job['_id'] == job_id
+    assert job['status'] == 'running'
+    assert job['attempts'] == 1
+    assert job['lockedBy'] == 'worker-a'
+    assert queue.claim() is None           # Leased, so nobody else gets it
+
+    assert queue.run(job)
+    done = _job(queue, job_id)
+    assert done['status'] == 'done'
+    assert done['result'] == {'echo': 1}
+    assert queue.calls == [{'n': 1}]
+
+def test_claim_waits_for_delayed_jobs(queue):
+    queue.enqueue('echo', {'n': 1}, delay=60)
+    assert queue.claim() is None
+
+def test_claim_ignores_jobs_without_a_handler(app, queue):
+    other = JobQueue(app, workers=0)
+    other.register('elsewhere')(lambda payload: None)
+    other.enqueue('elsewhere')
+    assert queue.claim() is None
+
+def test_enqueue_unknown_job_type(queue):
+    with pytest.raises(KeyError):
+        queue.enqueue('nope')
+
+def test_failure_is_retried_with_backoff_then_fails(queue):
+    job_id = queue.enqueue('broken', max_attempts=2)
+
+    assert not queue.run(queue.claim())
+    job = _job(queue, job_id)
+    assert job['status'] == 'queued'
+    assert job['lastError'] == 'RuntimeError: boom'
+    assert job['runAt'] > datetime.utcnow()
+    assert queue.claim() is None           # Not due until the backoff has passed
+
+    queue.collection.update_one({'_id': job_id}, {'$set': {'runAt': datetime.utcnow()}})
+    assert not queue.run(queue.claim())
+    job = _job(queue, job_id)
+    assert job['status'] == 'failed'
+    assert job['attempts'] == 2
+
+def test_permanent_error_fails_at_once(queue):
+    job_id = queue.enqueue('hopeless')
+    queue.run_pending()
+    job = _job(queue, job_id)
+    assert job['status'] == 'failed'
+    assert job['attempts'] == 1
+    assert job['lastError'] == 'PermanentJobError: bad input'
+
+def test_retry_requeues_a_failed_job(queue):
+    job_id = queue.enqueue('hopeless')
+    queue.run_pending()
+
+    assert queue.retry(job_id)['status'] == 'queued'
+    job = _job(queue, job_id)
+    assert job['attempts'] == 0
+    assert queue.claim()['_id'] == job_id
+
+def test_retry_only_touches_failed_jobs(queue):
+    job_id = queue.enqueue('echo', {'n': 1})
+    assert queue.retry(job_id) is None
+
+def test_expired_lease_is_taken_over(app, queue):
+    job_id = queue.enqueue('echo', {'n': 1})
+    stale = queue.claim()
+    _expire_lease(queue, job_id)
+
+    other = _queue(app, 'worker-b')
+    job = other.claim()
+    assert job['_id'] == job_id
+    assert job['lockedBy'] == 'worker-b'
+    assert job['attempts'] == 2
+
+    # The original worker finishing late doesn't overwrite the new owner's record
+    assert queue.run(stale)
+    assert _job(queue, job_id)['status'] == 'running'
+    assert other.run(job)
+    assert _job(queue, job_id)['status'] == 'done'
+
+def test_expired_lease_on_the_last_attempt_fails_the_job(queue):
+    job_id = queue.enqueue('echo', {'n': 1}, max_attempts=1)
+    queue.claim()
+    _expire_lease(queue, job_id)
+
+    assert queue.claim() is None
+    assert queue.run_pending() == 0
+    job = _job(queue, job_id)
+    assert job['status'] == 'failed'
+    assert job['lockedUntil'] is None
+    assert 'Lease expired' in job['lastError']
+    assert queue.calls == []
+
+def test_counts(queue):
+    queue.enqueue('echo', {'n': 1})
+    queue.enqueue('echo', {'n': 2})
+    queue.enqueue('hopeless')
+    queue.run_pending(limit=1)
+    assert queue.counts() == {'echo': {'done': 1, 'queued': 1}, 'hopeless': {'queued': 1}}
@@ -0,0 +1,102 @@
+"""S3Storage against moto's in-process S3 stand-in (pip install -r requirements-dev.txt)"""
+import hashlib
+import io
+import pytest
+from flask import Flask
+
+pytest.importorskip('boto3')
+moto = pytest.importorskip('moto')
+
+from app.storage import BlobStore, S3Storage, init_storage
+
+BUCKET = 'oms-test'
+JPEG = b'\xff\xd8\xff\xe0' + b'not really a photo' * 64
+DIGEST = hashlib.sha256(JPEG).hexdigest()
+KEY = f"{DIGEST[:2]}/{DIGEST[2:4]}/{DIGEST}"
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    with moto.mock_aws():
+        import boto3
+        s3 = boto3.client('s3')
+        s3.create_bucket(Bucket=BUCKET)
+        yield s3
+
+@pytest.fixture
+def store(client):
+    return BlobStore(S3Storage(BUCKET, prefix='blobs', client=client))
+
+def _objects(client):
+    return [obj['Key'] for obj in client.list_objects_v2(Bucket=BUCKET).get('Contents', [])]
+
+def test_key_is_the_content_hash_and_type_is_metadata(store, client):
+    stored = store.save_bytes(JPEG, '.jpg')
+
+    assert stored.key == KEY
+    assert stored.digest == DIGEST
+    assert stored.url == f"/blobs/{KEY}.jpg"
+    assert not stored.deduped
+    head = client.head_object(Bucket=BUCKET, Key=f"blobs/{KEY}")
+    assert head['ContentType'] == 'image/jpeg'
+    assert 'immutable' in head['CacheControl']
+
+def test_same_bytes_under_another_extension_are_stored_once(store, client):
+    first = store.save_bytes(JPEG, '.jpg')
+    second = store.save(io.BytesIO(JPEG), 'JPEG')
+
+    assert second.deduped
+    assert second.key == first.key
+    assert second.url == first.url
+    assert _objects(client) == [f"blobs/{KEY}"]
+
+def test_open_and_delete_by_url(store, client):
+    url = store.save_bytes(JPEG, '.jpeg').url
+
+    assert store.open_url(url).read() == JPEG
+    assert store.open_url('/static/uploads/old.jpg') is None
+    store.delete_url(url)
+    assert _objects(client) == []
+    with pytest.raises(FileNotFoundError):
+        store.open_url(url)
+
+def test_blobs_stored_with_the_extension_in_the_key_still_open(store, client):
+    client.put_object(Bucket=BUCKET, Key=f"blobs/{KEY}.jpg", Body=JPEG, ContentType='image/jpeg')
+
+    assert store.open_url(f"/blobs/{KEY}.jpg").read() == JPEG
+    store.delete_url(f"/blobs/{KEY}.jpg")
+    assert _objects(client) == []
+
+def test_blobs_route_serves_from_the_bucket(store):
+    app = Flask(__name__)
+    init_storage(app, store.backend)
+    url = app.storage.save_bytes(JPEG, '.jpg').url
+    http = app.test_client()
+
+    response = http.get(url)
+    assert response.status_code == 200
+    assert response.data == JPEG
+    assert response.mimetype == 'image/jpeg'
+    assert response.get_etag() == (DIGEST, False)
+    assert 'immutable' in response.headers['Cache-Control']
+
+    assert http.get(url, headers={'If-None-Match': f'"{DIGEST}"'}).status_code == 304
+    assert http.get(f"/blobs/{'0' * 2}/{'0' * 2}/{'0' * 64}.jpg").status_code == 404
+
+def test_public_url_redirects_and_skips_the_extension(client):
+    store = BlobStore(S3Storage(BUCKET, prefix='blobs', public_base_url='https://cdn.example.com/', client=client))
+    app = Flask(__name__)
+    init_storage(app, store.backend)
+
+    stored = store.save_bytes(JPEG, '.jpg')
+    assert stored.url == f"https://cdn.example.com/blobs/{KEY}"
+
+    response = app.test_client().get(f"/blobs/{KEY}.jpg")
+    assert response.status_code == 301
+    assert response.headers['Location'] == stored.url
+
+    client.put_object(Bucket=BUCKET, Key=f"blobs/{'ab' * 32}.png", Body=b'old', ContentType='image/png')
+    response = app.test_client().get(f"/blobs/{'ab' * 32}.png")
+    assert response.headers['Location'] == f"https://cdn.example.com/blobs/{'ab' * 32}.png"